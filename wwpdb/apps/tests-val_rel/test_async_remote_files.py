@@ -0,0 +1,63 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils import AsyncRemoteFiles as async_module
+from wwpdb.apps.val_rel.utils.AsyncRemoteFiles import AsyncRemoteFiles
+
+
+class FakeRemote(object):
+    def __init__(self):
+        self.lock = threading.Lock()
+        self.active = 0
+        self.max_active = 0
+
+    def get_url(self, url, output_path=None):
+        with self.lock:
+            self.active += 1
+            self.max_active = max(self.max_active, self.active)
+        time.sleep(0.05)
+        with self.lock:
+            self.active -= 1
+        if url == "missing":
+            raise IOError("missing")
+        return url.upper()
+
+
+class AsyncRemoteFilesTests(unittest.TestCase):
+    def test_in_flight(self):
+        remote = FakeRemote()
+        engine = AsyncRemoteFiles(remote=remote, max_in_flight=3)
+        self.addCleanup(engine.close)
+        urls = ["a", "b", "missing", "c", "d", "e"]
+        results = engine.gather([engine.get_url(url=url) for url in urls])
+
+        # Results in order with failures in their place
+        self.assertEqual(results[:2] + results[3:], ["A", "B", "C", "D", "E"])
+        self.assertIsInstance(results[2], IOError)
+        self.assertEqual(remote.max_active, 3)
+
+    def test_run(self):
+        engine = AsyncRemoteFiles(remote=FakeRemote(), max_in_flight=2)
+        self.addCleanup(engine.close)
+        self.assertEqual(engine.gather([engine.run(sum, [1, 2]), engine.run(len, "abc")]), [3, 3])
+
+    def test_remote_on_first_use(self):
+        """No http fetcher is made when only run() is used"""
+        with mock.patch.object(async_module, "GetRemoteFilesHttp") as http_class, \
+                mock.patch.object(async_module, "ValConfig") as config:
+            config.return_value.val_rel_protocol = "http"
+            config.return_value.remote_max_in_flight = 2
+            engine = AsyncRemoteFiles()
+            self.addCleanup(engine.close)
+            engine.gather([engine.run(len, "abc")])
+            http_class.assert_not_called()
+
+            http_class.return_value.get_url.side_effect = str.upper
+            self.assertEqual(engine.gather([engine.get_url("a"), engine.get_url("b")]), ["A", "B"])
+            http_class.assert_called_once()
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,6 +1,14 @@
 
 import unittest
 import os
+import shutil
+import tempfile
+import threading
+import time
+import uuid
+from unittest import mock
+
+from oslo_concurrency import lockutils
 
 from wwpdb.apps.val_rel.utils.PersistFileCache import PersistFileCache
 
@@ -82,6 +90,175 @@ class PersisFileCacheTests(unittest.TestCase):
 
         self.assertTrue(abs(os.path.getmtime(outfile) - os.path.getmtime(lfile)) < 1)
 
+    def testSymlinkNameInUse(self):
+        """Symlink is made under another name if the one chosen is taken"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        pfc = PersistFileCache(cache_dir)
+        cfname = "/tmp/somewhere/file.txt"
+        self.assertTrue(pfc.add_file(__file__, cfname))
+        outdir = os.path.join(cache_dir, "out")
+        os.makedirs(outdir)
+        taken = os.path.join(outdir, ".tmp_" + "0" * 32)
+        open(taken, "w").close()
+        names = [uuid.UUID(int=0), uuid.UUID(int=1)]
+        with mock.patch.object(uuid, "uuid4", side_effect=names):
+            self.assertTrue(pfc.get_file(cfname, os.path.join(outdir, "file.txt"), symlink=True))
+        self.assertTrue(os.path.islink(os.path.join(outdir, "file.txt")))
+        self.assertEqual(sorted(os.listdir(outdir)), [".tmp_" + "0" * 32, "file.txt"])
+
+    def testStoreDeduplicatesAndEvicts(self):
+        """Test identical contents stored once and least recently used evicted"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        pfc = PersistFileCache(cache_dir)
+        src = os.path.join(cache_dir, "src.txt")
+        with open(src, "w") as fout:
+            fout.write("x" * 1000)
+
+        self.assertTrue(pfc.add_file(src, "/pub/a/file1.txt", source="http://server/pub/a/file1.txt", etag='"e1"'))
+        self.assertTrue(pfc.add_file(src, "/pub/b/file2.txt"))
+        with open(src, "w") as fout:
+            fout.write("y" * 1000)
+        self.assertTrue(pfc.add_file(src, "/pub/c/file3.txt", move=True))
+        self.assertFalse(os.path.exists(src))
+
+        meta = pfc.get_metadata("/pub/a/file1.txt")
+        self.assertEqual(meta["etag"], '"e1"')
+        self.assertEqual(meta["size"], 1000)
+        self.assertEqual(meta["sha256"], pfc.get_metadata("/pub/b/file2.txt")["sha256"])
+
+        # file3 used most recently - file1 and file2 share an object, so both go to get below 1500 bytes
+        now = time.time() + 10 * PersistFileCache.EVICT_GRACE
+        os.utime(os.path.join(cache_dir, ".store", "index", "pub", "c", "file3.txt.json"), (now, now))
+        self.assertEqual(pfc.evict(max_bytes=1500, now=now), 1000)
+        self.assertFalse(pfc.exists("/pub/a/file1.txt"))
+        self.assertFalse(pfc.exists("/pub/b/file2.txt"))
+        self.assertTrue(pfc.exists("/pub/c/file3.txt"))
+
+        # Nothing evicted within grace period of last use
+        self.assertEqual(pfc.evict(max_bytes=0, ttl=0), 0)
+        self.assertTrue(pfc.exists("/pub/c/file3.txt"))
+
+    def testLegacyImport(self):
+        """Test files cached in previous layout are still found"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        legacy = os.path.join(cache_dir, "pub", "old", "file.txt")
+        os.makedirs(os.path.dirname(legacy))
+        shutil.copy2(__file__, legacy)
+
+        pfc = PersistFileCache(cache_dir)
+        self.assertTrue(pfc.exists("/pub/old/file.txt"))
+        self.assertFalse(os.path.exists(legacy))
+        outfile = os.path.join(cache_dir, "out.txt")
+        self.assertTrue(pfc.get_file("/pub/old/file.txt", outfile))
+        self.assertTrue(abs(os.path.getmtime(outfile) - os.path.getmtime(__file__)) < 1)
+
+    def testValidation(self):
+        """Test recording revalidation and removal of a file no longer on the server"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        pfc = PersistFileCache(cache_dir)
+        cfname = "/pub/v/file.txt"
+        self.assertTrue(pfc.add_file(__file__, cfname, etag='"v1"', last_modified="Mon, 01 Jan 2024 00:00:00 GMT"))
+        self.assertNotIn("validated", pfc.get_metadata(cfname))
+        self.assertTrue(pfc.mark_validated(cfname))
+        meta = pfc.get_metadata(cfname)
+        self.assertAlmostEqual(meta["validated"], time.time(), delta=60)
+        self.assertEqual(meta["last_modified"], "Mon, 01 Jan 2024 00:00:00 GMT")
+
+        self.assertTrue(pfc.remove_file(cfname))
+        self.assertFalse(pfc.exists(cfname))
+        self.assertFalse(pfc.remove_file(cfname))
+
+    def testNegativeCacheExpiry(self):
+        """Test negative cache entries expire and are cleared when the file is added"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        pfc = PersistFileCache(cache_dir, ttl=3600, negative_ttl=3600)
+        cfname = "/pub/n/file.txt"
+        self.assertTrue(pfc.add_negative_cache(cfname))
+        self.assertTrue(pfc.is_negative_cache(cfname))
+        self.assertFalse(pfc.is_negative_cache("/pub/n/file.txt.gz"))
+
+        self.assertTrue(pfc.add_file(__file__, cfname))
+        self.assertFalse(pfc.is_negative_cache(cfname))
+        self.assertEqual(pfc.cache_file_status(cfname), True)
+
+        cfname2 = "/pub/n/other.txt"
+        self.assertTrue(pfc.add_negative_cache(cfname2))
+        marker = os.path.join(cache_dir, ".store", "missing", "pub", "n", "other.txt")
+        old = time.time() - 7200
+        os.utime(marker, (old, old))
+        self.assertFalse(pfc.is_negative_cache(cfname2))
+        self.assertEqual(pfc.cache_file_status(cfname2), None)
+        pfc.evict()
+        self.assertFalse(os.path.exists(marker))
+
+    def testConcurrentAccess(self):
+        """Test readers and writers of the same and other paths in parallel"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        errors = []
+
+        def worker(n):
+            pfc = PersistFileCache(cache_dir)
+            src = os.path.join(cache_dir, "src%d.txt" % n)
+            for i in range(20):
+                with open(src, "w") as fout:
+                    fout.write(str(i % 3) * 5000)
+                if not pfc.add_file(src, "/pub/shared/file.txt") or not pfc.add_file(src, "/pub/own/file%d.txt" % n):
+                    errors.append("add %d" % n)
+                out = os.path.join(cache_dir, "out%d.txt" % n)
+                if not pfc.get_file("/pub/shared/file.txt", out):
+                    errors.append("get %d" % n)
+                with open(out) as fin:
+                    data = fin.read()
+                if len(data) != 5000 or len(set(data)) != 1:
+                    errors.append("partial read %d" % n)
+
+        threads = [threading.Thread(target=worker, args=(n,)) for n in range(4)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(errors, [])
+
+    def testEvictWhileAdding(self):
+        """Test eviction by another consumer does not remove a file being staged, though its mtime is old"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir)
+        pfc = PersistFileCache(cache_dir, ttl=60)
+        src = os.path.join(cache_dir, "a.bin")
+        with open(src, "wb") as fout:
+            fout.write(b"x" * 1000)
+        # As set by the ftp fetcher from MDTM
+        old = time.time() - 10 * 365 * 24 * 60 * 60
+        os.utime(src, (old, old))
+        # Another process's staging files, left when it died, are removed
+        dead = os.path.join(cache_dir, ".store", "tmp", "%s_%d" % (os.uname()[1], 2 ** 22 + 1))
+        os.makedirs(dead)
+        open(os.path.join(dead, "tmpabc"), "w").close()
+
+        real_lock = lockutils.lock
+        evicted = []
+
+        def lock(name, *args, **kwargs):
+            if name.startswith("key-") and not evicted:
+                # Staged, not yet stored
+                evicted.append(PersistFileCache(cache_dir, ttl=60).evict(now=time.time() + 10 * PersistFileCache.EVICT_GRACE))
+            return real_lock(name, *args, **kwargs)
+
+        with mock.patch.object(lockutils, "lock", side_effect=lock):
+            self.assertTrue(pfc.add_file(src, "/pub/a.bin", move=True))
+        self.assertEqual(len(evicted), 1)
+        self.assertFalse(os.path.exists(dead))
+        out = os.path.join(cache_dir, "out.bin")
+        self.assertTrue(pfc.get_file("/pub/a.bin", out))
+        with open(out, "rb") as fin:
+            self.assertEqual(fin.read(), b"x" * 1000)
+
 
 if __name__ == "__main__":  # pragma: no cover
     unittest.main()
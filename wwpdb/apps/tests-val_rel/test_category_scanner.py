@@ -0,0 +1,75 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from wwpdb.apps.val_rel.utils.CategoryScanner import read_categories, scan_categories
+
+# In archive order - the revision history follows the coordinates
+MMCIF = """data_1ABC
+#
+_entry.id   1ABC
+#
+_exptl.entry_id          1ABC
+_exptl.method            'X-RAY DIFFRACTION'
+#
+_struct.entry_id 1ABC
+_struct.title
+;A title with
+_exptl.method 'NOT A DATA NAME'
+;
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+ATOM 1
+ATOM 2
+#
+loop_
+_pdbx_audit_revision_history.ordinal
+    _pdbx_audit_revision_history.revision_date
+1 2017-03-01
+2 2017-03-08
+#
+loop_
+_pdbx_audit_revision_category.ordinal
+_pdbx_audit_revision_category.category
+1 citation
+#
+data_2ABC
+_exptl.method 'ELECTRON MICROSCOPY'
+"""
+
+
+class CategoryScannerTests(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.mmCIF_file = os.path.join(self.test_dir, 'test.cif.gz')
+        with gzip.open(self.mmCIF_file, 'wt') as outFile:
+            outFile.write(MMCIF)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_read_categories(self):
+        c = read_categories(self.mmCIF_file, ['exptl', 'pdbx_audit_revision_history', 'pdbx_audit_revision_category'])
+        self.assertEqual(c.getName(), '1ABC')
+        self.assertEqual(sorted(c.getObjNameList()), ['exptl', 'pdbx_audit_revision_category', 'pdbx_audit_revision_history'])
+        self.assertEqual(c.getObj('exptl').getValue('method', 0), 'X-RAY DIFFRACTION')
+        self.assertEqual(c.getObj('pdbx_audit_revision_history').getRowCount(), 2)
+
+    def test_stop(self):
+        # Stops once all are found - the second data block is never reached
+        text = scan_categories(self.mmCIF_file, ['exptl'])
+        self.assertNotIn('ELECTRON', text)
+        self.assertNotIn('_struct.title', text)
+
+        # Nothing after atom_site
+        c = read_categories(self.mmCIF_file, ['struct', 'pdbx_audit_revision_category'], stop_at=['atom_site'])
+        self.assertEqual(c.getObjNameList(), ['struct'])
+        self.assertIn('NOT A DATA NAME', c.getObj('struct').getValue('title', 0))
+
+
+if __name__ == '__main__':
+    unittest.main()
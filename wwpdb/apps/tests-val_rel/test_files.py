@@ -3,7 +3,7 @@ import shutil
 import tempfile
 import unittest
 
-from wwpdb.apps.val_rel.utils.Files import get_gzip_name, gzip_file, copy_file
+from wwpdb.apps.val_rel.utils.Files import get_gzip_name, gzip_file, copy_file, materialize_file
 
 
 def touch(fname, times=None):
@@ -74,6 +74,39 @@ class TestFiles(unittest.TestCase):
         ret = copy_file(input_file, self.output_dir)
         self.assertFalse(ret)
 
+    def test_materialize_file(self):
+        input_file = os.path.join(self.output_dir, 'in.file')
+        with open(input_file, 'w') as fout:
+            fout.write('data')
+        os.chmod(input_file, 0o640)
+
+        linked = os.path.join(self.output_dir, 'linked.file')
+        self.assertEqual(materialize_file(input_file, linked, link=True), 'link')
+        self.assertTrue(os.path.samefile(input_file, linked))
+
+        # Existing file replaced by an independent file
+        ret = materialize_file(input_file, linked)
+        self.assertIn(ret, ('reflink', 'copy'))
+        self.assertFalse(os.path.samefile(input_file, linked))
+        with open(linked) as fin:
+            self.assertEqual(fin.read(), 'data')
+        self.assertEqual(os.stat(linked).st_mode & 0o777, 0o640)
+
+        # Not a hard link to the file behind a symlink, such as a cache store object
+        symlinked = os.path.join(self.output_dir, 'symlinked.file')
+        os.symlink(input_file, symlinked)
+        ret = materialize_file(symlinked, linked, link=True)
+        self.assertIn(ret, ('reflink', 'copy'))
+        self.assertFalse(os.path.samefile(input_file, linked))
+        self.assertFalse(os.path.islink(linked))
+        with open(linked) as fin:
+            self.assertEqual(fin.read(), 'data')
+
+        moved = os.path.join(self.output_dir, 'moved.file')
+        self.assertEqual(materialize_file(linked, moved, move=True), 'rename')
+        self.assertFalse(os.path.exists(linked))
+        self.assertTrue(os.path.exists(moved))
+
 
 if __name__ == '__main__':
     unittest.main()
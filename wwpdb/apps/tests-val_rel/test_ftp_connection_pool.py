@@ -0,0 +1,87 @@
+import ftplib
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils import FtpConnectionPool as pool_module
+
+
+class FakeFTP(object):
+    connected = 0
+
+    def __init__(self, server):
+        FakeFTP.connected += 1
+        self.server = server
+        self.commands = []
+        self.alive = True
+
+    def login(self):
+        self.commands.append("USER")
+
+    def voidcmd(self, cmd):
+        self.commands.append(cmd)
+
+    def pwd(self):
+        return "/home"
+
+    def cwd(self, directory):
+        if not self.alive:
+            raise ftplib.error_temp("421 Timeout")
+        self.commands.append("CWD %s" % directory)
+
+    def quit(self):
+        self.commands.append("QUIT")
+
+    def close(self):
+        pass
+
+
+class FtpConnectionPoolTests(unittest.TestCase):
+    def setUp(self):
+        FakeFTP.connected = 0
+        patcher = mock.patch.object(pool_module.ftplib, "FTP", FakeFTP)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_reuse(self):
+        pool = pool_module.FtpConnectionPool("ftp.example.org", maxsize=1)
+        ftp = pool.acquire()
+        ftp.cwd("/pub/pdb")
+        pool.release(ftp)
+
+        # Handed out again, back in the login directory
+        self.assertIs(pool.acquire(), ftp)
+        self.assertEqual(ftp.commands[-1], "CWD /home")
+        self.assertEqual(FakeFTP.connected, 1)
+
+        # Only maxsize idle connections kept
+        other = pool.acquire()
+        pool.release(ftp)
+        pool.release(other)
+        self.assertEqual(other.commands[-1], "QUIT")
+        self.assertEqual(FakeFTP.connected, 2)
+
+    def test_stale_connection(self):
+        pool = pool_module.FtpConnectionPool("ftp.example.org")
+        ftp = pool.acquire()
+        pool.release(ftp)
+        ftp.alive = False
+        self.assertIsNot(pool.acquire(), ftp)
+        self.assertEqual(FakeFTP.connected, 2)
+
+    def test_shared_by_server(self):
+        self.assertIs(pool_module.get_connection_pool("ftp.example.org"), pool_module.get_connection_pool("ftp.example.org"))
+        self.assertIsNot(pool_module.get_connection_pool("ftp.example.org"), pool_module.get_connection_pool("ftp.example.com"))
+
+    def test_close_connection_pools(self):
+        """Run at exit - idle connections are closed"""
+        with mock.patch.dict(pool_module._pools, clear=True):
+            pool = pool_module.get_connection_pool("ftp.example.org")
+            ftp = pool.acquire()
+            pool.release(ftp)
+            pool_module.close_connection_pools()
+            self.assertEqual(ftp.commands[-1], "QUIT")
+            self.assertIsNot(pool.acquire(), ftp)
+
+
+if __name__ == '__main__':
+    unittest.main()
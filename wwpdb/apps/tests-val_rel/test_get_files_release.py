@@ -0,0 +1,135 @@
+import threading
+import time
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils import getFilesRelease as gfr_module
+
+
+class FakeOneDep(object):
+    """Only the model is available locally"""
+
+    def __init__(self, *args, **kwargs):
+        pass
+
+    def get_model(self):
+        return "/onedep/1abc.cif", True
+
+    def __getattr__(self, name):
+        return lambda: (None, False)
+
+
+class FakeRemote(object):
+    instances = []
+    lock = threading.Lock()
+    active = 0
+    max_active = 0
+    nmr_data = None
+    fetched = []
+
+    def __init__(self, *args, **kwargs):
+        self.closed = False
+        self.removed = False
+        FakeRemote.instances.append(self)
+
+    def __fetch(self, name):
+        with FakeRemote.lock:
+            FakeRemote.fetched.append(name)
+            FakeRemote.active += 1
+            FakeRemote.max_active = max(FakeRemote.max_active, FakeRemote.active)
+        time.sleep(0.2)
+        with FakeRemote.lock:
+            FakeRemote.active -= 1
+        return name
+
+    def get_sf(self):
+        return self.__fetch("/remote/1abc-sf.cif")
+
+    def get_nmr_data(self):
+        return self.__fetch(FakeRemote.nmr_data)
+
+    def get_cs(self):
+        return self.__fetch("/remote/1abc_cs.str")
+
+    def get_emdb_volume(self):
+        return self.__fetch("/remote/emd_1234.map.gz")
+
+    def has_emdb_volume(self):
+        return True
+
+    def close_connection(self):
+        self.closed = True
+
+    def remove_local_temp_files(self):
+        self.removed = True
+
+
+class GetFilesReleasePrefetchTests(unittest.TestCase):
+    def setUp(self):
+        FakeRemote.instances = []
+        FakeRemote.max_active = 0
+        FakeRemote.nmr_data = None
+        FakeRemote.fetched = []
+        patches = [mock.patch.object(gfr_module, "getFilesReleaseOneDep", FakeOneDep)]
+        for name in ["getFilesReleaseHttpPDB", "getFilesReleaseHttpEMDB", "getFilesReleaseFtpPDB", "getFilesReleaseFtpEMDB"]:
+            patches.append(mock.patch.object(gfr_module, name, FakeRemote))
+        for p in patches:
+            p.start()
+            self.addCleanup(p.stop)
+
+    def test_prefetch(self):
+        rel_files = gfr_module.getFilesRelease(pdb_id="1abc", siteID="TEST")
+        start = time.time()
+        manifest = rel_files.prefetch(["model", "sf", "nmr_data", "cs"])
+        elapsed = time.time() - start
+        self.assertEqual(manifest, {"model": "/onedep/1abc.cif",
+                                    "sf": "/remote/1abc-sf.cif",
+                                    "nmr_data": None,
+                                    "cs": "/remote/1abc_cs.str"})
+        self.assertTrue(rel_files.model_current)
+        self.assertFalse(rel_files.is_sf_current())
+        # Remote transfers overlap rather than running one after another
+        self.assertGreater(FakeRemote.max_active, 1)
+        self.assertLess(elapsed, 0.55)
+
+        rel_files.remove_local_temp_files()
+        self.assertTrue(all(remote.removed for remote in FakeRemote.instances))
+
+    def test_prefetch_nmr_data(self):
+        """Chemical shifts are in the NMR data file - cs is not retrieved as well"""
+        FakeRemote.nmr_data = "/remote/1abc_nmr-data.nef"
+        rel_files = gfr_module.getFilesRelease(pdb_id="1abc", siteID="TEST")
+        manifest = rel_files.prefetch(["model", "sf", "nmr_data", "cs"])
+        self.assertEqual(manifest["nmr_data"], "/remote/1abc_nmr-data.nef")
+        self.assertIsNone(manifest["cs"])
+        self.assertEqual(sorted(FakeRemote.fetched), ["/remote/1abc-sf.cif", "/remote/1abc_nmr-data.nef"])
+        self.assertFalse(rel_files.is_cs_current())
+
+    def test_prefetch_failure(self):
+        """A failed transfer is raised once the others finish, rather than reported as not in the archive"""
+        rel_files = gfr_module.getFilesRelease(pdb_id="1abc", siteID="TEST")
+        with mock.patch.object(FakeRemote, "get_sf", side_effect=IOError("connection refused")):
+            with self.assertRaises(IOError):
+                rel_files.prefetch(["model", "sf", "cs"])
+        self.assertEqual(FakeRemote.fetched, ["/remote/1abc_cs.str"])
+        self.assertEqual(FakeRemote.active, 0)
+
+        # Nor when retrieving chemical shifts without NMR data
+        with mock.patch.object(FakeRemote, "get_cs", side_effect=IOError("connection refused")):
+            with self.assertRaises(IOError):
+                rel_files.prefetch(["sf", "nmr_data", "cs"])
+
+    def test_has_emdb_volume(self):
+        """The volume is looked for without retrieving it"""
+        rel_files = gfr_module.getFilesRelease(emdb_id="EMD-1234", siteID="TEST")
+        self.assertTrue(rel_files.has_emdb_volume())
+        self.assertEqual(FakeRemote.fetched, [])
+
+    def test_unknown_kind(self):
+        rel_files = gfr_module.getFilesRelease(pdb_id="1abc", siteID="TEST")
+        with self.assertRaises(ValueError):
+            rel_files.prefetch(["bogus"])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -1,9 +1,14 @@
+import ftplib
 import glob
+import io
 import os
 import shutil
+import socket
 import tempfile
 import unittest
+from unittest import mock
 
+from wwpdb.apps.val_rel.utils import FtpConnectionPool as pool_module
 from wwpdb.apps.val_rel.utils.getRemoteFilesFTP import GetRemoteFiles
 
 
@@ -58,5 +63,211 @@ class TestRemoteFiles(unittest.TestCase):
         self.assertEqual(len(ret), 0)
 
 
+class FakeDataConnection(io.BytesIO):
+    def recv(self, size):
+        return self.read(size)
+
+
+class StalledDataConnection(FakeDataConnection):
+    def recv(self, size):
+        raise socket.timeout("timed out")
+
+
+class FakeFTP(object):
+    """Server with pub/x/a.bin and directory tree emd-1 - records control commands sent"""
+    connections = []
+    stall_retr = False
+    files = ["a.bin", "emd_1.xml", "emd_1.map.gz"]
+    listings = {"emd-1": b"type=cdir;modify=20200101000000; .\r\n"
+                         b"type=dir;modify=20200101000000; map\r\n"
+                         b"type=file;size=3;modify=20200101000000; emd_1.xml\r\n",
+                "emd-1/map": b"type=file;size=3;modify=20200101000000; emd_1.map.gz\r\n"}
+
+    def __init__(self, server):
+        self.encoding = "utf-8"
+        self.commands = []
+        self.alive = True
+        FakeFTP.connections.append(self)
+
+    def __send(self, cmd):
+        if not self.alive:
+            raise EOFError()
+        self.commands.append(cmd)
+
+    def login(self):
+        self.__send("USER anonymous")
+
+    def voidcmd(self, cmd):
+        self.__send(cmd)
+        if cmd.startswith("MDTM"):
+            if cmd[5:] not in FakeFTP.files:
+                raise ftplib.error_perm("550 No such file")
+            return "213 20200101000000"
+        return "200 OK"
+
+    def pwd(self):
+        self.__send("PWD")
+        return "/"
+
+    def cwd(self, directory):
+        self.__send("CWD %s" % directory)
+
+    def size(self, remote_file):
+        self.__send("SIZE %s" % remote_file)
+        if remote_file != "a.bin":
+            raise ftplib.error_perm("550 No such file")
+        return 3
+
+    def transfercmd(self, cmd, rest=None):
+        self.__send(cmd)
+        if cmd.startswith("MLSD "):
+            return FakeDataConnection(FakeFTP.listings[cmd[5:]])
+        if cmd == "NLST":
+            return FakeDataConnection(b"a.bin\r\n")
+        if os.path.basename(cmd[5:]) not in FakeFTP.files:
+            raise ftplib.error_perm("550 No such file")
+        if FakeFTP.stall_retr:
+            return StalledDataConnection()
+        return FakeDataConnection(b"abc")
+
+    def retrlines(self, cmd, callback=None):
+        # As ftplib - the connection is left in ASCII mode
+        self.__send("TYPE A")
+        with self.transfercmd(cmd) as conn:
+            for line in conn.read().decode(self.encoding).splitlines():
+                (callback or print)(line)
+        return self.voidresp()
+
+    def nlst(self):
+        files = []
+        self.retrlines("NLST", files.append)
+        return files
+
+    def voidresp(self):
+        return "226 Transfer complete"
+
+    def quit(self):
+        self.__send("QUIT")
+
+    def close(self):
+        pass
+
+
+class ControlCommandTests(unittest.TestCase):
+    """Counts control channel round trips per file retrieved"""
+
+    def setUp(self):
+        self.output_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.output_dir, ignore_errors=True)
+        FakeFTP.connections = []
+        FakeFTP.stall_retr = False
+        for patcher in [mock.patch.object(pool_module.ftplib, "FTP", FakeFTP),
+                        mock.patch.dict(pool_module._pools, clear=True)]:
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    def test_commands_per_file(self):
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        ftp = FakeFTP.connections[0]
+        del ftp.commands[:]
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x", filename="a.bin"), ["a.bin"])
+        with open(os.path.join(self.output_dir, "a.bin"), "rb") as fin:
+            self.assertEqual(fin.read(), b"abc")
+        # No NOOP or TYPE ahead of each command
+        self.assertEqual(ftp.commands, ["CWD pub/x", "MDTM a.bin", "RETR a.bin"])
+
+        # Next entry reuses the connection - a missing file is reported by MDTM
+        gfr.disconnect()
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        del ftp.commands[:]
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x", filename="b.bin"), [])
+        self.assertEqual(len(FakeFTP.connections), 1)
+        self.assertEqual(ftp.commands, ["CWD pub/x", "MDTM b.bin"])
+        gfr.disconnect()
+
+    def test_cached_file_commands(self):
+        """A cached file costs no command within the revalidate interval, and MDTM and SIZE after it"""
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        for interval, expected in [(3600, ["MDTM a.bin", "RETR a.bin"]),
+                                   (3600, []),
+                                   (0, ["MDTM a.bin", "SIZE a.bin"])]:
+            gfr = GetRemoteFiles(server="ftp.example.org", cache=cache_dir, site_id="TEST")
+            gfr._GetRemoteFiles__revalidate_interval = interval
+            ftp = FakeFTP.connections[0]
+            del ftp.commands[:]
+            output_dir = tempfile.mkdtemp(dir=self.output_dir)
+            self.assertEqual(gfr.get_url(output_path=output_dir, directory="pub/x", filename="a.bin"), ["a.bin"])
+            gfr.disconnect()
+            with open(os.path.join(output_dir, "a.bin"), "rb") as fin:
+                self.assertEqual(fin.read(), b"abc")
+            # At most two round trips per file after the CWD
+            self.assertEqual(ftp.commands, ["CWD pub/x"] + expected)
+
+    def test_listing_binary_mode(self):
+        """Listing the directory does not leave the pooled connection in ASCII mode for the RETR"""
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        ftp = FakeFTP.connections[0]
+        del ftp.commands[:]
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x"), ["a.bin"])
+        self.assertEqual(ftp.commands, ["CWD pub/x", "NLST", "SIZE a.bin", "MDTM a.bin", "RETR a.bin"])
+        gfr.disconnect()
+
+    def test_failed_transfer(self):
+        """A connection left part way through a transfer is closed, not returned to the pool"""
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        FakeFTP.stall_retr = True
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x", filename="a.bin"), [])
+        gfr.disconnect()
+        self.assertTrue(all(ftp.commands[-1] == "QUIT" for ftp in FakeFTP.connections))
+        self.assertEqual(pool_module._pools["ftp.example.org"]._FtpConnectionPool__idle, [])
+
+        # Next entry gets a working connection
+        FakeFTP.stall_retr = False
+        connections = len(FakeFTP.connections)
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x", filename="a.bin"), ["a.bin"])
+        self.assertEqual(len(FakeFTP.connections), connections + 1)
+        gfr.disconnect()
+
+    def test_lost_connection(self):
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        # Closed by the server while idle - replaced when the next command fails
+        FakeFTP.connections[0].alive = False
+        self.assertEqual(gfr.get_url(output_path=self.output_dir, directory="pub/x", filename="a.bin"), ["a.bin"])
+        self.assertEqual(len(FakeFTP.connections), 2)
+        self.assertEqual(FakeFTP.connections[1].commands[-3:], ["CWD pub/x", "MDTM a.bin", "RETR a.bin"])
+
+    def test_mirror_directory(self):
+        cache_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, cache_dir, ignore_errors=True)
+        for _ in range(2):
+            output_dir = tempfile.mkdtemp(dir=self.output_dir)
+            gfr = GetRemoteFiles(server="ftp.example.org", cache=cache_dir, site_id="TEST")
+            for ftp in FakeFTP.connections:
+                del ftp.commands[:]
+            self.assertTrue(gfr.mirror_directory("emd-1", output_dir, workers=2))
+            gfr.disconnect()
+            for path in ["emd_1.xml", "map/emd_1.map.gz"]:
+                with open(os.path.join(output_dir, path), "rb") as fin:
+                    self.assertEqual(fin.read(), b"abc")
+            commands = sorted(cmd for ftp in FakeFTP.connections for cmd in ftp.commands if cmd.split()[0] in ("MLSD", "RETR", "SIZE", "MDTM"))
+            if _ == 0:
+                # One listing per directory gives size and time - no SIZE or MDTM per file
+                self.assertEqual(commands, ["MLSD emd-1", "MLSD emd-1/map", "RETR ./emd-1/emd_1.xml", "RETR ./emd-1/map/emd_1.map.gz"])
+            else:
+                # Unchanged files come from the cache
+                self.assertEqual(commands, ["MLSD emd-1", "MLSD emd-1/map"])
+
+    def test_mirror_selected_files(self):
+        gfr = GetRemoteFiles(server="ftp.example.org", site_id="TEST")
+        self.assertTrue(gfr.mirror_directory("emd-1", self.output_dir, patterns=["map/*.map*", "masks/*_msk_*.map*"]))
+        gfr.disconnect()
+        self.assertTrue(os.path.exists(os.path.join(self.output_dir, "map", "emd_1.map.gz")))
+        self.assertFalse(os.path.exists(os.path.join(self.output_dir, "emd_1.xml")))
+        commands = sorted(cmd for ftp in FakeFTP.connections for cmd in ftp.commands if cmd.split()[0] in ("MLSD", "RETR"))
+        self.assertEqual(commands, ["MLSD emd-1", "MLSD emd-1/map", "RETR ./emd-1/map/emd_1.map.gz"])
+
+
 if __name__ == '__main__':
     unittest.main()
@@ -85,6 +85,8 @@ class TestHTTP(unittest.TestCase):
             # verify readable zip file
             with gzip.open(outfile, 'rb') as r:
                 self.assertTrue(r.read(1), "error reading gzip file %s" % os.path.basename(file))
+        # partial downloads are renamed into place - nothing else left behind
+        self.assertEqual(sorted(os.listdir(self.temp_dir)), sorted(os.path.basename(file) for file in self.zipfiles))
         # test 404 error
         for file in self.non_existent_files:
             self.assertFalse(grf.httpRequest(file, os.path.join(self.temp_dir, os.path.basename(file))),
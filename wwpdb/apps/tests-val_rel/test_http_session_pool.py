@@ -0,0 +1,42 @@
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils.http_protocol import HttpSessionPool as pool_module
+from wwpdb.apps.val_rel.utils.http_protocol.HttpSessionPool import get_session_pool, HttpSessionPool
+
+
+class HttpSessionPoolTests(unittest.TestCase):
+
+    def test_session_reused(self):
+        pool = HttpSessionPool(pool_connections=2, pool_maxsize=4)
+        s1 = pool.get_session()
+        s2 = pool.get_session()
+        self.assertIs(s1, s2)
+        adapter = s1.get_adapter('https://files.wwpdb.org')
+        self.assertEqual(adapter._pool_maxsize, 4)
+        pool.close()
+        s3 = pool.get_session()
+        self.assertIsNot(s1, s3)
+        pool.close()
+
+    def test_pool_shared_for_settings(self):
+        p1 = get_session_pool(pool_connections=3, pool_maxsize=3, status_force_list=[503])
+        p2 = get_session_pool(pool_connections=3, pool_maxsize=3, status_force_list=[503])
+        p3 = get_session_pool(pool_connections=3, pool_maxsize=5, status_force_list=[503])
+        self.assertIs(p1, p2)
+        self.assertIsNot(p1, p3)
+
+    def test_close_session_pools(self):
+        """Run at exit - pooled sessions are closed"""
+        with mock.patch.dict(pool_module._pools, clear=True):
+            pool = get_session_pool(pool_connections=2, pool_maxsize=2)
+            session = pool.get_session()
+            with mock.patch.object(session, "close") as close:
+                pool_module.close_session_pools()
+            close.assert_called_once()
+            self.assertIsNot(pool.get_session(), session)
+            pool.close()
+
+
+if __name__ == '__main__':
+    unittest.main()
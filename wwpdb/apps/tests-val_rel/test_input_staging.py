@@ -0,0 +1,61 @@
+import gzip
+import os
+import shutil
+import tempfile
+import unittest
+
+from wwpdb.apps.val_rel.utils.InputStaging import InputStaging
+
+
+class InputStagingTests(unittest.TestCase):
+    def setUp(self):
+        self.input_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.input_dir)
+        self.staging = InputStaging(os.path.join(self.input_dir, "staging"))
+        self.addCleanup(self.staging.remove)
+
+    def __write(self, fname, data):
+        with gzip.open(fname, "wt") as fout:
+            fout.write(data)
+        os.utime(fname, (1600000000, 1600000000))
+
+    def test_stage_once(self):
+        model = os.path.join(self.input_dir, "1abc.cif.gz")
+        self.__write(model, "data_1ABC\n")
+
+        staged = self.staging.stage(model)
+        self.assertTrue(staged.endswith("1abc.cif"))
+        with open(staged) as fin:
+            self.assertEqual(fin.read(), "data_1ABC\n")
+        self.assertEqual(os.path.getmtime(staged), 1600000000)
+        self.assertEqual(self.staging.get_manifest()[os.path.realpath(model)]["staged"], staged)
+
+        # Not decompressed again
+        inode = os.stat(staged).st_ino
+        self.assertEqual(InputStaging(self.staging.staging_dir).stage(model), staged)
+        self.assertEqual(os.stat(staged).st_ino, inode)
+
+        # Changed source staged again
+        self.__write(model, "data_1ABC\nloop_\n")
+        os.utime(model, (1600000100, 1600000100))
+        with open(self.staging.stage(model)) as fin:
+            self.assertEqual(fin.read(), "data_1ABC\nloop_\n")
+
+    def test_uncompressed(self):
+        cs = os.path.join(self.input_dir, "1abc_cs.str")
+        with open(cs, "w") as fout:
+            fout.write("data_cs\n")
+        self.assertEqual(self.staging.stage(cs), cs)
+        self.assertIsNone(self.staging.stage(None))
+        missing = os.path.join(self.input_dir, "missing.cif.gz")
+        self.assertEqual(self.staging.stage(missing), missing)
+
+    def test_corrupt(self):
+        bad = os.path.join(self.input_dir, "bad.cif.gz")
+        with open(bad, "w") as fout:
+            fout.write("not compressed")
+        self.assertEqual(self.staging.stage(bad), bad)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -2,7 +2,7 @@ import unittest
 import os
 import tempfile
 import shutil
-from wwpdb.apps.val_rel.utils.mmCIFInfo import is_simple_modification
+from wwpdb.apps.val_rel.utils.mmCIFInfo import is_simple_change, is_simple_modification
 
 
 class mmCIFInfoTests(unittest.TestCase):
@@ -95,6 +95,48 @@ loop_
         ret = is_simple_modification(self.mmCIF_file)
         self.assertFalse(ret)
 
+    def test_database_2_revision(self):
+        self.additional_content = """
+loop_
+    _pdbx_audit_revision_history.ordinal
+    _pdbx_audit_revision_history.data_content_type
+    _pdbx_audit_revision_history.major_revision
+    _pdbx_audit_revision_history.minor_revision
+    _pdbx_audit_revision_history.revision_date
+    1 'Structure model' 1 0 2017-03-01
+    2 'Structure model' 1 1 2017-03-08
+    10 'Structure model' 1 2 2022-03-08
+#
+loop_
+    _pdbx_audit_revision_category.ordinal
+    _pdbx_audit_revision_category.revision_ordinal
+    _pdbx_audit_revision_category.data_content_type
+    _pdbx_audit_revision_category.category
+    1 2 'Structure Model' 'atom_site'
+    2 10 'Structure Model' 'database_2'
+#
+loop_
+    _pdbx_audit_revision_item.ordinal
+    _pdbx_audit_revision_item.revision_ordinal
+    _pdbx_audit_revision_item.data_content_type
+    _pdbx_audit_revision_item.item
+    1 10 'Structure Model' '_database_2.pdbx_DOI'
+    2 10 'Structure Model' '_database_2.pdbx_database_accession'
+#
+"""
+        self.write_mmcif()
+        self.assertTrue(is_simple_modification(self.mmCIF_file))
+
+        self.additional_content = self.additional_content.replace("pdbx_database_accession", "database_code")
+        self.write_mmcif()
+        self.assertFalse(is_simple_modification(self.mmCIF_file))
+
+    def test_is_simple_change(self):
+        self.assertTrue(is_simple_change(['citation', 'citation', 'struct_keywords'], {}))
+        self.assertFalse(is_simple_change([], {}))
+        self.assertFalse(is_simple_change(['citation', 'atom_site'], {}))
+        self.assertIsNone(is_simple_change(['database_2'], {}))
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,82 @@
+import os
+import shutil
+import stat
+import tempfile
+import time
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils import MetadataCache as mc_module
+from wwpdb.apps.val_rel.utils.MetadataCache import MetadataCache
+
+
+class MetadataCacheTests(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache_dir = os.path.join(self.test_dir, "metadata")
+        self.model = os.path.join(self.test_dir, "1abc.cif")
+        with open(self.model, "w") as fout:
+            fout.write("data_1ABC\n")
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_get_put(self):
+        mc = MetadataCache(self.cache_dir)
+        self.assertIsNone(mc.get(self.model))
+        mc.put(self.model, {"exp_methods": ["X-RAY DIFFRACTION"]})
+
+        # Another process, through a link to the same file
+        link = os.path.join(self.test_dir, "link.cif")
+        os.symlink(self.model, link)
+        self.assertEqual(MetadataCache(self.cache_dir).get(link), {"exp_methods": ["X-RAY DIFFRACTION"]})
+
+        # Changed file is read again
+        with open(self.model, "a") as fout:
+            fout.write("_exptl.method 'ELECTRON MICROSCOPY'\n")
+        self.assertIsNone(mc.get(self.model))
+        self.assertIsNone(mc.get(os.path.join(self.test_dir, "missing.cif")))
+
+    def test_evict(self):
+        mc = MetadataCache(self.cache_dir, ttl=60)
+        mc.put(self.model, {})
+        self.assertEqual(mc.evict(now=time.time() + 30), 0)
+        self.assertEqual(mc.get(self.model), {})
+        self.assertEqual(mc.evict(now=time.time() + 120), 1)
+        self.assertIsNone(mc.get(self.model))
+
+    def test_shared(self):
+        """Directories can be used by consumers running as other users of the group"""
+        umask = os.umask(0o022)
+        try:
+            MetadataCache(self.cache_dir).put(self.model, {})
+        finally:
+            os.umask(umask)
+        for dirpath, _dirnames, _filenames in os.walk(self.cache_dir):
+            self.assertEqual(stat.S_IMODE(os.stat(dirpath).st_mode), 0o2770)
+
+        # Eviction stamp made by another user
+        denied = mock.Mock(side_effect=PermissionError(13, "Permission denied"))
+        with mock.patch.object(mc_module, "open_shared", denied):
+            MetadataCache(self.cache_dir, ttl=60).put(self.model, {"exp_methods": []})
+        self.assertEqual(MetadataCache(self.cache_dir).get(self.model), {"exp_methods": []})
+
+    def test_untrusted(self):
+        mc = MetadataCache(self.cache_dir)
+        mc.put(self.model, {"exp_methods": ["X-RAY DIFFRACTION"]})
+        entry = [os.path.join(d, f) for d, _s, files in os.walk(self.cache_dir) for f in files if f.endswith(".json")][0]
+
+        # Planted by another user
+        owner = os.stat(entry).st_uid
+        os.chown(entry, owner + 1000, -1)
+        self.assertIsNone(MetadataCache(self.cache_dir).get(self.model))
+        os.chown(entry, owner, -1)
+        self.assertEqual(MetadataCache(self.cache_dir).get(self.model), {"exp_methods": ["X-RAY DIFFRACTION"]})
+
+        # Directory anyone can write to is not used
+        os.chmod(self.cache_dir, 0o777)
+        self.assertIsNone(MetadataCache(self.cache_dir).get(self.model))
+
+
+if __name__ == '__main__':
+    unittest.main()
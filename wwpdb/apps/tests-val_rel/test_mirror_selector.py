@@ -0,0 +1,44 @@
+import unittest
+
+from wwpdb.apps.val_rel.utils.http_protocol.MirrorSelector import MirrorSelector
+
+
+class MirrorSelectorTests(unittest.TestCase):
+    def setUp(self):
+        self.selector = MirrorSelector("https://files.wwpdb.org/pub/",
+                                       mirrors=["ftp.ebi.ac.uk/pub/databases", "https://files.pdbj.org/pub"])
+        # Not probed
+        self.selector._MirrorSelector__next_probe = float("inf")
+
+    def test_sites(self):
+        self.assertEqual(self.selector.sites, ["https://files.wwpdb.org/pub", "https://ftp.ebi.ac.uk/pub/databases",
+                                               "https://files.pdbj.org/pub"])
+        self.assertTrue(self.selector.is_primary("https://files.wwpdb.org/pub"))
+        self.assertFalse(self.selector.is_primary("https://files.pdbj.org/pub"))
+
+    def test_candidates(self):
+        url = "https://files.wwpdb.org/pub/emdb/structures/EMD-1234/map/emd_1234.map.gz"
+        self.assertEqual([u for _s, u in self.selector.candidates(url)],
+                         ["https://files.wwpdb.org/pub/emdb/structures/EMD-1234/map/emd_1234.map.gz",
+                          "https://ftp.ebi.ac.uk/pub/databases/emdb/structures/EMD-1234/map/emd_1234.map.gz",
+                          "https://files.pdbj.org/pub/emdb/structures/EMD-1234/map/emd_1234.map.gz"])
+        # Other servers not rewritten
+        self.assertEqual(self.selector.candidates("http://localhost/pub/file"), [(None, "http://localhost/pub/file")])
+
+    def test_ranking(self):
+        url = "https://files.wwpdb.org/pub/pdb/data/file.cif.gz"
+        self.selector.record_success("https://files.wwpdb.org/pub", 10, 10 * 1024 * 1024)
+        self.selector.record_success("https://ftp.ebi.ac.uk/pub/databases", 1, 10 * 1024 * 1024)
+        self.selector.record_success("https://files.pdbj.org/pub", 2, 10 * 1024 * 1024)
+        self.assertEqual([s for s, _u in self.selector.candidates(url)],
+                         ["https://ftp.ebi.ac.uk/pub/databases", "https://files.pdbj.org/pub", "https://files.wwpdb.org/pub"])
+
+        # Failed mirror tried last until it succeeds again
+        self.selector.record_failure("https://ftp.ebi.ac.uk/pub/databases")
+        self.assertEqual(self.selector.candidates(url)[-1][0], "https://ftp.ebi.ac.uk/pub/databases")
+        self.selector.record_success("https://ftp.ebi.ac.uk/pub/databases", 1, 10 * 1024 * 1024)
+        self.assertEqual(self.selector.candidates(url)[0][0], "https://ftp.ebi.ac.uk/pub/databases")
+
+
+if __name__ == '__main__':
+    unittest.main()
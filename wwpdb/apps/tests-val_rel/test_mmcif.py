@@ -106,6 +106,58 @@ loop_
         cats = mf.get_latest_modified_categories()
         self.assertTrue(cats == ['citation_author', 'citation'])
 
+    def test_get_modified_categories_ordinal_10(self):
+        history = "".join("    %d 'Structure model' 1 %d 2017-03-%02d\n" % (n, n - 1, n) for n in range(1, 12))
+        self.additional_content = """
+loop_
+    _pdbx_audit_revision_history.ordinal
+    _pdbx_audit_revision_history.data_content_type
+    _pdbx_audit_revision_history.major_revision
+    _pdbx_audit_revision_history.minor_revision
+    _pdbx_audit_revision_history.revision_date
+""" + history + """#
+loop_
+    _pdbx_audit_revision_category.ordinal
+    _pdbx_audit_revision_category.revision_ordinal
+    _pdbx_audit_revision_category.data_content_type
+    _pdbx_audit_revision_category.category
+    1 9 'Structure Model' 'atom_site'
+    2 11 'Structure Model' 'citation'
+#
+loop_
+    _pdbx_audit_revision_item.ordinal
+    _pdbx_audit_revision_item.revision_ordinal
+    _pdbx_audit_revision_item.data_content_type
+    _pdbx_audit_revision_item.item
+    1 9 'Structure Model' '_atom_site.Cartn_x'
+    2 11 'Structure Model' '_citation.title'
+    3 11 'Structure Model' '_citation.year'
+#
+"""
+        self.write_mmcif()
+        mf = mmCIFInfo(mmCIF_file=self.mmCIF_file)
+        cats, ordinal = mf.get_latest_modified_categories()
+        self.assertEqual((cats, ordinal), (['citation'], '11'))
+        self.assertEqual(mf.get_modified_items(ordinal), {'citation': ['title', 'year']})
+
+    def test_get_category_columns(self):
+        self.additional_content = """
+loop_
+_pdbx_database_related.db_name
+_pdbx_database_related.db_id
+_pdbx_database_related.details
+_pdbx_database_related.content_type
+PDB 1X7N ? unspecified
+EMDB EMD-1234 . 'associated EM volume'
+#
+"""
+        self.write_mmcif()
+        mf = mmCIFInfo(mmCIF_file=self.mmCIF_file)
+        cols = mf.get_category_columns("pdbx_database_related", items=("db_id", "details", "unknown"))
+        self.assertEqual(cols, {'db_id': ['1X7N', 'EMD-1234'], 'details': ['', '']})
+        self.assertEqual(sorted(mf.get_category_columns("pdbx_database_related")), ['content_type', 'db_id', 'db_name', 'details'])
+        self.assertEqual(mf.get_category_columns("em_map"), {})
+
 
 if __name__ == "__main__":
     unittest.main()
@@ -0,0 +1,74 @@
+import logging
+import os
+import shutil
+import tempfile
+import time
+import unittest
+
+from wwpdb.apps.val_rel.utils.mmCIFInfo import mmCIFInfo
+
+logger = logging.getLogger(__name__)
+
+# Size of the revision history generated - a long lived entry has a few hundred item changes
+REVISIONS = 100
+ITEMS_PER_REVISION = 50
+
+
+def per_cell_rows(cat, items):
+    """Rows read a value at a time, as before the bulk accessors"""
+    return [tuple(cat.getValueOrDefault(attributeName=item, defaultValue="", rowIndex=row) for item in items)
+            for row in range(len(cat.data))]
+
+
+class mmCIFBulkAccessTests(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.mmCIF_file = os.path.join(self.test_dir, 'test.cif')
+        lines = ["data_1ABC", "#", "loop_",
+                 "_pdbx_database_related.db_name", "_pdbx_database_related.db_id",
+                 "_pdbx_database_related.details", "_pdbx_database_related.content_type"]
+        lines += ["EMDB EMD-%d ? 'other EM volume'" % n for n in range(1000, 1200)]
+        lines += ["EMDB EMD-1234 . 'associated EM volume'", "#", "loop_"]
+        lines += ["_pdbx_audit_revision_item.%s" % item for item in ("ordinal", "revision_ordinal", "data_content_type", "item")]
+        lines += ["%d %d 'Structure model' '_cat_%d.item_%d'" % (r * ITEMS_PER_REVISION + i, r, i % 7, i)
+                  for r in range(1, REVISIONS + 1) for i in range(ITEMS_PER_REVISION)]
+        with open(self.mmCIF_file, 'w') as outFile:
+            outFile.write("\n".join(lines) + "\n#\n")
+        self.mf = mmCIFInfo(mmCIF_file=self.mmCIF_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_bulk_matches_per_cell(self):
+        for category in ("pdbx_database_related", "pdbx_audit_revision_item"):
+            cat = self.mf.get_category(category)
+            items = cat.getAttributeList() + ["unknown"]
+            rows = self.mf.get_category_rows(category, items)
+            self.assertEqual(rows, per_cell_rows(cat, items))
+            columns = self.mf.get_category_columns(category)
+            self.assertEqual(sorted(columns), sorted(cat.getAttributeList()))
+            self.assertEqual(columns[items[1]], [row[1] for row in rows])
+        self.assertEqual(self.mf.get_associated_emdb(), 'EMD-1234')
+        self.assertEqual(self.mf.get_category_rows("em_map", ("type",)), [])
+
+    def test_benchmark(self):
+        """Times the bulk accessors against reading a value at a time - reported, not asserted"""
+        timings = {}
+        for category in ("pdbx_database_related", "pdbx_audit_revision_item"):
+            cat = self.mf.get_category(category)
+            items = cat.getAttributeList()
+            for label, func in (("per cell", lambda: per_cell_rows(cat, items)),
+                                ("rows", lambda: self.mf.get_category_rows(category, items)),
+                                ("columns", lambda: self.mf.get_category_columns(category, items=items))):
+                start = time.time()
+                for _ in range(5):
+                    func()
+                timings[(category, label)] = (time.time() - start) / 5
+            logger.info("%s %d rows: per cell %.2f ms, rows %.2f ms, columns %.2f ms", category, len(cat.data),
+                        *[timings[(category, label)] * 1000 for label in ("per cell", "rows", "columns")])
+        self.assertEqual(len(timings), 6)
+
+
+if __name__ == '__main__':
+    logging.basicConfig(level=logging.INFO)
+    unittest.main()
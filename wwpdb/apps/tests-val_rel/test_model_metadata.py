@@ -0,0 +1,104 @@
+import unittest
+import os
+import tempfile
+import shutil
+from wwpdb.apps.val_rel.utils.mmCIFInfo import get_model_metadata, ModelMetadata
+
+
+class ModelMetadataTests(unittest.TestCase):
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.mmCIF_file = os.path.join(self.test_dir, 'test.cif')
+        # In archive order - the revision history follows the coordinates
+        self.mmcif_content = """
+data_6ABC
+#
+_entry.id   6ABC
+#
+_exptl.entry_id          6ABC
+_exptl.method            'ELECTRON MICROSCOPY'
+#
+loop_
+_pdbx_database_related.db_name
+_pdbx_database_related.details
+_pdbx_database_related.db_id
+_pdbx_database_related.content_type
+EMDB 'map' EMD-1234 'associated EM volume'
+PDB  'other' 5ABC 'other'
+#
+_em_map.id            1
+_em_map.type          primary
+_em_map.contour_level 0.05
+#
+loop_
+_atom_site.group_PDB
+_atom_site.id
+ATOM 1
+#
+loop_
+_atom_site_anisotrop.id
+_atom_site_anisotrop.U[1][1]
+1 0.1
+#
+loop_
+_pdbx_poly_seq_scheme.asym_id
+_pdbx_poly_seq_scheme.seq_id
+A 1
+#
+loop_
+_pdbx_audit_revision_history.ordinal
+_pdbx_audit_revision_history.data_content_type
+_pdbx_audit_revision_history.major_revision
+_pdbx_audit_revision_history.minor_revision
+_pdbx_audit_revision_history.revision_date
+1 'Structure model' 1 0 2017-03-01
+2 'Structure model' 1 1 2017-03-08
+#
+loop_
+_pdbx_audit_revision_category.ordinal
+_pdbx_audit_revision_category.revision_ordinal
+_pdbx_audit_revision_category.data_content_type
+_pdbx_audit_revision_category.category
+1 1 'Structure Model' citation
+2 2 'Structure Model' database_2
+#
+loop_
+_pdbx_audit_revision_item.ordinal
+_pdbx_audit_revision_item.revision_ordinal
+_pdbx_audit_revision_item.data_content_type
+_pdbx_audit_revision_item.item
+1 2 'Structure model' '_database_2.pdbx_DOI'
+#
+"""
+        with open(self.mmCIF_file, 'w') as outFile:
+            outFile.write(self.mmcif_content)
+
+    def tearDown(self):
+        if os.path.exists(self.test_dir):
+            shutil.rmtree(self.test_dir, ignore_errors=True)
+
+    def test_get_model_metadata(self):
+        metadata = get_model_metadata(self.mmCIF_file)
+        self.assertEqual(metadata.exp_methods, ['ELECTRON MICROSCOPY'])
+        self.assertEqual(metadata.emdb_id, 'EMD-1234')
+        self.assertEqual(metadata.contour_level, '0.05')
+        self.assertEqual(metadata.latest_ordinal, '2')
+        self.assertEqual(metadata.latest_categories, ['database_2'])
+        self.assertEqual(metadata.modified_items, {'database_2': ['pdbx_DOI']})
+        self.assertEqual(ModelMetadata.from_dict(metadata.to_dict()).to_dict(), metadata.to_dict())
+
+        # Parsed once while the file is unchanged
+        self.assertIs(get_model_metadata(self.mmCIF_file), metadata)
+
+        with open(self.mmCIF_file, 'w') as outFile:
+            outFile.write(self.mmcif_content.replace('ELECTRON MICROSCOPY', 'X-RAY DIFFRACTION'))
+        self.assertEqual(get_model_metadata(self.mmCIF_file).exp_methods, ['X-RAY DIFFRACTION'])
+
+    def test_missing_file(self):
+        metadata = get_model_metadata(os.path.join(self.test_dir, 'missing.cif'))
+        self.assertEqual(metadata.exp_methods, [])
+        self.assertIsNone(metadata.emdb_id)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,49 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from wwpdb.apps.val_rel.utils.PartialFile import PartialFile
+
+
+class PartialFileTests(unittest.TestCase):
+    def setUp(self):
+        self.temp_dir = tempfile.mkdtemp()
+        self.part_path = os.path.join(self.temp_dir, "sub", "1abc.cif.gz.part")
+
+    def tearDown(self):
+        shutil.rmtree(self.temp_dir, ignore_errors=True)
+
+    def test_resume(self):
+        part = PartialFile(self.part_path)
+        self.assertTrue(part.acquire())
+        # Held by us - second consumer must not append
+        self.assertFalse(PartialFile(self.part_path).acquire())
+        part.start({"url": "http://example/1abc.cif.gz", "etag": '"abc"'})
+        part.write(b"12345")
+        part.release()
+
+        part = PartialFile(self.part_path)
+        self.assertTrue(part.acquire())
+        self.assertEqual(part.offset(), 5)
+        self.assertEqual(part.get_validators()["etag"], '"abc"')
+        part.write(b"678")
+        dest = os.path.join(self.temp_dir, "1abc.cif.gz")
+        part.complete(dest)
+        with open(dest, "rb") as fin:
+            self.assertEqual(fin.read(), b"12345678")
+        self.assertFalse(os.path.exists(self.part_path))
+        self.assertFalse(os.path.exists(self.part_path + ".json"))
+
+    def test_start_discards(self):
+        part = PartialFile(self.part_path)
+        self.assertTrue(part.acquire())
+        part.write(b"stale")
+        part.start({})
+        self.assertEqual(part.offset(), 0)
+        part.discard()
+        self.assertFalse(os.path.exists(self.part_path))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,45 @@
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel import PrefetchRelease as pr_module
+
+
+class FakeRelFiles(object):
+    created = []
+
+    def __init__(self, siteID=None, pdb_id=None, emdb_id=None, cache=None):
+        self.pdb_id = pdb_id
+        self.emdb_id = emdb_id
+        self.cache = cache
+        self.cleaned = False
+        FakeRelFiles.created.append(self)
+
+    def prefetch(self, kinds=None):
+        if self.pdb_id == "0abc":
+            return {"model": None}
+        return {"model": "/cache/%s.cif.gz" % self.pdb_id}
+
+    def close_connections(self):
+        pass
+
+    def remove_local_temp_files(self):
+        self.cleaned = True
+
+
+class PrefetchReleaseTests(unittest.TestCase):
+    def test_prefetch_messages(self):
+        FakeRelFiles.created = []
+        of = mock.MagicMock()
+        of.return_value.get_ftp_cache_folder.return_value = "/cache"
+        with mock.patch.object(pr_module, "getFilesRelease", FakeRelFiles), \
+                mock.patch.object(pr_module, "outputFiles", of):
+            prefetcher = pr_module.PrefetchRelease(site_id="TEST", workers=2)
+            results = prefetcher.prefetch_messages([{"pdbID": "1abc"}, {"pdbID": "0abc"}])
+
+        self.assertEqual(results["1abc"], {"model": "/cache/1abc.cif.gz"})
+        self.assertEqual(results["0abc"], {"model": None})
+        self.assertTrue(all(rel.cache == "/cache" and rel.cleaned for rel in FakeRelFiles.created))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,178 @@
+import os
+import shutil
+import tempfile
+import unittest
+import urllib.parse
+from unittest import mock
+
+from requests.structures import CaseInsensitiveDict
+
+from wwpdb.apps.val_rel.utils.PersistFileCache import PersistFileCache
+from wwpdb.apps.val_rel.utils.TransferScheduler import TransferScheduler
+from wwpdb.apps.val_rel.utils.http_protocol.MirrorSelector import MirrorSelector
+from wwpdb.apps.val_rel.utils.http_protocol import getRemoteFilesHTTP as http_module
+from wwpdb.apps.val_rel.utils.http_protocol.getRemoteFilesHTTP import GetRemoteFilesHttp
+
+PRIMARY = "https://files.wwpdb.org/pub"
+MIRROR = "https://files.pdbj.org/pub"
+
+
+class FakeResponse(object):
+    def __init__(self, status_code, body=b"", headers=None):
+        self.status_code = status_code
+        self.headers = CaseInsensitiveDict(headers or {})
+        if body and "content-length" not in self.headers:
+            self.headers["content-length"] = str(len(body))
+        self.__body = body
+
+    def iter_content(self, chunk_size=1):
+        for start in range(0, len(self.__body), chunk_size):
+            yield self.__body[start:start + chunk_size]
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+
+class FakeSession(object):
+    """Answers each GET with the next response queued for its url, recording the requests made"""
+
+    def __init__(self):
+        self.responses = {}
+        self.requests = []
+
+    def get(self, url, headers=None, **kwargs):
+        self.requests.append((url, dict(headers or {})))
+        queued = self.responses.get(url)
+        return queued.pop(0) if queued else FakeResponse(404)
+
+
+class HttpTestCase(unittest.TestCase):
+    """GetRemoteFilesHttp with the primary server and a mirror answered by FakeSession"""
+
+    def setUp(self):
+        self.test_dir = tempfile.mkdtemp()
+        self.cache = os.path.join(self.test_dir, "cache")
+        self.output = os.path.join(self.test_dir, "session")
+        self.session = FakeSession()
+        self.selector = MirrorSelector(PRIMARY, mirrors=[MIRROR])
+        # Not probed
+        self.selector._MirrorSelector__next_probe = float("inf")
+
+        with mock.patch.object(http_module, "EmailHandler"):
+            self.grf = GetRemoteFilesHttp(cache=self.cache)
+        self.grf._GetRemoteFilesHttp__session_pool = mock.Mock(get_session=lambda: self.session)
+        self.grf._GetRemoteFilesHttp__mirrors = self.selector
+        self.grf._GetRemoteFilesHttp__scheduler = TransferScheduler(os.path.join(self.test_dir, "locks"))
+        self.grf._GetRemoteFilesHttp__revalidate_interval = 0
+
+    def tearDown(self):
+        shutil.rmtree(self.test_dir, ignore_errors=True)
+
+
+class GetRemoteFilesHttpTests(HttpTestCase):
+    def __respond(self, site, path, *responses):
+        self.session.responses.setdefault(site + path, []).extend(responses)
+
+    def __cache_path(self, path):
+        return os.path.join(self.cache, urllib.parse.urlparse(PRIMARY + path).path)
+
+    def __read(self, path):
+        with open(os.path.join(self.output, os.path.basename(path)), "rb") as fin:
+            return fin.read()
+
+    def test_mirror_not_found(self):
+        """A mirror without the file does not make it missing when the primary failed"""
+        path = "/pdb/data/1abc.cif.gz"
+        self.__respond(PRIMARY, path, FakeResponse(503))
+        self.__respond(MIRROR, path, FakeResponse(404))
+        self.assertFalse(self.grf.get_file(PRIMARY + path, self.output))
+        self.assertEqual([u for u, _h in self.session.requests], [PRIMARY + path, MIRROR + path])
+        pfc = PersistFileCache(self.cache)
+        self.assertIsNone(pfc.cache_file_status(self.__cache_path(path)))
+
+        # Primary reporting it missing is believed
+        self.__respond(PRIMARY, path, FakeResponse(404))
+        self.assertFalse(self.grf.get_file(PRIMARY + path, self.output))
+        self.assertIs(pfc.cache_file_status(self.__cache_path(path)), False)
+
+    def test_revalidate_with_primary(self):
+        """Cached copies are revalidated against the primary only, and not with a mirror's validators"""
+        path = "/pdb/data/2abc.cif.gz"
+        self.selector.record_success(PRIMARY, 10, 1024 * 1024)
+        self.selector.record_success(MIRROR, 1, 1024 * 1024)
+        self.__respond(MIRROR, path, FakeResponse(200, b"old", {"etag": '"mirror"', "last-modified": "Mon, 01 Jan 2024 00:00:00 GMT"}))
+        self.assertTrue(self.grf.get_file(PRIMARY + path, self.output))
+        self.assertEqual(self.__read(path), b"old")
+        meta = PersistFileCache(self.cache).get_metadata(self.__cache_path(path))
+        self.assertIsNone(meta["etag"])
+        self.assertEqual(meta["last_modified"], "Mon, 01 Jan 2024 00:00:00 GMT")
+
+        # Out of date mirror would confirm the copy
+        self.session.requests = []
+        self.__respond(MIRROR, path, FakeResponse(304))
+        self.__respond(PRIMARY, path, FakeResponse(200, b"new", {"etag": '"primary"', "last-modified": "Tue, 02 Jan 2024 00:00:00 GMT"}))
+        self.assertTrue(self.grf.get_file(PRIMARY + path, self.output))
+        self.assertEqual(self.session.requests, [(PRIMARY + path, {"If-Modified-Since": "Mon, 01 Jan 2024 00:00:00 GMT"})])
+        self.assertEqual(self.__read(path), b"new")
+        self.assertEqual(PersistFileCache(self.cache).get_metadata(self.__cache_path(path))["etag"], '"primary"')
+
+        # Primary unavailable - the cached copy is used, not a mirror's answer
+        self.session.requests = []
+        self.__respond(PRIMARY, path, FakeResponse(503))
+        self.assertTrue(self.grf.get_file(PRIMARY + path, self.output))
+        self.assertEqual([u for u, _h in self.session.requests], [PRIMARY + path])
+        self.assertEqual(self.__read(path), b"new")
+
+
+class ResumeTests(HttpTestCase):
+    """Continuing an interrupted transfer with Range/If-Range"""
+
+    def setUp(self):
+        super(ResumeTests, self).setUp()
+        self.url = PRIMARY + "/emdb/structures/EMD-1234/map/emd_1234.map.gz"
+        self.out_file = os.path.join(self.test_dir, "emd_1234.map.gz")
+        # Connection closed after 3 of 6 bytes
+        self.__respond(FakeResponse(200, b"abc", {"content-length": "6", "etag": '"v1"'}))
+
+    def __respond(self, *responses):
+        self.session.responses.setdefault(self.url, []).extend(responses)
+
+    def __download(self):
+        ret = self.grf.httpRequest(self.url, self.out_file)
+        with open(self.out_file, "rb") as fin:
+            return ret, fin.read()
+
+    def __range_headers(self):
+        return [(h.get("Range"), h.get("If-Range")) for _u, h in self.session.requests]
+
+    def test_resume(self):
+        self.__respond(FakeResponse(206, b"def", {"content-range": "bytes 3-5/6", "etag": '"v1"'}))
+        self.assertEqual(self.__download(), (True, b"abcdef"))
+        self.assertEqual(self.__range_headers(), [(None, None), ("bytes=3-", '"v1"')])
+        self.assertFalse(os.path.exists(self.out_file + ".part"))
+
+    def test_content_range_mismatch(self):
+        """206 not starting at the offset asked for - started again"""
+        self.__respond(FakeResponse(206, b"abcdef", {"content-range": "bytes 0-5/6", "etag": '"v1"'}),
+                       FakeResponse(200, b"abcdef", {"etag": '"v1"'}))
+        self.assertEqual(self.__download(), (True, b"abcdef"))
+        self.assertEqual(self.__range_headers(), [(None, None), ("bytes=3-", '"v1"'), (None, None)])
+
+    def test_range_ignored(self):
+        """200 to a Range request - file changed or server without ranges - replaces the partial data"""
+        self.__respond(FakeResponse(200, b"XYZdef", {"etag": '"v2"'}))
+        self.assertEqual(self.__download(), (True, b"XYZdef"))
+        self.assertEqual(self.__range_headers(), [(None, None), ("bytes=3-", '"v1"')])
+
+    def test_range_not_satisfiable(self):
+        """416 - partial data does not match the remote file and is discarded"""
+        self.__respond(FakeResponse(416), FakeResponse(200, b"uvw", {"etag": '"v2"'}))
+        self.assertEqual(self.__download(), (True, b"uvw"))
+        self.assertEqual(self.__range_headers(), [(None, None), ("bytes=3-", '"v1"'), (None, None)])
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,88 @@
+import os
+import shutil
+import tempfile
+import threading
+import unittest
+
+from wwpdb.apps.val_rel.utils.AsyncRemoteFiles import AsyncRemoteFiles
+from wwpdb.apps.val_rel.utils.TransferMetrics import TransferMetrics, summarize_file, TIER_CACHE, TIER_LOCAL, \
+    TIER_MISSING, TIER_ONEDEP, TIER_REMOTE
+
+
+class TransferMetricsTests(unittest.TestCase):
+    def setUp(self):
+        self.__dir = tempfile.mkdtemp()
+        self.__metrics_file = os.path.join(self.__dir, "metrics.json")
+        self.__metrics = TransferMetrics(metrics_file=self.__metrics_file)
+
+    def tearDown(self):
+        shutil.rmtree(self.__dir, ignore_errors=True)
+
+    def test_fetch_tier(self):
+        m = self.__metrics
+        with m.collect() as collector:
+            with m.fetch("model", "1abc") as fetch:
+                m.record_transfer("https://server/1abc.cif.gz", TIER_CACHE, cache="hit")
+                fetch.set_file("1abc.cif")
+            with m.fetch("sf", "1abc") as fetch:
+                m.record_transfer("https://server/r1abcsf.ent.gz", TIER_REMOTE, nbytes=100, cache="miss", retries=2)
+                fetch.set_file("r1abcsf.ent")
+            with m.fetch("cs", "1abc") as fetch:
+                fetch.set_file("1abc_cs.str")
+            with m.fetch("nmr_data", "1abc"):
+                pass
+            m.record_fetch("emdb_xml", "EMD-1234", TIER_ONEDEP, None, 0.1)
+        # Outside of collect() - not gathered
+        m.record_fetch("model", "2abc", TIER_ONEDEP, None, 0.1)
+
+        fetches = dict((r["kind"], r) for r in collector.get_records() if r["type"] == "fetch")
+        self.assertEqual(fetches["model"]["tier"], TIER_CACHE)
+        self.assertEqual(fetches["model"]["cache_hits"], 1)
+        self.assertEqual(fetches["sf"]["tier"], TIER_REMOTE)
+        self.assertEqual((fetches["sf"]["bytes"], fetches["sf"]["retries"]), (100, 2))
+        self.assertEqual(fetches["cs"]["tier"], TIER_LOCAL)
+        self.assertEqual(fetches["nmr_data"]["tier"], TIER_MISSING)
+
+        summary = collector.summary()
+        self.assertEqual(sorted(summary["tiers"]), [TIER_CACHE, TIER_LOCAL, TIER_MISSING, TIER_ONEDEP, TIER_REMOTE])
+        self.assertEqual(summary["cache"], {"hit": 1, "miss": 1})
+        self.assertEqual(summary["retries"], 2)
+
+    def test_metrics_file(self):
+        m = self.__metrics
+        threads = [threading.Thread(target=m.record_fetch, args=("model", "%dabc" % n, TIER_ONEDEP, None, 1.0))
+                   for n in range(10)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        with open(self.__metrics_file, "a") as fout:
+            fout.write('{"type": "fetch", "ki')
+
+        summary = summarize_file(self.__metrics_file)
+        self.assertEqual(summary["tiers"][TIER_ONEDEP]["count"], 10)
+        self.assertEqual(summary["kinds"]["model"]["seconds"], 10.0)
+        self.assertEqual(summarize_file(self.__metrics_file, since=2 ** 40)["tiers"], {})
+
+    def test_async_transfers(self):
+        """Transfers made by AsyncRemoteFiles on behalf of a fetch are included in it"""
+        m = self.__metrics
+
+        class Remote(object):
+            def get_url(self, url=None, output_path=None):
+                m.record_transfer(url, TIER_REMOTE, nbytes=10)
+                return url
+
+        engine = AsyncRemoteFiles(remote=Remote(), max_in_flight=2)
+        self.addCleanup(engine.close)
+        with m.collect() as collector:
+            with m.fetch("emdb_volume", "EMD-1234") as fetch:
+                engine.gather([engine.get_url(url="u%d" % n) for n in range(3)])
+                fetch.set_file("emd_1234.map")
+
+        fetches = [r for r in collector.get_records() if r["type"] == "fetch"]
+        self.assertEqual((fetches[0]["transfers"], fetches[0]["bytes"]), (3, 30))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,112 @@
+import os
+import shutil
+import stat
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+
+from wwpdb.apps.val_rel.utils import TransferScheduler as ts_module
+from wwpdb.apps.val_rel.utils.TransferScheduler import TransferScheduler
+
+
+class TransferSchedulerTests(unittest.TestCase):
+    def setUp(self):
+        self.lock_dir = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, self.lock_dir)
+
+    def test_is_large(self):
+        self.assertTrue(TransferScheduler.is_large("/pub/emdb/structures/EMD-1234/map/emd_1234.map.gz"))
+        self.assertFalse(TransferScheduler.is_large("/pub/emdb/structures/EMD-1234/header/emd-1234-v30.xml"))
+        self.assertTrue(TransferScheduler.is_large("1abc.cif.gz", size=2 ** 30))
+        self.assertFalse(TransferScheduler.is_large("emd_1234.map.gz", size=1000))
+
+    def test_max_per_server(self):
+        scheduler = TransferScheduler(self.lock_dir, max_per_server=3, small_slots=1)
+        lock = threading.Lock()
+        counts = {"active": 0, "max": 0, "large": 0, "max_large": 0}
+
+        def transfer(name):
+            large = scheduler.is_large(name)
+            with scheduler.transfer("files.wwpdb.org", name):
+                with lock:
+                    counts["active"] += 1
+                    counts["max"] = max(counts["max"], counts["active"])
+                    if large:
+                        counts["large"] += 1
+                        counts["max_large"] = max(counts["max_large"], counts["large"])
+                time.sleep(0.05)
+                with lock:
+                    counts["active"] -= 1
+                    if large:
+                        counts["large"] -= 1
+
+        names = ["emd_%d.map.gz" % n for n in range(6)] + ["emd-%d-v30.xml" % n for n in range(6)]
+        threads = [threading.Thread(target=transfer, args=(name,)) for name in names]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+        self.assertEqual(counts["max"], 3)
+        # One slot kept for small files
+        self.assertEqual(counts["max_large"], 2)
+
+    def test_small_file_not_blocked(self):
+        scheduler = TransferScheduler(self.lock_dir, max_per_server=2, small_slots=1)
+        with scheduler.transfer("files.wwpdb.org", "emd_1.map.gz"):
+            start = time.time()
+            with scheduler.transfer("files.wwpdb.org", "emd-1-v30.xml"):
+                pass
+            self.assertLess(time.time() - start, 0.1)
+
+    def test_bandwidth(self):
+        scheduler = TransferScheduler(self.lock_dir, max_bytes_per_second=100000)
+        start = time.time()
+        with scheduler.transfer("files.wwpdb.org", "1abc.cif") as slot:
+            for _n in range(30):
+                slot.consume(10000)
+        # One second burst and two seconds at the rate
+        self.assertGreater(time.time() - start, 1.8)
+
+    def test_shared_permissions(self):
+        """Lock directory and files can be used by consumers running as other users of the group - but not by anyone"""
+        lock_dir = os.path.join(self.lock_dir, "transfers")
+        umask = os.umask(0o022)
+        try:
+            scheduler = TransferScheduler(lock_dir, max_per_server=2, small_slots=0, max_bytes_per_second=10 ** 9)
+            with scheduler.transfer("files.wwpdb.org", "1abc.cif") as slot:
+                slot.consume(10)
+        finally:
+            os.umask(umask)
+        host_dir = os.path.join(lock_dir, "files.wwpdb.org")
+        for path in [lock_dir, host_dir]:
+            self.assertEqual(stat.S_IMODE(os.stat(path).st_mode), 0o2770)
+        for name in os.listdir(host_dir):
+            self.assertEqual(stat.S_IMODE(os.stat(os.path.join(host_dir, name)).st_mode), 0o660)
+
+    def test_no_lock_dir(self):
+        scheduler = TransferScheduler(None, max_per_server=1, max_bytes_per_second=1)
+        start = time.time()
+        with scheduler.transfer("files.wwpdb.org", "1abc.cif"):
+            with scheduler.transfer("files.wwpdb.org", "2abc.cif") as slot:
+                slot.consume(1000)
+        self.assertLess(time.time() - start, 0.5)
+
+    def test_not_writable(self):
+        """Lock files made unusable by another user - transfers go ahead without limits"""
+        scheduler = TransferScheduler(self.lock_dir, max_per_server=1, max_bytes_per_second=1)
+        denied = mock.Mock(side_effect=PermissionError(13, "Permission denied"))
+        with mock.patch.object(ts_module, "_unusable", set()), mock.patch.object(ts_module, "open_shared", denied):
+            with self.assertLogs(ts_module.logger, level="WARNING") as logs:
+                with scheduler.transfer("files.wwpdb.org", "1abc.cif") as outer:
+                    # Would wait for the only slot, and for the bucket refill, if limited
+                    with scheduler.transfer("files.wwpdb.org", "2abc.cif") as slot:
+                        slot.consume(1000)
+                    outer.consume(1000)
+            self.assertEqual(len(logs.output), 1)
+            self.assertEqual(denied.call_count, 1)
+
+
+if __name__ == '__main__':
+    unittest.main()
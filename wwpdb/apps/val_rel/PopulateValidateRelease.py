@@ -10,6 +10,7 @@ from wwpdb.apps.val_rel.utils.outputFiles import outputFiles
 from wwpdb.utils.message_queue.MessagePublisher import MessagePublisher
 from wwpdb.apps.val_rel.utils.FindAndProcessEntries import FindAndProcessEntries
 from wwpdb.apps.val_rel.utils.FindEntries import FindEntries
+from wwpdb.apps.val_rel.PrefetchRelease import PrefetchRelease
 
 logger = logging.getLogger(__name__)
 
@@ -20,7 +21,7 @@ class PopulateValidateRelease:
                  always_recalculate=False, skip_gzip=False, skip_emdb=False, validation_sub_dir='current',
                  pdb_release=False, emdb_release=False,
                  site_id=getSiteId(), nocache=False,
-                 priority=False, subscribe=None):
+                 priority=False, subscribe=None, prefetch=False):
         self.entry_list = entry_list
         self.entry_string = entry_string
         self.entry_file = entry_file
@@ -41,6 +42,7 @@ class PopulateValidateRelease:
         self.validation_sub_dir = validation_sub_dir
         self.priority_queue = priority
         self.subscribe = subscribe
+        self.prefetch = prefetch
         if self.priority_queue and self.subscribe:
             logger.critical('error - mixing of priority queues and subscriber queues')
             sys.exit()
@@ -69,8 +71,17 @@ class PopulateValidateRelease:
 
     def run_process(self):
         self.find_and_process_entries()
+        if self.prefetch:
+            self.prefetch_entries()
         self.process_messages()
 
+    def prefetch_entries(self):
+        """Downloads inputs of the entries found into the cache before consumers start"""
+        if self.__nocache:
+            logger.warning('prefetch requested without a cache - skipping')
+            return
+        PrefetchRelease(site_id=self.site_id).prefetch_messages(self.messages)
+
     def make_priorities(self):
         fe = FindEntries(siteID=self.site_id)
         # build lists of absolute input file paths and associated entries
@@ -287,6 +298,9 @@ def main():
     parser.add_argument(
         "--subscribe", help="Exchange name for optional subscriber rather than standard consumer", type=str, default=None
     )
+    parser.add_argument(
+        "--prefetch", help="download input files into the cache before publishing", action='store_true'
+    )
     args = parser.parse_args()
     logger.setLevel(args.loglevel)
 
@@ -303,7 +317,8 @@ def main():
                                   output_root=args.output_root,
                                   nocache=args.nocache,
                                   priority=args.priority,
-                                  subscribe=args.subscribe)
+                                  subscribe=args.subscribe,
+                                  prefetch=args.prefetch)
 
     if not args.test:
         pvr.run_process()
@@ -0,0 +1,126 @@
+import argparse
+import logging
+from concurrent.futures import ThreadPoolExecutor
+
+from wwpdb.utils.config.ConfigInfo import getSiteId
+
+from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+from wwpdb.apps.val_rel.utils.FindAndProcessEntries import FindAndProcessEntries
+from wwpdb.apps.val_rel.utils.TransferMetrics import get_transfer_metrics
+from wwpdb.apps.val_rel.utils.XmlInfo import XmlInfo
+from wwpdb.apps.val_rel.utils.getFilesRelease import getFilesRelease, PDB_PREFETCH_KINDS
+from wwpdb.apps.val_rel.utils.outputFiles import outputFiles
+
+logger = logging.getLogger(__name__)
+
+
+class PrefetchRelease:
+    """Downloads the input files of the entries found for release into the FTP cache, so that the
+    validation workers find them there rather than all fetching from the archive at once"""
+
+    def __init__(self, site_id=getSiteId(), workers=None):
+        self.site_id = site_id
+        vc = ValConfig(site_id)
+        self.workers = workers if workers else vc.release_prefetch_workers
+        self.__cache = outputFiles(siteID=site_id).get_ftp_cache_folder()
+
+    def prefetch_messages(self, messages):
+        """Warms the cache for the messages from FindAndProcessEntries.
+        Returns dictionary of entry id to prefetch manifest"""
+        entries = []
+        for message in messages:
+            if message.get("emdbID"):
+                entries.append((None, message["emdbID"]))
+            elif message.get("pdbID"):
+                entries.append((message["pdbID"], None))
+
+        results = {}
+        if not entries:
+            return results
+
+        logger.info("Prefetching %d entries with %d workers", len(entries), self.workers)
+        with get_transfer_metrics(self.site_id).collect() as release_metrics:
+            with ThreadPoolExecutor(max_workers=self.workers) as executor:
+                futures = [executor.submit(self.prefetch_entry, pdb_id, emdb_id) for pdb_id, emdb_id in entries]
+                for (pdb_id, emdb_id), future in zip(entries, futures):
+                    entry_id = emdb_id if emdb_id else pdb_id
+                    try:
+                        results[entry_id] = future.result()
+                    except:  # noqa: E722,BLE001
+                        logger.exception("ERROR prefetching %s", entry_id)
+                        results[entry_id] = {}
+        release_metrics.log_summary("Prefetch of %d entries" % len(entries))
+
+        missing = [entry_id for entry_id, manifest in results.items() if not any(manifest.values())]
+        logger.info("Prefetched %d entries, nothing found for %s", len(results), ",".join(missing))
+        return results
+
+    def prefetch_entry(self, pdb_id=None, emdb_id=None):
+        """Retrieves all candidate inputs of an entry - for an EMDB entry including the models
+        of the associated PDB entries.  Returns manifest of kind to file name"""
+        re = getFilesRelease(siteID=self.site_id, pdb_id=pdb_id, emdb_id=emdb_id, cache=self.__cache)
+        manifest = {}
+        try:
+            manifest.update(re.prefetch())
+            if emdb_id and manifest.get("emdb_xml"):
+                pdbids = XmlInfo(manifest["emdb_xml"]).get_pdbids_from_xml()
+                for pdbid in pdbids if pdbids else []:
+                    re.set_pdb_id(pdb_id=pdbid.lower())
+                    pdb_manifest = re.prefetch(list(PDB_PREFETCH_KINDS))
+                    for kind, file_name in pdb_manifest.items():
+                        manifest["%s_%s" % (pdbid.lower(), kind)] = file_name
+        finally:
+            re.close_connections()
+            re.remove_local_temp_files()
+        return manifest
+
+
+def main():
+    # Create logger -
+    logger = logging.getLogger()
+    FORMAT = '[%(asctime)s %(levelname)s]-%(module)s.%(funcName)s: %(message)s'
+    logging.basicConfig(format=FORMAT)
+
+    parser = argparse.ArgumentParser()
+    parser.add_argument(
+        "-d",
+        "--debug",
+        help="debugging",
+        action="store_const",
+        dest="loglevel",
+        const=logging.DEBUG,
+        default=logging.INFO,
+    )
+    parser.add_argument(
+        "--entry_list", help="comma separated list of entries", type=str
+    )
+    parser.add_argument(
+        "--entry_file", help="file containing list of entries - one per line", type=str
+    )
+    parser.add_argument(
+        "--pdb_release", help="prefetch PDB entries scheduled for release", action="store_true"
+    )
+    parser.add_argument(
+        "--emdb_release", help="prefetch EMDB entries scheduled for release", action="store_true"
+    )
+    parser.add_argument(
+        "--skip_emdb", help="skip emdb validation report calculation", action="store_true"
+    )
+    parser.add_argument("--siteID", help="siteID", type=str, default=getSiteId())
+    parser.add_argument("--workers", help="number of entries retrieved at the same time", type=int, default=None)
+    args = parser.parse_args()
+    logger.setLevel(args.loglevel)
+
+    fape = FindAndProcessEntries(entry_string=args.entry_list,
+                                 entry_file=args.entry_file,
+                                 pdb_release=args.pdb_release,
+                                 emdb_release=args.emdb_release,
+                                 site_id=args.siteID,
+                                 skip_emdb=args.skip_emdb)
+    fape.run_process()
+
+    PrefetchRelease(site_id=args.siteID, workers=args.workers).prefetch_messages(fape.get_found_entries())
+
+
+if "__main__" in __name__:
+    main()
@@ -11,14 +11,16 @@ from wwpdb.utils.config.ConfigInfo import getSiteId
 
 from wwpdb.apps.val_rel.config.ValConfig import ValConfig
 from wwpdb.apps.val_rel.utils.CutOffUtils import ok_to_copy, get_start_end_cut_off
-from wwpdb.apps.val_rel.utils.Files import gzip_file, remove_files, copy_file
+from wwpdb.apps.val_rel.utils.Files import gzip_file, remove_files, copy_file, materialize_file
+from wwpdb.apps.val_rel.utils.InputStaging import InputStaging
+from wwpdb.apps.val_rel.utils.TransferMetrics import get_transfer_metrics
 from wwpdb.apps.val_rel.utils.ValDataStore import ValDataStore
 from wwpdb.apps.val_rel.utils.ValidationRun import ValidationRun
 from wwpdb.apps.val_rel.utils.XmlInfo import XmlInfo
 from wwpdb.apps.val_rel.utils.checkModifications import already_run
 from wwpdb.apps.val_rel.utils.fileConversion import convert_cs_file
 from wwpdb.apps.val_rel.utils.getFilesRelease import getFilesRelease
-from wwpdb.apps.val_rel.utils.mmCIFInfo import mmCIFInfo, is_simple_modification
+from wwpdb.apps.val_rel.utils.mmCIFInfo import get_model_metadata, is_simple_modification
 from wwpdb.apps.val_rel.utils.outputFiles import outputFiles
 from wwpdb.utils.session.SessionManager import SessionManager
 
@@ -66,6 +68,8 @@ class runValidation:
         self.__always_recalculate = False
         self.__remove_validation_files = False
         self.__rel_files = None
+        # Decompressed inputs shared by all readers for the entry
+        self.__staging = None
 
         self.__statefolder = None
         self.__vds = None
@@ -77,6 +81,17 @@ class runValidation:
             self.__rel_files.close_connections()
         self.__rel_files = getFilesRelease(siteID=self.siteID, cache=self.__cachedir)
 
+    def __staged(self, path):
+        """Returns uncompressed copy of input file path, decompressing it only the first time"""
+        if not path:
+            return path
+        if self.__staging is None:
+            session_path = ValConfig(self.siteID).session_path
+            if not os.path.exists(session_path):
+                os.makedirs(session_path, exist_ok=True)
+            self.__staging = InputStaging(tempfile.mkdtemp(dir=session_path, prefix="%s_inputs_" % self.__entry_id))
+        return self.__staging.stage(path)
+
     def setOutputRoot(self, outdir):
         self.__outputRoot = outdir
         self.__alternativeOutputFolder = True
@@ -147,7 +162,7 @@ class runValidation:
             return True
         modified = False
         if not already_run(self.__modelPath, self.__pdb_output_folder):
-            if not is_simple_modification(self.__modelPath):
+            if not is_simple_modification(self.__modelPath, site_id=self.siteID):
                 modified = True
         if self.__sfPath:
             if self.__rel_files.is_sf_current():
@@ -245,15 +260,21 @@ class runValidation:
 
     def set_pdb_files(self):
         self.__rel_files.set_pdb_id(self.__pdbid)
-        self.set_model_file()
-        self.__sfPath = self.__rel_files.get_sf()
-        nmrDataPath = self.__rel_files.get_nmr_data()  # sets is_cs_current
+        # Retrieve all inputs at once - sets is_sf_current and is_cs_current
+        manifest = self.__rel_files.prefetch(["model", "sf", "nmr_data", "cs"])
+        self.__modelPath = manifest["model"]
+        self.__set_pdb_data_files(manifest)
+
+    def __set_pdb_data_files(self, manifest):
+        """Sets experimental data paths from prefetch manifest"""
+        self.__sfPath = manifest["sf"]
+        nmrDataPath = manifest["nmr_data"]
         self.__resPath = None
         if nmrDataPath:
             self.__csPath = nmrDataPath
             self.__resPath = self.__csPath
         else:
-            self.__csPath = self.__rel_files.get_cs()  # sets is_cs_current
+            self.__csPath = manifest["cs"]
 
     def set_xml_file(self):
         self.__rel_files.set_emdb_id(self.__emdbid)
@@ -261,8 +282,9 @@ class runValidation:
 
     def set_emdb_files(self):
         self.__rel_files.set_emdb_id(self.__emdbid)
-        self.set_xml_file()
-        self.__volPath = self.__rel_files.get_emdb_volume()
+        manifest = self.__rel_files.prefetch(["emdb_xml", "emdb_volume"])
+        self.__emXmlPath = manifest["emdb_xml"]
+        self.__volPath = manifest["emdb_volume"]
         logger.debug('xml path: {}'.format(self.__emXmlPath))
         logger.debug('EM vol path: {}'.format(self.__volPath))
 
@@ -283,6 +305,9 @@ class runValidation:
 
         if not onlyRunDir:
             self.__rel_files.remove_local_temp_files()
+            if self.__staging is not None:
+                self.__staging.remove()
+                self.__staging = None
         if self.__sessionPath is not None and not self.__keepLog and os.path.exists(self.__sessionPath):
             shutil.rmtree(self.__sessionPath)
 
@@ -290,6 +315,13 @@ class runValidation:
         """Process message and act on it.  This is the main entry point"""
 
         self.process_message(message)
+        with get_transfer_metrics(self.siteID).collect() as run_metrics:
+            ret = self.__run_process()
+        run_metrics.log_summary("Input files for %s" % self.__entry_id)
+        return ret
+
+    def __run_process(self):
+        """Acts on the message processed"""
         ret = self.set_entry_id()
         if not ret:
             self.__cleanup()
@@ -325,11 +357,10 @@ class runValidation:
         if self.__pdbid:
             self.set_pdb_files()
 
-            cf = mmCIFInfo(self.__modelPath)
-            exp_methods = cf.get_exp_methods()
-            if self.exptl_is_em(exp_methods) and not self.__skip_emdb:
+            metadata = get_model_metadata(self.__modelPath, site_id=self.siteID)
+            if self.exptl_is_em(metadata.exp_methods) and not self.__skip_emdb:
                 if not self.__emdbid:
-                    self.__emdbid = cf.get_associated_emdb()
+                    self.__emdbid = metadata.emdb_id
                     run_emdb.append(self.__emdbid)
                     run_emdb_and_pdbid.append(self.get_emdb_pdb_string())
 
@@ -426,7 +457,9 @@ class runValidation:
                         in_file = self.__output_file_dict[k]
                         em_in_file = emdb_output_file_dict[k]
                         if os.path.exists(in_file):
-                            shutil.copy(in_file, em_in_file)
+                            # Made by this run in the staging directory - linked under the EMDB name
+                            # only to be compressed or copied out
+                            materialize_file(in_file, em_in_file, link=True)
                 files_to_copy = emdb_output_file_dict.values()
                 if self.__skip_gzip:
                     self.__copy_output(filelist=files_to_copy, output_folder=__emdb_output_folder)
@@ -498,16 +531,8 @@ class runValidation:
                     self.__emXmlPath = self.__rel_files.get_emdb_xml()
             if self.__pdbid:
                 self.__rel_files.set_pdb_id(self.__pdbid)
-                self.__sfPath = self.__rel_files.get_sf()
-
-                nmrDataPath = self.__rel_files.get_nmr_data()  # sets is_cs_current
-                self.__resPath = None
-
-                if nmrDataPath:
-                    self.__csPath = nmrDataPath
-                    self.__resPath = self.__csPath
-                else:
-                    self.__csPath = self.__rel_files.get_cs()  # sets is_cs_current
+                # sets is_sf_current and is_cs_current
+                self.__set_pdb_data_files(self.__rel_files.prefetch(["sf", "nmr_data", "cs"]))
 
             # check if any input files have changed and set output folders
             is_modified = self.check_modified()
@@ -520,10 +545,10 @@ class runValidation:
 
             # get EMDB data from FTP to after check for modification
             if self.__emdbid:
-                logger.debug('getting EMDB volume')
-                self.__volPath = self.__rel_files.get_emdb_volume()
-                logger.debug('getting FSC')
-                self.__fscPath = self.__rel_files.get_emdb_fsc()
+                logger.debug('getting EMDB volume and FSC')
+                manifest = self.__rel_files.prefetch(["emdb_volume", "emdb_fsc"])
+                self.__volPath = manifest["emdb_volume"]
+                self.__fscPath = manifest["emdb_fsc"]
 
             # worked = False
             sm = SessionManager(topPath=ValConfig(self.siteID).top_session_path)
@@ -544,7 +569,8 @@ class runValidation:
             csPath = None
             resPath = None
             if self.__csPath:  # CS or nmr-data
-                csPath = convert_cs_file(entry_id=self.__entry_id, cs_file=self.__csPath, model_file=self.__modelPath, working_dir=sessTempDir)
+                csPath = convert_cs_file(entry_id=self.__entry_id, cs_file=self.__staged(self.__csPath),
+                                         model_file=self.__staged(self.__modelPath), working_dir=sessTempDir)
                 if not csPath:
                     logger.error('CS star to cif conversion failed')
                     self.__sds.setValidationRunning(False)
@@ -588,8 +614,8 @@ class runValidation:
             logger.info("emdb_id: %s", self.__emdbid)
 
             data_dict = {
-                "model": self.__modelPath,
-                "sf": self.__sfPath,
+                "model": self.__staged(self.__modelPath),
+                "sf": self.__staged(self.__sfPath),
                 "cs": csPath,
                 "res": resPath,
                 "emvol": self.__volPath,
@@ -31,6 +31,46 @@ class ValConfig(object):
         self.retries = 3
         self.backoff_factor = 15
         self.status_force_list = [429, 500, 502, 503, 504]
+        # keep-alive connection pool sizes for the shared http session
+        self.http_pool_connections = int(self.__cI.get('VAL_REL_HTTP_POOL_CONNECTIONS', 10))
+        self.http_pool_maxsize = int(self.__cI.get('VAL_REL_HTTP_POOL_MAXSIZE', 10))
+        # number of idle logged in ftp connections kept per server for reuse
+        self.ftp_pool_maxsize = int(self.__cI.get('VAL_REL_FTP_POOL_MAXSIZE', 8))
+        # seconds an ftp connection may be idle before it is checked with a NOOP - otherwise a lost connection
+        # is replaced when the next command fails
+        self.ftp_idle_check = int(self.__cI.get('VAL_REL_FTP_IDLE_CHECK_SECONDS', 60))
+        # transfers from a server at once by all consumers on the node, of which transfer_small_slots are only
+        # used for small files, and their combined rate in bytes/s (0 for no limit)
+        self.transfer_max_per_server = int(self.__cI.get('VAL_REL_TRANSFER_MAX_PER_SERVER', 8))
+        self.transfer_small_slots = int(self.__cI.get('VAL_REL_TRANSFER_SMALL_SLOTS', 2))
+        self.transfer_max_bytes_per_second = int(self.__cI.get('VAL_REL_TRANSFER_MAX_BYTES_PER_SECOND', 0))
+        # node local directory for the transfer slot locks shared between consumers - transfers are not limited if unset
+        self.transfer_lock_dir = self.__cI.get('VAL_REL_TRANSFER_LOCK_DIR', None)
+        # seconds between latency probes of the archive mirrors, and that a failed mirror is only tried last
+        self.mirror_probe_interval = int(self.__cI.get('VAL_REL_MIRROR_PROBE_SECONDS', 600))
+        self.mirror_failure_cooldown = int(self.__cI.get('VAL_REL_MIRROR_FAILURE_SECONDS', 300))
+        # directory model file metadata is kept in for other processes - shared by the consumers, unset to disable
+        self.metadata_cache_dir = self.__cI.get('VAL_REL_METADATA_CACHE_DIR', None)
+        # file per-fetch metrics are appended to as json lines - may be shared by the consumers of a release
+        self.metrics_file = self.__cI.get('VAL_REL_METRICS_FILE', None)
+        # bytes held in memory at a time when streaming a download to disk
+        self.http_chunk_size = 1024 * 1024
+        # number of times an interrupted transfer is continued from the last byte received
+        self.resume_retries = 5
+        # number of an entry's input files downloaded concurrently
+        self.prefetch_workers = int(self.__cI.get('VAL_REL_PREFETCH_WORKERS', 4))
+        # number of remote transfers in flight at once when fetching asynchronously
+        self.remote_max_in_flight = int(self.__cI.get('VAL_REL_REMOTE_MAX_IN_FLIGHT', 16))
+        # number of entries downloaded concurrently when warming the cache for a release
+        self.release_prefetch_workers = int(self.__cI.get('VAL_REL_RELEASE_PREFETCH_WORKERS', 4))
+        # download cache size limit in bytes and days since last use before files are evicted
+        self.cache_max_bytes = int(self.__cI.get('VAL_REL_CACHE_MAX_BYTES', 200 * 1024 ** 3))
+        self.cache_ttl = int(self.__cI.get('VAL_REL_CACHE_TTL_DAYS', 28)) * 24 * 60 * 60
+        # seconds a cached file is trusted before checking it is still the archive version - 0 always checks.
+        # The archive is updated weekly, so a few hours covers a release run without a check per use
+        self.cache_revalidate_interval = int(self.__cI.get('VAL_REL_CACHE_REVALIDATE_SECONDS', 6 * 60 * 60))
+        # seconds a file the archive does not have is reported missing before asking the server again
+        self.negative_cache_ttl = int(self.__cI.get('VAL_REL_NEGATIVE_CACHE_HOURS', 12)) * 60 * 60
         # interval in seconds
         self._email_interval = 60 * 60 * 24
         # max number of emails per recipient within the interval
@@ -64,6 +104,14 @@ class ValConfig(object):
         server = self.__cI.get('SITE_FTP_SERVER') if self.__cI.get('SITE_FTP_SERVER') else 'ftp.wwpdb.org'
         return server
 
+    @property
+    def http_mirrors(self):
+        """Returns list of other servers with the archive - base urls or host[/prefix] using the scheme and prefix of http_server"""
+        mirrors = self.__cI.get('VAL_REL_HTTP_MIRRORS', None)
+        if not mirrors:
+            return []
+        return [m.strip() for m in mirrors.split(",") if m.strip()]
+
     @property
     def http_prefix(self):
         prefix = self.__cI.get('SITE_HTTP_SERVER_PREFIX', '/pub')
@@ -0,0 +1,99 @@
+##
+# File:  AsyncRemoteFiles.py
+#
+# asyncio access to the remote archive
+##
+"""
+ Provides the get_url/get_file/is_file interface of GetRemoteFilesHttp and GetRemoteFiles as
+ coroutines, so that many transfers can be in flight at once.
+
+ The transfers themselves are made by the existing fetchers on a bounded pool of threads -
+ retries, resume, caching and connection pooling behave as for synchronous use.  For http a
+ single GetRemoteFilesHttp is shared, as its keep-alive session pool is thread safe.  An ftp
+ connection carries state, so each thread has its own GetRemoteFiles with a pooled connection.
+"""
+import asyncio
+import contextvars
+import logging
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+from wwpdb.apps.val_rel.utils.getRemoteFilesFTP import GetRemoteFiles
+from wwpdb.apps.val_rel.utils.http_protocol.getRemoteFilesHTTP import GetRemoteFilesHttp
+
+logger = logging.getLogger(__name__)
+
+
+class AsyncRemoteFiles(object):
+    def __init__(self, server=None, cache=None, site_id=None, max_in_flight=None, remote=None):
+        """max_in_flight - number of transfers made at the same time
+           remote - existing GetRemoteFilesHttp to use, otherwise one is created for the configured protocol
+        """
+        vc = ValConfig(site_id=site_id)
+        self.__site_id = site_id
+        self.__cache = cache
+        self.__max_in_flight = max_in_flight if max_in_flight else vc.remote_max_in_flight
+        self.__shared = remote
+        self.__server = server
+        self.__ftp_server = None
+        if remote is None and vc.val_rel_protocol == "ftp":
+            self.__ftp_server = server if server else vc.ftp_server
+        self.__local = threading.local()
+        self.__ftp_remotes = []
+        self.__lock = threading.Lock()
+        self.__executor = ThreadPoolExecutor(max_workers=self.__max_in_flight, thread_name_prefix="remote")
+
+    def __get_remote(self):
+        """Returns the fetcher for the calling thread - created on first use, as run() needs none"""
+        if self.__ftp_server is None:
+            with self.__lock:
+                if self.__shared is None:
+                    self.__shared = GetRemoteFilesHttp(server=self.__server, cache=self.__cache, site_id=self.__site_id)
+            return self.__shared
+        remote = getattr(self.__local, "remote", None)
+        if remote is None:
+            remote = GetRemoteFiles(self.__ftp_server, cache=self.__cache, site_id=self.__site_id)
+            self.__local.remote = remote
+            with self.__lock:
+                self.__ftp_remotes.append(remote)
+        return remote
+
+    def __call(self, name, args, kwargs):
+        return getattr(self.__get_remote(), name)(*args, **kwargs)
+
+    async def run(self, func, *args):
+        """Runs blocking func(*args) on the transfer threads - for work made up of several transfers.
+        As asyncio.to_thread, func runs in the caller's context so transfer metrics are attributed to its fetch"""
+        ctx = contextvars.copy_context()
+        return await asyncio.get_running_loop().run_in_executor(self.__executor, ctx.run, func, *args)
+
+    async def get_url(self, *args, **kwargs):
+        """As get_url of the protocol's fetcher"""
+        return await self.run(self.__call, "get_url", args, kwargs)
+
+    async def get_file(self, *args, **kwargs):
+        """As get_file of the protocol's fetcher"""
+        return await self.run(self.__call, "get_file", args, kwargs)
+
+    async def is_file(self, *args, **kwargs):
+        """As is_file of the protocol's fetcher"""
+        return await self.run(self.__call, "is_file", args, kwargs)
+
+    def gather(self, coroutines):
+        """Runs coroutines from this object to completion from synchronous code.  Returns their results
+        in order - an exception raised by one is returned in its place.  Must not be called from a coroutine"""
+
+        async def run_all():
+            return await asyncio.gather(*coroutines, return_exceptions=True)
+
+        return asyncio.run(run_all())
+
+    def close(self):
+        """Stops the transfer threads and returns their ftp connections to the pool"""
+        self.__executor.shutdown(wait=True)
+        with self.__lock:
+            remotes = self.__ftp_remotes
+            self.__ftp_remotes = []
+        for remote in remotes:
+            remote.disconnect()
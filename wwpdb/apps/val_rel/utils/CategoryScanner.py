@@ -0,0 +1,102 @@
+##
+# File:  CategoryScanner.py
+#
+# Reads selected categories of an mmCIF file without tokenizing the rest
+##
+"""
+ Model files are dominated by their coordinates, and reading a few header categories through
+ IoAdapterCore still tokenizes the whole (often compressed) file.  scan_categories() streams the
+ file line by line, keeping only the lines of the categories asked for, and stops as soon as
+ all of them have been seen or a stop_at category - such as atom_site - is reached.  Only the
+ kept text is parsed.
+
+ Lines are classified on their first non-blank character, honouring ';' text fields, so a data
+ name inside a text field is not taken as the start of a category.  Only the first data block of
+ the file is read.
+"""
+import io
+import logging
+
+from mmcif.io.PdbxReader import PdbxReader
+
+from wwpdb.apps.val_rel.utils.InputStaging import OPENERS
+
+logger = logging.getLogger(__name__)
+
+
+def _open(path):
+    for ext, opener in OPENERS.items():
+        if path.endswith(ext):
+            return opener(path, "rt", encoding="utf-8", errors="replace")
+    return open(path, "r", encoding="utf-8", errors="replace")
+
+
+def _category(line):
+    """Returns the category of the data name starting line"""
+    return line.split(None, 1)[0].split(".", 1)[0][1:].lower()
+
+
+def scan_categories(path, categories, stop_at=None):
+    """Returns the text of the first data block of path holding only categories.  Reading stops once all of
+    categories are found or at the first category in stop_at - categories after it are not returned"""
+    wanted = set(c.lower() for c in categories)
+    stop_at = set(c.lower() for c in stop_at) if stop_at else set()
+    kept = []
+    found = set()
+    current = None
+    capture = False
+    in_text = False
+    loop_line = None
+    with _open(path) as fin:
+        for line in fin:
+            if in_text:
+                if capture:
+                    kept.append(line)
+                if line.startswith(";"):
+                    in_text = False
+                continue
+            if line.startswith(";"):
+                in_text = True
+                if capture:
+                    kept.append(line)
+                continue
+            stripped = line.lstrip()
+            first = stripped[:1]
+            if first == "_":
+                category = _category(stripped)
+                if category != current:
+                    if capture:
+                        found.add(current)
+                        if found >= wanted:
+                            break
+                    if category in stop_at:
+                        break
+                    current = category
+                    capture = category in wanted
+                    if capture and loop_line is not None:
+                        kept.append(loop_line)
+                loop_line = None
+            elif first in ("l", "L") and stripped[:5].lower() == "loop_":
+                loop_line = line
+                continue
+            elif first in ("d", "D") and stripped[:5].lower() == "data_":
+                if kept or current is not None:
+                    # Next data block
+                    break
+                kept.append(line)
+                continue
+            if capture:
+                kept.append(line)
+    if kept and not kept[0].lstrip().lower().startswith("data_"):
+        kept.insert(0, "data_unnamed\n")
+    return "".join(kept)
+
+
+def read_categories(path, categories, stop_at=None):
+    """Returns a DataContainer of the categories of path found by scan_categories()"""
+    text = scan_categories(path, categories, stop_at=stop_at)
+    containers = []
+    PdbxReader(io.StringIO(text)).read(containers)
+    if not containers:
+        raise ValueError("No data block in %s" % path)
+    return containers[0]
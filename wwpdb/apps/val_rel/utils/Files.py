@@ -1,12 +1,18 @@
 # Simple utilities for workign with files.
 
+import errno
+import fcntl
 import gzip
 import logging
 import os
 import shutil
+import tempfile
 
 logger = logging.getLogger(__name__)
 
+# ioctl cloning a whole file into another on copy on write filesystems (FICLONE in linux/fs.h)
+FICLONE = 0x40049409
+
 
 def get_gzip_name(f):
     """Returns compressed filename"""
@@ -36,11 +42,102 @@ def copy_file(in_file, output_folder):
             output_file = os.path.join(output_folder, input_filename)
             if not os.path.exists(output_folder):
                 os.makedirs(output_folder)
-            shutil.copy(in_file, output_file)
+            materialize_file(in_file, output_file)
             return True
     return False
 
 
+def makedirs_shared(path):
+    """Creates directory path and missing parents for the consumers of a site, which may run as different users
+    of one group.  They are writable by the group only, and new files in them take the directory's group.
+    Existing directories are left as they are"""
+    parent = os.path.dirname(os.path.abspath(path))
+    if not os.path.isdir(parent):
+        makedirs_shared(parent)
+    try:
+        os.mkdir(path)
+    except FileExistsError:
+        return
+    # Not limited by the umask
+    os.chmod(path, 0o2770)
+
+
+def open_shared(path, flags=os.O_RDWR):
+    """Opens path, creating it readable and writable by the group if missing.  Returns file descriptor"""
+    fd = os.open(path, flags | os.O_CREAT, 0o660)
+    try:
+        if os.fstat(fd).st_mode & 0o660 != 0o660:
+            os.fchmod(fd, 0o660)
+    except OSError:
+        # Created by another user
+        pass
+    return fd
+
+
+def reflink_file(in_file, output_file):
+    """Creates output_file sharing the data blocks of in_file - nothing is written until either is modified.
+    Returns False if the filesystem does not support this or they are on different filesystems"""
+    try:
+        with open(in_file, "rb") as fin, open(output_file, "wb") as fout:
+            fcntl.ioctl(fout.fileno(), FICLONE, fin.fileno())
+    except (IOError, OSError) as e:
+        if e.errno in (errno.ENOENT, errno.EACCES):
+            raise
+        if os.path.exists(output_file):
+            os.unlink(output_file)
+        return False
+    return True
+
+
+def materialize_file(in_file, output_file, link=False, move=False):
+    """Makes output_file with the contents of in_file, writing as little data to disk as possible.
+    Any existing output_file is replaced.
+
+    move - in_file is renamed to output_file, or moved if on another filesystem
+    link - output_file may be a hard link to in_file.  Only for files that are not modified in place.  Not
+           used if in_file is a symlink, such as to the file cache, as the link would be to the file it points to
+    Otherwise in_file is reflinked where the filesystem supports it, else copied.
+    Returns how the file was made - "rename", "link", "reflink" or "copy"
+    """
+    if move:
+        try:
+            os.replace(in_file, output_file)
+            return "rename"
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+
+    # Prepared next to output_file and renamed over it
+    fd, tmp = tempfile.mkstemp(dir=os.path.dirname(os.path.abspath(output_file)), prefix=".tmp_")
+    os.close(fd)
+    try:
+        method = None
+        if link and not os.path.islink(in_file):
+            os.unlink(tmp)
+            try:
+                os.link(in_file, tmp)
+                method = "link"
+            except OSError as e:
+                if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                    raise
+        if method is None and reflink_file(in_file, tmp):
+            method = "reflink"
+        if method is None:
+            shutil.copyfile(in_file, tmp)
+            method = "copy"
+        if method != "link":
+            shutil.copymode(in_file, tmp)
+        os.replace(tmp, output_file)
+    finally:
+        if os.path.lexists(tmp):
+            os.unlink(tmp)
+    if move:
+        # Another filesystem - copied
+        os.unlink(in_file)
+    logger.debug("%s %s to %s", method, in_file, output_file)
+    return method
+
+
 def remove_files(file_list):
     """Removes a list of files if present"""
     if file_list:
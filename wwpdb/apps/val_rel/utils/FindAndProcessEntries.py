@@ -4,10 +4,11 @@ import os
 
 from wwpdb.utils.config.ConfigInfo import getSiteId
 
+from wwpdb.apps.val_rel.utils.AsyncRemoteFiles import AsyncRemoteFiles
 from wwpdb.apps.val_rel.utils.FindEntries import FindEntries
 from wwpdb.apps.val_rel.utils.XmlInfo import XmlInfo
 from wwpdb.apps.val_rel.utils.getFilesRelease import getFilesRelease
-from wwpdb.apps.val_rel.utils.mmCIFInfo import mmCIFInfo
+from wwpdb.apps.val_rel.utils.mmCIFInfo import get_model_metadata
 from wwpdb.apps.val_rel.utils.outputFiles import outputFiles
 
 logger = logging.getLogger(__name__)
@@ -90,51 +91,76 @@ class FindAndProcessEntries:
                 self.pdb_entries.append(entry)
 
     def process_emdb_entries(self):
+        # stop duplication of making EM validation reports twice
+        emdb_entries = []
         for emdb_entry in self.emdb_entries:
-            if emdb_entry not in self.added_entries:
-                # stop duplication of making EM validation reports twice
-                logger.debug(emdb_entry)
-                try:
-                    re = getFilesRelease(siteID=self.site_id, emdb_id=emdb_entry, pdb_id=None,
-                                         cache=self.__cache)
-                    em_xml = re.get_emdb_xml()
-
-                    em_vol = re.get_emdb_volume()
-                    if em_vol:
-                        logger.debug('using XML: %s', em_xml)
-                        pdbids = XmlInfo(em_xml).get_pdbids_from_xml()
-                        if pdbids:
-                            logger.info(
-                                "PDB entries associated with %s: %s", emdb_entry, ",".join(pdbids)
-                            )
-                            for pdbid in pdbids:
-                                pdbid = pdbid.lower()
-                                re.set_pdb_id(pdb_id=pdbid)
-                                pdb_file = re.get_model()
-                                if pdb_file:
-                                    cf = mmCIFInfo(pdb_file)
-                                    associated_emdb = cf.get_associated_emdb()
-                                    if associated_emdb == emdb_entry:
-                                        if pdbid in self.pdb_entries:
-                                            logger.info(
-                                                "removing %s from the PDB queue to stop duplication of report generation",
-                                                pdbid
-                                            )
-                                            self.pdb_entries.remove(pdbid)
-                                        else:
-                                            self.all_pdb_entries.add(pdbid)
-                                    # what if its not? should it be added to the queue?
-                                else:
-                                    if pdbid in self.pdb_entries:
-                                        logger.info('removing %s as pdb file does not exist', pdbid)
-                                        self.pdb_entries.remove(pdbid)
-
-                        message = {"emdbID": emdb_entry}
-                        self.messages.append(message)
-                        self.added_entries.append(emdb_entry)
-                    re.remove_local_temp_files()
-                except:  # noqa: E722,BLE001
-                    logger.exception("ERROR processing %s", emdb_entry)
+            if emdb_entry not in self.added_entries and emdb_entry not in emdb_entries:
+                emdb_entries.append(emdb_entry)
+        if not emdb_entries:
+            return
+
+        # Entries are checked concurrently, the queue is then updated in order
+        engine = AsyncRemoteFiles(cache=self.__cache, site_id=self.site_id)
+        try:
+            results = engine.gather([engine.run(self.__check_emdb_entry, emdb_entry) for emdb_entry in emdb_entries])
+        finally:
+            engine.close()
+
+        for emdb_entry, result in zip(emdb_entries, results):
+            if isinstance(result, Exception):
+                logger.error("ERROR processing %s", emdb_entry, exc_info=result)
+                continue
+            if result is None:
+                continue
+            for pdbid, associated in result:
+                if associated is None:
+                    if pdbid in self.pdb_entries:
+                        logger.info('removing %s as pdb file does not exist', pdbid)
+                        self.pdb_entries.remove(pdbid)
+                elif associated:
+                    if pdbid in self.pdb_entries:
+                        logger.info(
+                            "removing %s from the PDB queue to stop duplication of report generation",
+                            pdbid
+                        )
+                        self.pdb_entries.remove(pdbid)
+                    else:
+                        self.all_pdb_entries.add(pdbid)
+                # what if its not? should it be added to the queue?
+
+            message = {"emdbID": emdb_entry}
+            self.messages.append(message)
+            self.added_entries.append(emdb_entry)
+
+    def __check_emdb_entry(self, emdb_entry):
+        """Checks the volume of an EMDB entry exists and retrieves its header and models.  Returns None if there
+        is no volume, otherwise a list of (pdbid, True if the model is associated with emdb_entry or None if
+        there is no model).  The volume itself is only retrieved to make the report"""
+        logger.debug(emdb_entry)
+        re = getFilesRelease(siteID=self.site_id, emdb_id=emdb_entry, pdb_id=None,
+                             cache=self.__cache)
+        try:
+            if not re.has_emdb_volume():
+                return None
+            em_xml = re.get_emdb_xml()
+            logger.debug('using XML: %s', em_xml)
+            models = []
+            pdbids = XmlInfo(em_xml).get_pdbids_from_xml()
+            if pdbids:
+                logger.info(
+                    "PDB entries associated with %s: %s", emdb_entry, ",".join(pdbids)
+                )
+                for pdbid in pdbids:
+                    pdbid = pdbid.lower()
+                    re.set_pdb_id(pdb_id=pdbid)
+                    pdb_file = re.get_model()
+                    if pdb_file:
+                        models.append((pdbid, get_model_metadata(pdb_file, site_id=self.site_id).emdb_id == emdb_entry))
+                    else:
+                        models.append((pdbid, None))
+            return models
+        finally:
+            re.remove_local_temp_files()
 
     def process_pdb_entries(self):
         for pdb_entry in self.pdb_entries:
@@ -0,0 +1,156 @@
+##
+# File:  FtpConnectionPool.py
+#
+# Process wide pool of logged in ftp connections
+##
+"""
+ Provides logged in ftp connections per server that are shared between all GetRemoteFiles
+ objects in a process, so that a consumer working through a queue does not connect and
+ login for every entry.
+
+ A connection is used by one GetRemoteFiles at a time - it is handed out by acquire() and
+ returned by release(), or closed by discard() if a transfer on it failed.  Connections are kept
+ in binary mode, and those returned are put back in the login directory and checked to still be
+ alive before being handed out again.
+ Pooled connections are not used after a fork as sockets cannot be shared between processes.
+ Idle connections are closed when the process exits.
+"""
+import atexit
+import ftplib
+import logging
+import os
+import threading
+import time
+
+logger = logging.getLogger(__name__)
+
+_pool_lock = threading.Lock()
+_pools = {}
+
+
+class FtpConnectionPool(object):
+    def __init__(self, server, maxsize=8):
+        """maxsize - number of idle connections kept"""
+        self.__server = server
+        self.__maxsize = maxsize
+        # Idle connections as (ftp, login directory)
+        self.__idle = []
+        self.__homes = {}
+        self.__pid = os.getpid()
+        self.__lock = threading.Lock()
+
+    def __connect(self):
+        """Connects and logs in to server with retry"""
+
+        retry = 0
+        sleep = 2
+
+        while 1:
+            try:
+                ftp = ftplib.FTP(self.__server)
+                break
+            except ftplib.error_temp as e:
+                ecode = str(e)[:3]
+                if ecode == "421":
+                    if retry > 7:
+                        raise
+                    logger.error("Remote resource unavailable - sleep %s and retry %s", sleep, str(e))
+                    time.sleep(sleep)
+                    retry += 1
+                    sleep *= 2
+                    continue
+                raise
+        ftp.login()
+        # Binary mode for the life of the connection - SIZE is refused in ASCII mode by some servers
+        ftp.voidcmd("TYPE I")
+        try:
+            home = ftp.pwd()
+        except ftplib.all_errors:
+            home = None
+        logger.debug("Opened ftp connection to %s", self.__server)
+        return ftp, home
+
+    @staticmethod
+    def __close(ftp):
+        try:
+            ftp.close()
+        except Exception:
+            pass
+
+    def acquire(self):
+        """Returns a logged in connection in its login directory - an idle one if still alive, else a new one"""
+        while True:
+            with self.__lock:
+                if self.__pid != os.getpid():
+                    # Inherited from parent - leave its sockets alone
+                    self.__idle = []
+                    self.__homes = {}
+                    self.__pid = os.getpid()
+                if not self.__idle:
+                    break
+                ftp, home = self.__idle.pop()
+            try:
+                # Returns to the login directory and shows the connection is alive in one round trip
+                if home:
+                    ftp.cwd(home)
+                else:
+                    ftp.voidcmd("NOOP")
+            except ftplib.all_errors as e:
+                logger.debug("Discarding stale ftp connection to %s: %s", self.__server, e)
+                self.__close(ftp)
+                continue
+            with self.__lock:
+                self.__homes[id(ftp)] = home
+            return ftp
+
+        ftp, home = self.__connect()
+        with self.__lock:
+            self.__homes[id(ftp)] = home
+        return ftp
+
+    def release(self, ftp):
+        """Returns connection from acquire() for reuse.  Only for a connection whose last command completed -
+        one left part way through a transfer goes to discard()"""
+        with self.__lock:
+            if id(ftp) in self.__homes and self.__pid == os.getpid() and len(self.__idle) < self.__maxsize:
+                self.__idle.append((ftp, self.__homes.pop(id(ftp))))
+                return
+            self.__homes.pop(id(ftp), None)
+        self.discard(ftp)
+
+    def discard(self, ftp):
+        """Closes a connection from acquire() that is broken or not wanted back"""
+        with self.__lock:
+            self.__homes.pop(id(ftp), None)
+        try:
+            ftp.quit()
+        except Exception:
+            self.__close(ftp)
+
+    def close(self):
+        """Closes the idle connections"""
+        with self.__lock:
+            idle = self.__idle if self.__pid == os.getpid() else []
+            self.__idle = []
+        for ftp, _home in idle:
+            self.discard(ftp)
+
+
+def get_connection_pool(server, maxsize=8):
+    """Returns the process wide connection pool for server"""
+    with _pool_lock:
+        pool = _pools.get(server)
+        if pool is None:
+            pool = FtpConnectionPool(server, maxsize=maxsize)
+            _pools[server] = pool
+        return pool
+
+
+def close_connection_pools():
+    """Closes all pooled connections in this process"""
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.close()
+
+
+atexit.register(close_connection_pools)
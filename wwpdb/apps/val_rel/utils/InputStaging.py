@@ -0,0 +1,105 @@
+##
+# File:  InputStaging.py
+#
+# Decompressed copies of input files for a run
+##
+"""
+ Archive files arrive compressed (.cif.gz), and the mmCIF reader, the star to cif conversion
+ and the validator each decompress them again on every read.  InputStaging decompresses an
+ input once, streaming it into the staging directory, and hands out the staged copy to all
+ readers for the rest of the run.
+
+ Staged files keep the modification time of their source.  A json manifest in the staging
+ directory records the source, size and modification time each staged file was made from - a
+ source that has changed since is staged again.
+"""
+import bz2
+import gzip
+import hashlib
+import json
+import logging
+import os
+import shutil
+import tempfile
+
+logger = logging.getLogger(__name__)
+
+# Decompressors by file extension
+OPENERS = {".gz": gzip.open, ".bz2": bz2.open}
+MANIFEST = "manifest.json"
+
+
+class InputStaging(object):
+    def __init__(self, staging_dir):
+        self.__staging_dir = staging_dir
+        self.__manifest_path = os.path.join(staging_dir, MANIFEST)
+        self.__manifest = None
+
+    @property
+    def staging_dir(self):
+        return self.__staging_dir
+
+    def __load(self):
+        if self.__manifest is None:
+            self.__manifest = {}
+            if os.path.exists(self.__manifest_path):
+                try:
+                    with open(self.__manifest_path, "r") as fin:
+                        self.__manifest = json.load(fin)
+                except ValueError:
+                    logger.warning("Ignoring corrupt %s", self.__manifest_path)
+        return self.__manifest
+
+    def __save(self):
+        fd, tmp = tempfile.mkstemp(dir=self.__staging_dir, prefix=".tmp_")
+        with os.fdopen(fd, "w") as fout:
+            json.dump(self.__manifest, fout, indent=1)
+        os.replace(tmp, self.__manifest_path)
+
+    def get_manifest(self):
+        """Returns dictionary of source path to its staged path, size and mtime"""
+        return dict(self.__load())
+
+    def stage(self, path):
+        """Returns path of an uncompressed copy of path - path itself if not compressed, or on failure"""
+        if not path:
+            return path
+        base, ext = os.path.splitext(path)
+        opener = OPENERS.get(ext)
+        if opener is None or not os.path.exists(path):
+            return path
+
+        source = os.path.realpath(path)
+        st = os.stat(source)
+        manifest = self.__load()
+        entry = manifest.get(source)
+        if entry and entry["size"] == st.st_size and entry["mtime"] == st.st_mtime and os.path.exists(entry["staged"]):
+            return entry["staged"]
+
+        digest = hashlib.md5(source.encode("utf-8")).hexdigest()[:8]  # noqa: S324
+        staged = os.path.join(self.__staging_dir, "%s_%s" % (digest, os.path.basename(base)))
+        try:
+            if not os.path.exists(self.__staging_dir):
+                os.makedirs(self.__staging_dir, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=self.__staging_dir, prefix=".tmp_")
+            try:
+                with opener(source, "rb") as fin, os.fdopen(fd, "wb") as fout:
+                    shutil.copyfileobj(fin, fout, 1024 * 1024)
+                os.utime(tmp, (st.st_atime, st.st_mtime))
+                os.replace(tmp, staged)
+            finally:
+                if os.path.exists(tmp):
+                    os.unlink(tmp)
+        except (IOError, OSError, EOFError) as e:
+            logger.error("Unable to decompress %s: %s", path, e)
+            return path
+
+        logger.debug("Staged %s as %s", path, staged)
+        manifest[source] = {"staged": staged, "size": st.st_size, "mtime": st.st_mtime}
+        self.__save()
+        return staged
+
+    def remove(self):
+        """Removes the staged files"""
+        self.__manifest = None
+        shutil.rmtree(self.__staging_dir, ignore_errors=True)
@@ -0,0 +1,181 @@
+##
+# File:  MetadataCache.py
+#
+# Model file metadata kept on disk between processes
+##
+"""
+ The same model files are inspected by FindAndProcessEntries, every consumer's runValidation,
+ CheckResult and FindExcessEntries during a release cycle.  MetadataCache keeps the metadata
+ extracted from each file (see mmCIFInfo.get_model_metadata) as a small json entry, so that
+ the other processes reuse it rather than reading the file again.
+
+ An entry is named by a hash of the file's real path and records the size and modification
+ time the metadata was read from - a file that has changed since is read again.  Entries are
+ replaced atomically, so no lock is needed.  The entry's own mtime records its last use, and
+ entries not used for ttl seconds are removed by evict(), run at most every EVICT_INTERVAL.
+
+ Entries decide whether a report is regenerated, so the cache is only used when a directory is
+ configured for the site.  Directories are created writable by the group of consumers only.  A
+ cache directory writable by all users is not used, and only entries owned by this user or the
+ owner of the cache directory are trusted.
+"""
+import hashlib
+import json
+import logging
+import os
+import stat
+import tempfile
+import threading
+import time
+
+from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+from wwpdb.apps.val_rel.utils.Files import makedirs_shared, open_shared
+
+logger = logging.getLogger(__name__)
+
+# Changed when the metadata extracted changes, so older entries are not used
+METADATA_VERSION = 3
+
+_cache_lock = threading.Lock()
+_caches = {}
+
+
+class MetadataCache(object):
+    # Seconds between eviction scans
+    EVICT_INTERVAL = 60 * 60
+
+    def __init__(self, cache_dir, ttl=None):
+        """ttl - seconds after last use when an entry is removed"""
+        self.__cache_dir = cache_dir
+        self.__ttl = ttl
+        # Owners whose entries are trusted - set once the cache directory is checked
+        self.__owners = None
+
+    def __usable(self):
+        """Returns True if the cache directory, created if missing, is not writable by all users"""
+        if self.__owners is None:
+            try:
+                if not os.path.exists(self.__cache_dir):
+                    makedirs_shared(self.__cache_dir)
+                st = os.stat(self.__cache_dir)
+            except OSError as e:
+                logger.warning("Unable to use metadata cache %s: %s", self.__cache_dir, e)
+                self.__owners = frozenset()
+                return False
+            if st.st_mode & stat.S_IWOTH:
+                logger.warning("Not using metadata cache %s as it is writable by all users", self.__cache_dir)
+                self.__owners = frozenset()
+            else:
+                self.__owners = frozenset([os.getuid(), st.st_uid])
+        return bool(self.__owners)
+
+    def __trusted(self, st):
+        """Returns True if the entry with stat result st was written by a trusted user"""
+        return st.st_uid in self.__owners and not st.st_mode & stat.S_IWOTH
+
+    @staticmethod
+    def __identity(path):
+        """Returns (real path, size, mtime in ns) of path"""
+        st = os.stat(path)
+        return os.path.realpath(path), st.st_size, st.st_mtime_ns
+
+    def __entry_path(self, realpath):
+        key = hashlib.md5(realpath.encode("utf-8")).hexdigest()  # noqa: S324
+        return os.path.join(self.__cache_dir, key[:2], key + ".json")
+
+    def get(self, path):
+        """Returns metadata dictionary stored for the current contents of path, or None"""
+        if not self.__usable():
+            return None
+        try:
+            realpath, size, mtime = self.__identity(path)
+            entry_path = self.__entry_path(realpath)
+            with open(entry_path, "r") as fin:
+                if not self.__trusted(os.fstat(fin.fileno())):
+                    logger.warning("Ignoring metadata entry %s not written by a consumer", entry_path)
+                    return None
+                entry = json.load(fin)
+        except (IOError, OSError, ValueError):
+            return None
+        if entry.get("version") != METADATA_VERSION or entry.get("path") != realpath or \
+                entry.get("size") != size or entry.get("mtime") != mtime:
+            return None
+        try:
+            # Records the use for eviction
+            os.utime(entry_path, None)
+        except OSError:
+            pass
+        return entry.get("metadata")
+
+    def put(self, path, metadata):
+        """Stores metadata dictionary for the current contents of path"""
+        if not self.__usable():
+            return
+        try:
+            realpath, size, mtime = self.__identity(path)
+            entry_path = self.__entry_path(realpath)
+            entry_dir = os.path.dirname(entry_path)
+            if not os.path.exists(entry_dir):
+                makedirs_shared(entry_dir)
+            fd, tmp = tempfile.mkstemp(dir=entry_dir, prefix=".tmp_")
+            with os.fdopen(fd, "w") as fout:
+                json.dump({"version": METADATA_VERSION, "path": realpath, "size": size, "mtime": mtime,
+                           "metadata": metadata}, fout)
+            os.chmod(tmp, 0o640)
+            os.replace(tmp, entry_path)
+        except (IOError, OSError) as e:
+            logger.warning("Unable to cache metadata of %s: %s", path, e)
+            return
+        self.__maybe_evict()
+
+    def __maybe_evict(self):
+        """Runs evict() if configured and not run by anyone within EVICT_INTERVAL"""
+        if not self.__ttl:
+            return
+        stamp = os.path.join(self.__cache_dir, "evict.stamp")
+        try:
+            if time.time() - os.path.getmtime(stamp) < self.EVICT_INTERVAL:
+                return
+        except OSError:
+            pass
+        # Concurrent scans are harmless - the stamp only keeps them infrequent
+        try:
+            os.close(open_shared(stamp, os.O_WRONLY))
+            os.utime(stamp, None)
+        except OSError as e:
+            logger.warning("Unable to update %s: %s", stamp, e)
+            return
+        self.evict()
+
+    def evict(self, ttl=None, now=None):
+        """Removes entries not used within ttl seconds, default the ttl the cache was created with.
+        Returns number of entries removed"""
+        ttl = ttl if ttl is not None else self.__ttl
+        now = now if now is not None else time.time()
+        removed = 0
+        if not ttl or not os.path.isdir(self.__cache_dir):
+            return removed
+        for subdir in os.listdir(self.__cache_dir):
+            sdir = os.path.join(self.__cache_dir, subdir)
+            if not os.path.isdir(sdir):
+                continue
+            for name in os.listdir(sdir):
+                fpath = os.path.join(sdir, name)
+                try:
+                    if now - os.path.getmtime(fpath) > ttl:
+                        os.unlink(fpath)
+                        removed += 1
+                except OSError:
+                    pass
+        if removed:
+            logger.info("Removed %d unused metadata entries from %s", removed, self.__cache_dir)
+        return removed
+
+
+def get_metadata_cache(site_id=None):
+    """Returns the process wide MetadataCache for the site, or None if disabled"""
+    with _cache_lock:
+        if site_id not in _caches:
+            vc = ValConfig(site_id=site_id)
+            _caches[site_id] = MetadataCache(vc.metadata_cache_dir, ttl=vc.cache_ttl) if vc.metadata_cache_dir else None
+        return _caches[site_id]
@@ -0,0 +1,112 @@
+##
+# File:  PartialFile.py
+#
+# In-progress download that can be resumed
+##
+"""
+ Keeps an interrupted download as a ".part" file with a json sidecar holding what is
+ needed to decide if the remote file is unchanged (url, etag, mtime, ...).  A later attempt,
+ possibly from another process, continues from the last byte received.
+
+ The part file is locked while in use so two consumers never append to the same file.
+"""
+import errno
+import fcntl
+import json
+import logging
+import os
+import shutil
+
+logger = logging.getLogger(__name__)
+
+
+class PartialFile(object):
+    def __init__(self, path):
+        self.__path = path
+        self.__meta_path = path + ".json"
+        self.__fh = None
+
+    @property
+    def path(self):
+        return self.__path
+
+    def acquire(self):
+        """Opens and locks the part file.  Returns False if another process holds it"""
+        pdir = os.path.dirname(self.__path)
+        if pdir and not os.path.exists(pdir):
+            os.makedirs(pdir, exist_ok=True)
+        fd = os.open(self.__path, os.O_RDWR | os.O_CREAT, 0o644)
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except OSError as e:
+            os.close(fd)
+            if e.errno in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                logger.debug("%s in use by another process", self.__path)
+                return False
+            raise
+        self.__fh = os.fdopen(fd, "r+b")
+        self.__fh.seek(0, os.SEEK_END)
+        return True
+
+    def release(self):
+        """Unlocks and closes the part file - contents are kept for a later resume"""
+        if self.__fh is not None:
+            try:
+                fcntl.flock(self.__fh.fileno(), fcntl.LOCK_UN)
+            finally:
+                self.__fh.close()
+                self.__fh = None
+
+    def offset(self):
+        """Returns number of bytes already received"""
+        if self.__fh is None:
+            return 0
+        self.__fh.flush()
+        return os.fstat(self.__fh.fileno()).st_size
+
+    def get_validators(self):
+        """Returns the validators recorded when the transfer started"""
+        if os.path.exists(self.__meta_path):
+            try:
+                with open(self.__meta_path, "r") as fin:
+                    return json.load(fin)
+            except ValueError:
+                logger.debug("Ignoring corrupt %s", self.__meta_path)
+        return {}
+
+    def start(self, validators):
+        """Discards any data received and records validators for a new transfer"""
+        self.__fh.seek(0)
+        self.__fh.truncate()
+        with open(self.__meta_path, "w") as fout:
+            json.dump(validators, fout)
+
+    def write(self, data):
+        self.__fh.write(data)
+
+    def complete(self, dest_path):
+        """Moves the finished download to dest_path.  Lock is released"""
+        self.__fh.flush()
+        try:
+            os.replace(self.__path, dest_path)
+        except OSError as e:
+            if e.errno != errno.EXDEV:
+                raise
+            # Different filesystem (cache to session directory)
+            shutil.move(self.__path, dest_path)
+        self.__remove(self.__meta_path)
+        self.release()
+
+    def discard(self):
+        """Removes the part file and its sidecar.  Lock is released"""
+        if self.__fh is None:
+            # Not held - may belong to someone else
+            return
+        self.__remove(self.__path)
+        self.__remove(self.__meta_path)
+        self.release()
+
+    @staticmethod
+    def __remove(fpath):
+        if os.path.exists(fpath):
+            os.unlink(fpath)
@@ -3,28 +3,72 @@
 # Date:  19-Nov-2020Sep-2012
 #
 # Updates:
+#   Content addressed store with size/age based eviction
 #
 ##
 """
  Implements a local file object cache for basic operations
 
- Will also allow negative caching of files using a per directory admin file
+ File contents are stored once, named by their sha256, under .store/objects.  Each cached
+ path has a json index entry in .store/index holding size, modification time, source and
+ HTTP validators.  The index file's own mtime records the last access, which drives
+ LRU/TTL eviction once the store exceeds its size limit.  Files recently used are never
+ evicted, as sessions symlink to them.
+
+ There is no cache wide lock.  Changes to a cached path are made under one of LOCK_SHARDS
+ file locks chosen by hashing the path, and objects are guarded the same way by their sha256.
+ New files are prepared outside the locks and renamed into place, so readers never take a
+ lock and never see a partially written file.
+
+ Files cached in the previous layout (a mirror of the remote tree) are imported on first access.
+
+ Files found missing remotely are recorded by an empty marker per path in .store/missing, so a
+ lookup is a single stat.  The marker's mtime is when the file was found missing - after
+ negative_ttl the server is asked again.  Markers are removed when the file is added, and
+ expired ones by evict().
+
+ Files being added are staged in .store/tmp/<host>_<pid>, a directory per process.  evict()
+ only removes the staging directories of processes on this host that have exited - files there
+ keep the archive's modification time, so their age does not tell if they are still in use.
+ Directories of other hosts are removed once nothing in them has changed (ctime) for EVICT_GRACE.
 """
+import errno
+import hashlib
 import os
 import json
 import logging
+import shutil
+import socket
+import tempfile
+import time
+import uuid
 
 from oslo_concurrency import lockutils
 
-from wwpdb.io.file.DataFile import DataFile
+from wwpdb.apps.val_rel.utils.Files import materialize_file, reflink_file
 
 logger = logging.getLogger(__name__)
 
 
 class PersistFileCache(object):
-    def __init__(self, cache_dir="/tmp"):
+    # Number of lock files paths and objects are spread over
+    LOCK_SHARDS = 64
+    # Seconds between eviction scans
+    EVICT_INTERVAL = 60 * 60
+    # Entries accessed within this many seconds are never evicted
+    EVICT_GRACE = 60 * 60 * 24
+
+    def __init__(self, cache_dir="/tmp", max_bytes=None, ttl=None, negative_ttl=None):
+        """max_bytes - store size above which least recently used files are evicted
+           ttl - seconds after last access when a file is evicted
+           negative_ttl - seconds a file found missing is reported missing without asking the server again
+        """
         self.__cache_dir = cache_dir
-        lockutils.set_defaults(self.__cache_dir)
+        self.__store_dir = os.path.join(cache_dir, ".store")
+        self.__max_bytes = max_bytes
+        self.__ttl = ttl
+        self.__negative_ttl = negative_ttl
+        self.__lock_dir = os.path.join(self.__store_dir, "locks")
 
     def __getcachedir(self, fpath):
         """Returns the internal cachedir for fpath"""
@@ -53,29 +97,281 @@ class PersistFileCache(object):
         cache_path = os.path.normpath(os.path.join(cd, bname))
         return cache_path
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
-    def add_file(self, realfpath, fpath):
+    def get_partial_path(self, fpath):
+        """Returns path where an in-progress download of fpath is kept, so that an
+           interrupted transfer can be resumed by a later attempt
+        """
+        cache_file = self.__getcachefile(fpath)
+        if cache_file is None:
+            return None
+        rel_path = os.path.relpath(cache_file, self.__cache_dir)
+        return os.path.join(self.__cache_dir, ".partial", rel_path + ".part")
+
+    def __getindexpath(self, fpath):
+        """Returns path of the index entry for fpath"""
+        cache_file = self.__getcachefile(fpath)
+        if cache_file is None:
+            return None
+        rel_path = os.path.relpath(cache_file, self.__cache_dir)
+        return os.path.join(self.__store_dir, "index", rel_path + ".json")
+
+    def __lock(self, kind, key):
+        """Returns inter-process lock for the shard key falls in"""
+        shard = int(hashlib.md5(key.encode("utf-8")).hexdigest()[:8], 16) % self.LOCK_SHARDS  # noqa: S324
+        return lockutils.lock("%s-%02d" % (kind, shard), external=True, lock_path=self.__lock_dir)
+
+    def __getobjectpath(self, sha):
+        return os.path.join(self.__store_dir, "objects", sha[:2], sha)
+
+    def __getrefpath(self, sha, index_path):
+        """Marker that index_path references object sha - an object without markers can be removed"""
+        key = hashlib.md5(index_path.encode("utf-8")).hexdigest()  # noqa: S324
+        return os.path.join(self.__store_dir, "refs", sha, key)
+
+    @staticmethod
+    def __readjson(fpath):
+        try:
+            with open(fpath, "r") as fin:
+                return json.load(fin)
+        except (IOError, OSError, ValueError):
+            return None
+
+    @staticmethod
+    def __writejson(fpath, data):
+        """Atomically replaces fpath with data"""
+        fdir = os.path.dirname(fpath)
+        if not os.path.exists(fdir):
+            os.makedirs(fdir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=fdir, prefix=".tmp_")
+        with os.fdopen(fd, "w") as fout:
+            json.dump(data, fout)
+        os.chmod(tmp, 0o644)
+        os.replace(tmp, fpath)
+
+    def __getstagingdir(self):
+        """Staging directory of this process"""
+        return os.path.join(self.__store_dir, "tmp", "%s_%d" % (socket.gethostname(), os.getpid()))
+
+    @staticmethod
+    def __is_staging_owner_alive(name):
+        """Returns True if the process owning staging directory name is running, None if on another host"""
+        host, _sep, pid = name.rpartition("_")
+        if host != socket.gethostname() or not pid.isdigit():
+            return None
+        try:
+            os.kill(int(pid), 0)
+        except ProcessLookupError:
+            return False
+        except PermissionError:
+            pass
+        return True
+
+    @staticmethod
+    def __last_change(path):
+        """Returns latest ctime of path and the files in it"""
+        latest = os.lstat(path).st_ctime
+        if os.path.isdir(path) and not os.path.islink(path):
+            for fname in os.listdir(path):
+                try:
+                    latest = max(latest, os.lstat(os.path.join(path, fname)).st_ctime)
+                except OSError:
+                    pass
+        return latest
+
+    def __stage(self, realfpath, move):
+        """Hard links (if move set and possible), reflinks or copies realfpath into the store temporary area
+           computing its sha256.  realfpath is left untouched.
+           Returns (temporary path, sha256, size)"""
+        tmp_dir = self.__getstagingdir()
+        if not os.path.exists(tmp_dir):
+            os.makedirs(tmp_dir, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=tmp_dir)
+        sha = hashlib.sha256()
+        size = 0
+        try:
+            os.close(fd)
+            fd = None
+            shared = False
+            if move:
+                try:
+                    os.unlink(tmp)
+                    os.link(realfpath, tmp)
+                    shared = True
+                except OSError as e:
+                    if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                        raise
+            if not shared:
+                # Without writing the data if the filesystem can share blocks between files
+                shared = reflink_file(realfpath, tmp)
+            if shared:
+                with open(tmp, "rb") as fin:
+                    for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                        sha.update(chunk)
+                        size += len(chunk)
+                os.chmod(tmp, 0o644)
+                return tmp, sha.hexdigest(), size
+            # Different filesystem - fall back on copy
+            fd = os.open(tmp, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o600)
+            with open(realfpath, "rb") as fin, os.fdopen(fd, "wb") as fout:
+                fd = None
+                for chunk in iter(lambda: fin.read(1024 * 1024), b""):
+                    sha.update(chunk)
+                    size += len(chunk)
+                    fout.write(chunk)
+            os.chmod(tmp, 0o644)
+            return tmp, sha.hexdigest(), size
+        except Exception:
+            if fd is not None:
+                os.close(fd)
+            if os.path.exists(tmp):
+                os.unlink(tmp)
+            raise
+
+    def add_file(self, realfpath, fpath, source=None, etag=None, last_modified=None, move=False):
         """Adds the contents of realfpath to the cache as fpath.
-           Overwrites if present.
+           Overwrites if present.  source, etag and last_modified describe where the file came from.
+           If move is set realfpath is moved into the cache rather than copied - it is only removed
+           once the cache holds the file.
 
            Returns True on success
         """
 
-        cache_dir = self.__getcachedir(fpath)
-        if not cache_dir:
+        index_path = self.__getindexpath(fpath)
+        if not index_path:
+            return False
+
+        # Never move a link into the store - only what it points at
+        move = move and not os.path.islink(realfpath)
+        tmp = None
+        try:
+            st = os.stat(realfpath)
+            tmp, sha, size = self.__stage(realfpath, move)
+            with self.__lock("key", index_path):
+                old = self.__readjson(index_path)
+                with self.__lock("obj", sha):
+                    obj_path = self.__getobjectpath(sha)
+                    if os.path.exists(obj_path):
+                        # Same contents already stored
+                        os.unlink(tmp)
+                    else:
+                        os.makedirs(os.path.dirname(obj_path), exist_ok=True)
+                        os.replace(tmp, obj_path)
+                    os.utime(obj_path, (st.st_atime, st.st_mtime))
+
+                    ref_path = self.__getrefpath(sha, index_path)
+                    os.makedirs(os.path.dirname(ref_path), exist_ok=True)
+                    open(ref_path, "a").close()
+
+                self.__writejson(index_path, {"sha256": sha,
+                                              "size": size,
+                                              "mtime": st.st_mtime,
+                                              "added": time.time(),
+                                              "source": source,
+                                              "etag": etag,
+                                              "last_modified": last_modified})
+                if old and old.get("sha256") and old["sha256"] != sha:
+                    # Previous contents may still be linked from a running session - leave for evict()
+                    self.__unref(old["sha256"], index_path, remove_unused=False)
+
+                # Previous layout copy no longer needed
+                cache_file = self.__getcachefile(fpath)
+                if os.path.isfile(cache_file) and not os.path.islink(cache_file):
+                    os.unlink(cache_file)
+            self.__clear_negative_cache(fpath)
+            if move and os.path.exists(realfpath):
+                os.unlink(realfpath)
+        except (IOError, OSError) as e:
+            logger.error("Unable to add %s to cache: %s", fpath, e)
             return False
+        finally:
+            if tmp is not None and os.path.exists(tmp):
+                os.unlink(tmp)
+
+        self.__maybe_evict()
+        return True
 
+    def __unref(self, sha, index_path, remove_unused=True):
+        """Drops reference from index_path to object sha - removes the object if unused and remove_unused set"""
+        with self.__lock("obj", sha):
+            ref_path = self.__getrefpath(sha, index_path)
+            if os.path.exists(ref_path):
+                os.unlink(ref_path)
+            ref_dir = os.path.dirname(ref_path)
+            if remove_unused and os.path.isdir(ref_dir) and not os.listdir(ref_dir):
+                os.rmdir(ref_dir)
+                obj_path = self.__getobjectpath(sha)
+                if os.path.exists(obj_path):
+                    os.unlink(obj_path)
+
+    def __import_legacy(self, fpath):
+        """Brings a file cached in the previous layout into the store.  Returns True if present"""
         cache_file = self.__getcachefile(fpath)
+        if cache_file is None or not os.path.isfile(cache_file) or os.path.islink(cache_file):
+            return False
+        logger.debug("Importing %s into store", cache_file)
+        if self.add_file(cache_file, fpath, move=True):
+            return True
+        # Another process may have imported it
+        return self.__lookup(fpath) is not None
 
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
+    def __lookup(self, fpath):
+        """Returns (index entry, object path) for fpath, or None"""
+        index_path = self.__getindexpath(fpath)
+        if index_path is None:
+            return None
+        entry = self.__readjson(index_path)
+        if not entry or not entry.get("sha256"):
+            return None
+        obj_path = self.__getobjectpath(entry["sha256"])
+        if not os.path.exists(obj_path):
+            return None
+        return entry, obj_path
 
-        df = DataFile(realfpath)
-        df.copy(dstPath=cache_file)
+    def get_metadata(self, fpath):
+        """Returns dictionary of size, mtime, atime, added, validated, source, etag and last_modified for fpath
+           or None if not cached"""
+        found = self.__lookup(fpath)
+        if found is None:
+            return None
+        entry = dict(found[0])
+        try:
+            entry["atime"] = os.path.getmtime(self.__getindexpath(fpath))
+        except OSError:
+            entry["atime"] = None
+        return entry
+
+    def mark_validated(self, fpath):
+        """Records that fpath was confirmed to match the remote file"""
+        index_path = self.__getindexpath(fpath)
+        if index_path is None:
+            return False
+        with self.__lock("key", index_path):
+            entry = self.__readjson(index_path)
+            if not entry:
+                return False
+            entry["validated"] = time.time()
+            try:
+                self.__writejson(index_path, entry)
+            except (IOError, OSError) as e:
+                logger.error("Unable to update %s: %s", index_path, e)
+                return False
+        return True
 
+    def remove_file(self, fpath):
+        """Removes fpath from the cache - for example when the remote file no longer exists"""
+        index_path = self.__getindexpath(fpath)
+        if index_path is None:
+            return False
+        with self.__lock("key", index_path):
+            entry = self.__readjson(index_path)
+            if not entry:
+                return False
+            os.unlink(index_path)
+            if entry.get("sha256"):
+                # May still be linked from a running session - leave for evict()
+                self.__unref(entry["sha256"], index_path, remove_unused=False)
         return True
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
     def get_file(self, fpath, realfpath, symlink=False):
         """Retrieves fpath from the cache and copies it to realfpath
            If fpath is not in cache, returns False, else True.
@@ -83,79 +379,229 @@ class PersistFileCache(object):
            Timestamp will be preserved
         """
 
-        cache_file = self.__getcachefile(fpath)
-        if cache_file is None:
-            return False
-
-        if not os.path.exists(cache_file):
+        found = self.__lookup(fpath)
+        if found is None:
+            if not self.__import_legacy(fpath):
+                return False
+            found = self.__lookup(fpath)
+            if found is None:
+                return False
+        entry, obj_path = found
+
+        # Record access for LRU
+        try:
+            os.utime(self.__getindexpath(fpath), None)
+        except OSError:
+            pass
+
+        # Prepared next to realfpath and renamed over it - replaces any file already there
+        outdir = os.path.dirname(os.path.abspath(realfpath))
+        tmp = None
+        try:
+            if not os.path.exists(outdir):
+                os.makedirs(outdir, exist_ok=True)
+            if symlink:
+                tmp = self.__make_symlink(obj_path, outdir)
+                os.replace(tmp, realfpath)
+            else:
+                # A reflink if possible.  Never a hard link, as realfpath may be modified
+                materialize_file(obj_path, realfpath)
+                os.utime(realfpath, (entry["mtime"], entry["mtime"]))
+        except (IOError, OSError) as e:
+            # Evicted meanwhile or output not writable
+            logger.error("Unable to retrieve %s from cache: %s", fpath, e)
+            if tmp is not None and os.path.lexists(tmp):
+                os.unlink(tmp)
             return False
-
-        df = DataFile(cache_file)
-        if symlink:
-            # First time putting in cache - file might exists when trying to retrieve
-            if os.path.exists(realfpath):
-                os.unlink(realfpath)
-            df.symLink(dstPath=realfpath)
-        else:
-            df.copy(dstPath=realfpath)
         return True
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
+    @staticmethod
+    def __make_symlink(target, outdir):
+        """Creates a symlink to target in outdir under a name not in use, and returns its path"""
+        while True:
+            path = os.path.join(outdir, ".tmp_%s" % uuid.uuid4().hex)
+            try:
+                os.symlink(target, path)
+                return path
+            except FileExistsError:
+                continue
+
     def exists(self, fpath):
         """Returns True if fpath in cache, else False"""
+        if self.__lookup(fpath) is not None:
+            return True
+        return self.__import_legacy(fpath)
+
+    def __maybe_evict(self):
+        """Runs evict() if configured and not run by anyone within EVICT_INTERVAL"""
+        if self.__max_bytes is None and self.__ttl is None:
+            return
+        stamp = os.path.join(self.__store_dir, "evict.stamp")
+        now = time.time()
+        try:
+            if now - os.path.getmtime(stamp) < self.EVICT_INTERVAL:
+                return
+        except OSError:
+            pass
+        with self.__lock("evict", stamp):
+            try:
+                if now - os.path.getmtime(stamp) < self.EVICT_INTERVAL:
+                    return
+            except OSError:
+                pass
+            open(stamp, "a").close()
+            os.utime(stamp, None)
+        self.evict()
+
+    def evict(self, max_bytes=None, ttl=None, now=None):
+        """Removes files not accessed within ttl seconds, then least recently used files until
+           the store is below max_bytes.  Defaults to the limits the cache was created with.
+           Returns number of bytes freed
+        """
+        max_bytes = self.__max_bytes if max_bytes is None else max_bytes
+        ttl = self.__ttl if ttl is None else ttl
+        now = time.time() if now is None else now
+
+        # Scan without the lock - each removal is rechecked under it
+        entries = []
+        sizes = {}
+        refs = {}
+        index_dir = os.path.join(self.__store_dir, "index")
+        for root, _dirs, files in os.walk(index_dir):
+            for fname in files:
+                if not fname.endswith(".json") or fname.startswith(".tmp_"):
+                    continue
+                index_path = os.path.join(root, fname)
+                entry = self.__readjson(index_path)
+                if not entry or not entry.get("sha256"):
+                    continue
+                try:
+                    atime = os.path.getmtime(index_path)
+                except OSError:
+                    continue
+                sha = entry["sha256"]
+                entries.append((atime, index_path, sha))
+                sizes[sha] = entry.get("size", 0)
+                refs[sha] = refs.get(sha, 0) + 1
+        total = sum(sizes.values())
+        entries.sort()
+
+        freed = 0
+        for atime, index_path, sha in entries:
+            if now - atime < self.EVICT_GRACE:
+                # Sorted by access - all others recently used too
+                break
+            expired = ttl is not None and now - atime > ttl
+            if not expired and (max_bytes is None or total <= max_bytes):
+                continue
+            with self.__lock("key", index_path):
+                try:
+                    if os.path.getmtime(index_path) != atime:
+                        # Accessed or replaced since scan
+                        continue
+                except OSError:
+                    continue
+                os.unlink(index_path)
+                self.__unref(sha, index_path)
+            logger.info("Evicted %s from cache", index_path)
+            refs[sha] -= 1
+            if refs[sha] == 0:
+                total -= sizes[sha]
+                freed += sizes[sha]
+
+        # Objects no longer referenced after being replaced
+        refs_dir = os.path.join(self.__store_dir, "refs")
+        if os.path.isdir(refs_dir):
+            for sha in os.listdir(refs_dir):
+                ref_dir = os.path.join(refs_dir, sha)
+                try:
+                    if os.listdir(ref_dir) or now - os.path.getmtime(ref_dir) < self.EVICT_GRACE:
+                        continue
+                except OSError:
+                    continue
+                obj_path = self.__getobjectpath(sha)
+                size = os.path.getsize(obj_path) if os.path.exists(obj_path) else 0
+                with self.__lock("obj", sha):
+                    if os.path.isdir(ref_dir) and not os.listdir(ref_dir):
+                        os.rmdir(ref_dir)
+                        if os.path.exists(obj_path):
+                            os.unlink(obj_path)
+                            freed += size
+
+        # Expired negative cache markers
+        missing_dir = os.path.join(self.__store_dir, "missing")
+        if self.__negative_ttl is not None and os.path.isdir(missing_dir):
+            for root, _dirs, files in os.walk(missing_dir):
+                for fname in files:
+                    mpath = os.path.join(root, fname)
+                    try:
+                        if now - os.path.getmtime(mpath) > self.__negative_ttl:
+                            os.unlink(mpath)
+                    except OSError:
+                        pass
+
+        # Abandoned staging files - by ctime, as a file hard linked in keeps the archive's mtime
+        tmp_dir = os.path.join(self.__store_dir, "tmp")
+        if os.path.isdir(tmp_dir):
+            for fname in os.listdir(tmp_dir):
+                tmp = os.path.join(tmp_dir, fname)
+                try:
+                    alive = self.__is_staging_owner_alive(fname) if os.path.isdir(tmp) else None
+                    if alive or (alive is None and now - self.__last_change(tmp) <= self.EVICT_GRACE):
+                        continue
+                    if os.path.isdir(tmp):
+                        shutil.rmtree(tmp, ignore_errors=True)
+                    else:
+                        os.unlink(tmp)
+                except OSError:
+                    pass
+        return freed
+
+    def __getmissingpath(self, fpath):
+        """Returns path of the negative cache marker for fpath"""
         cache_file = self.__getcachefile(fpath)
-        return os.path.exists(cache_file)
-
-    def __getmissingfilepath(self, fpath):
-        """Returns the file path for the missing file"""
-        cache_dir = self.__getcachedir(fpath)
-        return os.path.join(cache_dir, "missing.json")
-
-    def __getmissinglist(self, fpath):
-        """Retrieves the json data for missing files"""
-        mpath = self.__getmissingfilepath(fpath)
-
-        if os.path.exists(mpath):
-            with open(mpath, "r") as fin:
-                jdata = json.load(fin)
-                return jdata
-        return []
-
-    def __writemissinglist(self, fpath, mlist):
-        """Writes the json data for missing files"""
-        mpath = self.__getmissingfilepath(fpath)
+        if cache_file is None:
+            return None
+        rel_path = os.path.relpath(cache_file, self.__cache_dir)
+        return os.path.join(self.__store_dir, "missing", rel_path)
 
-        with open(mpath, "w") as fout:
-            json.dump(mlist, fout)
-        return True
+    def __clear_negative_cache(self, fpath):
+        mpath = self.__getmissingpath(fpath)
+        if mpath is not None and os.path.exists(mpath):
+            try:
+                os.unlink(mpath)
+            except OSError:
+                pass
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
     def add_negative_cache(self, fpath):
-        cache_dir = self.__getcachedir(fpath)
-
-        if not os.path.exists(cache_dir):
-            os.makedirs(cache_dir)
-
-        mlist = self.__getmissinglist(fpath)
-        npath = os.path.normpath(fpath)
-        if npath not in mlist:
-            mlist.append(npath)
-            ret = self.__writemissinglist(fpath, mlist)
-        else:
-            ret = True
-
-        return ret
+        """Records that fpath does not exist remotely.  Returns True on success"""
+        mpath = self.__getmissingpath(fpath)
+        if mpath is None:
+            return False
+        try:
+            if not os.path.exists(os.path.dirname(mpath)):
+                os.makedirs(os.path.dirname(mpath), exist_ok=True)
+            # The marker's mtime is when the file was last found missing
+            open(mpath, "a").close()
+            os.utime(mpath, None)
+        except (IOError, OSError) as e:
+            logger.error("Unable to add %s to negative cache: %s", fpath, e)
+            return False
+        return True
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
     def is_negative_cache(self, fpath):
-        mlist = self.__getmissinglist(fpath)
-
-        npath = os.path.normpath(fpath)
-        if npath in mlist:
-            return True
-        return False
+        """Returns True if fpath was found missing within negative_ttl seconds"""
+        mpath = self.__getmissingpath(fpath)
+        if mpath is None:
+            return False
+        try:
+            recorded = os.path.getmtime(mpath)
+        except OSError:
+            return False
+        if self.__negative_ttl is not None and time.time() - recorded > self.__negative_ttl:
+            return False
+        return True
 
-    @lockutils.synchronized("sessiondatastore.lock", external=True)
     def cache_file_status(self, fpath):
         """Returns one of three statuses for fpath
         True if have a file
@@ -169,13 +615,11 @@ class PersistFileCache(object):
             return None
 
         # If file in cache
-        if os.path.exists(cache_file):
+        if self.exists(fpath):
             return True
 
         # Check negative cache
-        mlist = self.__getmissinglist(fpath)
-        npath = os.path.normpath(fpath)
-        if npath in mlist:
+        if self.is_negative_cache(fpath):
             return False
 
         # We known nothing
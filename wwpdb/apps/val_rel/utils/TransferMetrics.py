@@ -0,0 +1,271 @@
+##
+# File:  TransferMetrics.py
+#
+# Timing and volume of input file retrieval
+##
+"""
+ Records where each input file came from and what it cost, so that the time a release spends
+ on I/O can be broken down.
+
+ Two kinds of record are made:
+   fetch    - an input file (model, sf, emdb_volume, ...) requested from getFilesRelease, with the
+              tier it came from: OneDep for_release, the local ftp tree, the download cache or the
+              remote archive (or missing), its size, duration and the retries made
+   transfer - a file requested from a remote fetcher, with the outcome of the cache lookup
+ Transfers made while an input file is fetched - by the same thread, or by AsyncRemoteFiles on
+ its behalf - are added to that fetch.
+
+ Records are logged as json to the "wwpdb.apps.val_rel.metrics" logger - fetches at INFO and
+ transfers at DEBUG - and appended as json lines to VAL_REL_METRICS_FILE if set, which the
+ consumers of a release can share.  collect() gathers the records made in the process while
+ active for a summary of a run, and summarize_file() summarizes a metrics file for a release.
+"""
+import argparse
+import contextlib
+import contextvars
+import json
+import logging
+import os
+import threading
+import time
+
+from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+
+logger = logging.getLogger(__name__)
+metrics_logger = logging.getLogger("wwpdb.apps.val_rel.metrics")
+
+TIER_ONEDEP = "onedep"
+TIER_LOCAL = "local"
+TIER_CACHE = "cache"
+TIER_REMOTE = "remote"
+TIER_MISSING = "missing"
+
+_metrics_lock = threading.Lock()
+_metrics = None
+# FetchRecord of the fetch in progress in the current context
+_current_fetch = contextvars.ContextVar("current_fetch", default=None)
+
+
+class FetchRecord(object):
+    """Retrieval of an input file in progress - see TransferMetrics.fetch()"""
+
+    def __init__(self, kind, entry):
+        self.kind = kind
+        self.entry = entry
+        self.tier = None
+        self.file_name = None
+        self.transfers = []
+        self.__lock = threading.Lock()
+
+    def set_tier(self, tier):
+        self.tier = tier
+
+    def set_file(self, file_name):
+        self.file_name = file_name
+
+    def add_transfer(self, record):
+        with self.__lock:
+            self.transfers.append(record)
+
+    def get_tier(self):
+        """Returns the tier set, else the one the transfers made show"""
+        if self.tier:
+            return self.tier
+        if not self.file_name:
+            return TIER_MISSING
+        tiers = set(t["tier"] for t in self.transfers)
+        if TIER_REMOTE in tiers:
+            return TIER_REMOTE
+        if TIER_CACHE in tiers:
+            return TIER_CACHE
+        # Found without a transfer - in the local ftp tree
+        return TIER_LOCAL
+
+
+class MetricsCollector(object):
+    """Records made while registered with TransferMetrics.collect()"""
+
+    def __init__(self):
+        self.__records = []
+        self.__lock = threading.Lock()
+
+    def add(self, record):
+        with self.__lock:
+            self.__records.append(record)
+
+    def get_records(self):
+        with self.__lock:
+            return list(self.__records)
+
+    def summary(self):
+        return summarize(self.get_records())
+
+    def log_summary(self, title):
+        log_summary(title, self.summary())
+
+
+class TransferMetrics(object):
+    def __init__(self, metrics_file=None):
+        """metrics_file - file json lines are appended to"""
+        self.__metrics_file = metrics_file
+        self.__collectors = []
+        self.__lock = threading.Lock()
+
+    def __emit(self, record):
+        level = logging.INFO if record["type"] == "fetch" else logging.DEBUG
+        if metrics_logger.isEnabledFor(level):
+            metrics_logger.log(level, "%s", json.dumps(record, sort_keys=True))
+        with self.__lock:
+            collectors = list(self.__collectors)
+        for collector in collectors:
+            collector.add(record)
+        if self.__metrics_file:
+            try:
+                # A single write of a line in append mode - lines from several processes do not mix
+                fd = os.open(self.__metrics_file, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o644)
+                try:
+                    os.write(fd, (json.dumps(record, sort_keys=True) + "\n").encode("utf-8"))
+                finally:
+                    os.close(fd)
+            except (IOError, OSError) as e:
+                logger.warning("Unable to write metrics to %s: %s", self.__metrics_file, e)
+
+    def record_transfer(self, url, tier, nbytes=0, seconds=0.0, cache=None, retries=0):
+        """Records retrieval of url by a remote fetcher.
+           tier - TIER_CACHE if served from the download cache, else TIER_REMOTE
+           cache - outcome of the cache lookup - "hit", "revalidated", "stale" (used as the server could not be asked),
+                   "miss", "negative" or None without a cache"""
+        record = {"type": "transfer",
+                  "time": time.time(),
+                  "pid": os.getpid(),
+                  "file": os.path.basename(url),
+                  "url": url,
+                  "tier": tier,
+                  "bytes": nbytes,
+                  "seconds": round(seconds, 3),
+                  "cache": cache,
+                  "retries": retries}
+        fetch = _current_fetch.get()
+        if fetch is not None:
+            fetch.add_transfer(record)
+        self.__emit(record)
+
+    def record_fetch(self, kind, entry, tier, file_name, seconds, transfers=None):
+        """Records retrieval of an input file of kind for entry"""
+        transfers = transfers or []
+        record = {"type": "fetch",
+                  "time": time.time(),
+                  "pid": os.getpid(),
+                  "kind": kind,
+                  "entry": entry,
+                  "tier": tier,
+                  "file": os.path.basename(file_name) if file_name else None,
+                  "bytes": sum(t["bytes"] for t in transfers if t["tier"] == TIER_REMOTE),
+                  "seconds": round(seconds, 3),
+                  "retries": sum(t["retries"] for t in transfers),
+                  "transfers": len(transfers),
+                  "cache_hits": len([t for t in transfers if t["cache"] in ("hit", "revalidated", "stale")]),
+                  "cache_misses": len([t for t in transfers if t["cache"] == "miss"])}
+        if tier in (TIER_ONEDEP, TIER_LOCAL) and file_name and os.path.exists(file_name):
+            record["bytes"] = os.path.getsize(file_name)
+        self.__emit(record)
+
+    @contextlib.contextmanager
+    def fetch(self, kind, entry):
+        """Records retrieval of an input file made in the body of the with statement.  Yields FetchRecord
+           to set the file name found on - transfers made in this context meanwhile are included"""
+        fetch = FetchRecord(kind, entry)
+        token = _current_fetch.set(fetch)
+        start = time.time()
+        try:
+            yield fetch
+        finally:
+            _current_fetch.reset(token)
+            self.record_fetch(kind, entry, fetch.get_tier(), fetch.file_name, time.time() - start, fetch.transfers)
+
+    @contextlib.contextmanager
+    def collect(self):
+        """Yields MetricsCollector gathering the records made in this process in the body of the with statement"""
+        collector = MetricsCollector()
+        with self.__lock:
+            self.__collectors.append(collector)
+        try:
+            yield collector
+        finally:
+            with self.__lock:
+                self.__collectors.remove(collector)
+
+
+def get_transfer_metrics(site_id=None):
+    """Returns the process wide TransferMetrics"""
+    global _metrics
+    with _metrics_lock:
+        if _metrics is None:
+            _metrics = TransferMetrics(metrics_file=ValConfig(site_id=site_id).metrics_file)
+        return _metrics
+
+
+def summarize(records):
+    """Returns totals of records - for fetches by tier and by kind, for transfers by cache outcome"""
+    summary = {"tiers": {}, "kinds": {}, "cache": {}, "retries": 0}
+    for record in records:
+        if record.get("type") == "fetch":
+            for key, group in (("tiers", record["tier"]), ("kinds", record["kind"])):
+                totals = summary[key].setdefault(group, {"count": 0, "bytes": 0, "seconds": 0.0})
+                totals["count"] += 1
+                totals["bytes"] += record.get("bytes", 0)
+                totals["seconds"] += record.get("seconds", 0.0)
+        elif record.get("type") == "transfer":
+            outcome = record.get("cache") or "none"
+            summary["cache"][outcome] = summary["cache"].get(outcome, 0) + 1
+            summary["retries"] += record.get("retries", 0)
+    return summary
+
+
+def summarize_file(metrics_file, since=None):
+    """Returns summarize() of the records in metrics_file made after time since"""
+    records = []
+    with open(metrics_file, "r") as fin:
+        for line in fin:
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # Partly written by a consumer that was stopped
+                continue
+            if since is None or record.get("time", 0) >= since:
+                records.append(record)
+    return summarize(records)
+
+
+def log_summary(title, summary):
+    """Logs summary from summarize()"""
+    if not summary["tiers"] and not summary["cache"]:
+        return
+    logger.info("%s - input files by source:", title)
+    for tier, totals in sorted(summary["tiers"].items()):
+        logger.info("  %-8s %5d files %12d bytes %9.1f s", tier, totals["count"], totals["bytes"], totals["seconds"])
+    for kind, totals in sorted(summary["kinds"].items()):
+        logger.info("  %-12s %5d files %12d bytes %9.1f s", kind, totals["count"], totals["bytes"], totals["seconds"])
+    logger.info("  cache lookups %s, retries %d",
+                ", ".join("%s %d" % (outcome, count) for outcome, count in sorted(summary["cache"].items())),
+                summary["retries"])
+
+
+def main():
+    # Create logger -
+    logger = logging.getLogger()
+    FORMAT = '[%(asctime)s %(levelname)s]-%(module)s.%(funcName)s: %(message)s'
+    logging.basicConfig(format=FORMAT)
+    logger.setLevel(logging.INFO)
+
+    parser = argparse.ArgumentParser(description="Summarize a metrics file written with VAL_REL_METRICS_FILE")
+    parser.add_argument("metrics_file", help="metrics file")
+    parser.add_argument("--hours", help="only records from the last number of hours", type=float, default=None)
+    args = parser.parse_args()
+
+    since = time.time() - args.hours * 60 * 60 if args.hours else None
+    log_summary(args.metrics_file, summarize_file(args.metrics_file, since=since))
+
+
+if "__main__" in __name__:
+    main()
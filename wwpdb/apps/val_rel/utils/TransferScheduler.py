@@ -0,0 +1,177 @@
+##
+# File:  TransferScheduler.py
+#
+# Node wide limits on transfers from each archive server
+##
+"""
+ Coordinates the downloads made by all consumers on a node, so that they do not open more
+ transfers than a server accepts and are refused with 421/429/503 replies.
+
+ For each server there are max_per_server transfer slots.  A slot is a lock file held with
+ flock() for the duration of a transfer, so the limit applies across threads and processes
+ and a slot is freed if its holder dies.  The first small_slots slots are kept for small files -
+ large files such as maps only use the others, so headers, models and reflection data are not
+ stuck behind map downloads.
+
+ If max_bytes_per_second is set, transfers also draw from a token bucket per server, kept in a
+ state file updated under a lock, so their combined rate stays within the limit.
+
+ The lock directory is configured for the site - without one transfers are not limited.  Consumers
+ may run as different users of one group, so the directory and files are created writable by the
+ group.  If they cannot be used, transfers go ahead without limits and a warning is logged.
+"""
+import contextlib
+import errno
+import fcntl
+import fnmatch
+import json
+import logging
+import os
+import random
+import re
+import threading
+import time
+
+from wwpdb.apps.val_rel.utils.Files import makedirs_shared, open_shared
+
+logger = logging.getLogger(__name__)
+
+# Files transferred as large when their size is not known
+LARGE_FILE_PATTERNS = ["*.map", "*.map.gz", "*.map.bz2", "*.mrc", "*.mrc.gz"]
+# Files above this size (bytes) are large
+LARGE_FILE_SIZE = 100 * 1024 * 1024
+# Seconds between attempts to find a free slot
+POLL_INTERVAL = 0.1
+
+_unusable_lock = threading.Lock()
+# Lock directories found not writable by this process
+_unusable = set()
+
+
+class TransferSlot(object):
+    """A held transfer slot.  consume() is called with the size of each block received"""
+
+    def __init__(self, scheduler, host, fd):
+        self.__scheduler = scheduler
+        self.__host = host
+        self.__fd = fd
+
+    def consume(self, nbytes):
+        """Waits as needed to keep within the bandwidth limit of the server"""
+        self.__scheduler.consume(self.__host, nbytes)
+
+    def release(self):
+        if self.__fd is not None:
+            try:
+                fcntl.flock(self.__fd, fcntl.LOCK_UN)
+            finally:
+                os.close(self.__fd)
+                self.__fd = None
+
+
+class TransferScheduler(object):
+    def __init__(self, lock_dir, max_per_server=8, small_slots=2, max_bytes_per_second=0):
+        """lock_dir - directory shared by the processes on the node, None for no limits
+           max_per_server - transfers from a server at once, 0 for no limit
+           small_slots - slots only used for small files
+           max_bytes_per_second - combined rate from a server, 0 for no limit
+        """
+        self.__lock_dir = lock_dir
+        self.__max_per_server = max_per_server
+        self.__small_slots = min(small_slots, max_per_server - 1) if max_per_server > 0 else 0
+        self.__rate = max_bytes_per_second
+
+    @staticmethod
+    def is_large(name, size=None):
+        """Returns True if the file is transferred as a large file"""
+        if size is not None:
+            return size > LARGE_FILE_SIZE
+        name = os.path.basename(name)
+        return any(fnmatch.fnmatch(name, pattern) for pattern in LARGE_FILE_PATTERNS)
+
+    def __host_dir(self, host):
+        hdir = os.path.join(self.__lock_dir, re.sub(r"[^A-Za-z0-9.-]", "_", host))
+        if not os.path.exists(hdir):
+            makedirs_shared(hdir)
+        return hdir
+
+    def __usable(self):
+        if not self.__lock_dir:
+            return False
+        with _unusable_lock:
+            return self.__lock_dir not in _unusable
+
+    def __not_usable(self, e):
+        """Records the lock directory cannot be used by this process - transfers are not limited"""
+        with _unusable_lock:
+            if self.__lock_dir in _unusable:
+                return
+            _unusable.add(self.__lock_dir)
+        logger.warning("Unable to use transfer locks in %s - transfers are not limited: %s", self.__lock_dir, e)
+
+    @contextlib.contextmanager
+    def transfer(self, host, name, size=None):
+        """Holds a transfer slot of host for the body of the with statement.  Yields TransferSlot.
+           name and size, if known, of the file decide if it is large"""
+        fd = None
+        if self.__max_per_server > 0 and self.__usable():
+            try:
+                fd = self.__acquire(host, self.is_large(name, size))
+            except PermissionError as e:
+                self.__not_usable(e)
+        slot = TransferSlot(self, host, fd)
+        try:
+            yield slot
+        finally:
+            slot.release()
+
+    def __acquire(self, host, large):
+        """Returns locked file descriptor of a free slot, waiting until there is one"""
+        hdir = self.__host_dir(host)
+        first = self.__small_slots if large else 0
+        slots = list(range(first, self.__max_per_server))
+        waited = False
+        while True:
+            # Start from a random slot so waiting processes spread over the slots
+            start = random.randrange(len(slots))
+            for slot in slots[start:] + slots[:start]:
+                fd = open_shared(os.path.join(hdir, "slot-%02d" % slot))
+                try:
+                    fcntl.flock(fd, fcntl.LOCK_EX | fcntl.LOCK_NB)
+                    return fd
+                except OSError as e:
+                    os.close(fd)
+                    if e.errno not in (errno.EAGAIN, errno.EACCES, errno.EWOULDBLOCK):
+                        raise
+            if not waited:
+                logger.debug("Waiting for a transfer slot for %s", host)
+                waited = True
+            time.sleep(POLL_INTERVAL * (1 + random.random()))
+
+    def consume(self, host, nbytes):
+        """Takes nbytes from the token bucket of host, sleeping if it is in debt"""
+        if self.__rate <= 0 or nbytes <= 0 or not self.__usable():
+            return
+        try:
+            fd = open_shared(os.path.join(self.__host_dir(host), "bucket"))
+        except PermissionError as e:
+            self.__not_usable(e)
+            return
+        try:
+            fcntl.flock(fd, fcntl.LOCK_EX)
+            with os.fdopen(os.dup(fd), "r+") as fh:
+                try:
+                    state = json.load(fh)
+                    tokens, last = state["tokens"], state["time"]
+                except (ValueError, KeyError, TypeError):
+                    tokens, last = float(self.__rate), time.time()
+                now = time.time()
+                # Refill - up to one second of transfer can be sent in a burst
+                tokens = min(float(self.__rate), tokens + (now - last) * self.__rate) - nbytes
+                fh.seek(0)
+                fh.truncate()
+                json.dump({"tokens": tokens, "time": now}, fh)
+        finally:
+            os.close(fd)
+        if tokens < 0:
+            time.sleep(-tokens / self.__rate)
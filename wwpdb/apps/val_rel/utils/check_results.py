@@ -61,7 +61,7 @@ class CheckResult:
 
         simple_modification = False
         if model_file and not em_xml_file:
-            simple_modification = is_simple_modification(model_path=model_file)
+            simple_modification = is_simple_modification(model_path=model_file, site_id=self.__siteid)
         self.validation_xml = get_gzip_name(self.rv.getValidationXml())
         logging.debug('validation xml: {}'.format(self.validation_xml))
         output_files = self.rv.getCoreOutputFileDict()
@@ -134,7 +134,7 @@ class CheckEntries:
                         #              'entry_id': entry_id}
                         missing_entries.append(entry_id)
                         entries_to_add.setdefault(entry_type, []).append(entry_id)
-                except Exception:  # noqa: E722,BLE001
+                except Exception:
                     logging.error('unable to read: {}'.format(self.get_missing_file_path()))
         if entries_to_add:
             for entry_type in entries_to_add:
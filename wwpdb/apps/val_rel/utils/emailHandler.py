@@ -72,5 +72,5 @@ class EmailHandler:
         try:
             with smtplib.SMTP(server) as s:
                 s.send_message(msg)
-        except Exception:  # noqa: E722,BLE001
+        except Exception:
             logger.exception("unable to send to %s email %s", recipient, content)
@@ -2,6 +2,7 @@ import logging
 import os
 
 from wwpdb.io.file.DataFile import DataFile
+from wwpdb.apps.val_rel.utils.Files import materialize_file
 from wwpdb.apps.validation.src.scripts.star_to_cif import starToPdbx
 
 logger = logging.getLogger(__name__)
@@ -15,8 +16,12 @@ def convert_cs_file(entry_id, cs_file, model_file, working_dir):
         src_cs_file = os.path.join(working_dir, "input.cs")
 
         # We copy the cs_file to working directory so as to not uncompress in for_release directory
-        df = DataFile(cs_file)
-        df.copy(src_cs_file)
+        if os.path.splitext(cs_file)[1] in (".gz", ".Z", ".bz2"):
+            df = DataFile(cs_file)
+            df.copy(src_cs_file)
+        else:
+            # A release or archive file - not hard linked, so nothing done to the copy can reach it
+            materialize_file(cs_file, src_cs_file)
 
         cs_cif_file = os.path.join(working_dir, 'working_cs.cif')
 
@@ -1,7 +1,10 @@
 import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
 from wwpdb.utils.config.ConfigInfo import getSiteId
 from wwpdb.apps.val_rel.config.ValConfig import ValConfig
 from wwpdb.apps.val_rel.utils.getFilesReleaseOneDep import getFilesReleaseOneDep
+from wwpdb.apps.val_rel.utils.TransferMetrics import get_transfer_metrics, TIER_ONEDEP
 
 from wwpdb.apps.val_rel.utils.http_protocol.getFilesReleaseHTTP_EMDB import getFilesReleaseHttpEMDB
 from wwpdb.apps.val_rel.utils.http_protocol.getFilesReleaseHTTP_PDB import getFilesReleaseHttpPDB
@@ -10,6 +13,10 @@ from wwpdb.apps.val_rel.utils.getFilesReleaseFTP_PDB import getFilesReleaseFtpPD
 
 logger = logging.getLogger(__name__)
 
+# Kinds of input file that can be prefetched, mapping to the getter on the OneDep and remote classes
+PDB_PREFETCH_KINDS = ("model", "sf", "nmr_data", "cs")
+EMDB_PREFETCH_KINDS = ("emdb_xml", "emdb_volume", "emdb_fsc")
+
 
 class getFilesRelease:
     """Class to access prior/public release files"""
@@ -25,9 +32,13 @@ class getFilesRelease:
         self.mr_current = False
         self.em_xml_current = False
         self.__tempFTP = None
+        # Additional remote accessors used by concurrent prefetch - cleaned up with the main ones
+        self.__prefetch_remotes = []
 
         # Determine which routing
         config = ValConfig(site_id=siteID)
+        self.__prefetch_workers = config.prefetch_workers
+        self.__metrics = get_transfer_metrics(siteID)
         if config.val_rel_protocol in ["http", "https"]:
             self.__files_pdb_func = getFilesReleaseHttpPDB
             self.__files_emdb_func = getFilesReleaseHttpEMDB
@@ -45,6 +56,8 @@ class getFilesRelease:
         """
         self.__release_file_from_remote_pdb.close_connection()
         self.__release_file_from_remote_emdb.close_connection()
+        for remote in self.__prefetch_remotes:
+            remote.close_connection()
 
     def set_pdb_id(self, pdb_id):
         """Sets up pdb_id for processing release files"""
@@ -79,6 +92,10 @@ class getFilesRelease:
         """Removes any temporary FTP directories"""
         self.__release_file_from_remote_pdb.remove_local_temp_files()
         self.__release_file_from_remote_emdb.remove_local_temp_files()
+        for remote in self.__prefetch_remotes:
+            remote.close_connection()
+            remote.remove_local_temp_files()
+        self.__prefetch_remotes = []
 
     def get_model(self):
         """
@@ -86,9 +103,9 @@ class getFilesRelease:
         :param pdbid: PDB ID
         :return: file name if present or None
         """
-        file_name, self.model_current = self.__release_file_from_onedep.get_model()
+        file_name, self.model_current = self.__get_from_onedep("model")
         if not file_name:
-            file_name = self.__release_file_from_remote_pdb.get_model()
+            file_name = self.__get_from_remote("model")
         return file_name
 
     def get_sf(self):
@@ -97,9 +114,9 @@ class getFilesRelease:
         :param pdbid: PDB ID
         :return: file name if present or None
         """
-        file_name, self.sf_current = self.__release_file_from_onedep.get_sf()
+        file_name, self.sf_current = self.__get_from_onedep("sf")
         if not file_name:
-            file_name = self.__release_file_from_remote_pdb.get_sf()
+            file_name = self.__get_from_remote("sf")
         return file_name
 
     def get_cs(self):
@@ -108,9 +125,9 @@ class getFilesRelease:
         :param pdbid: PDB ID
         :return: file name if present or None
         """
-        file_name, self.cs_current = self.__release_file_from_onedep.get_cs()
+        file_name, self.cs_current = self.__get_from_onedep("cs")
         if not file_name:
-            file_name = self.__release_file_from_remote_pdb.get_cs()
+            file_name = self.__get_from_remote("cs")
         return file_name
 
     def get_nmr_data(self):
@@ -119,31 +136,148 @@ class getFilesRelease:
         :param pdbid: PDB ID
         :return: file name if present or None
         """
-        file_name, self.cs_current = self.__release_file_from_onedep.get_nmr_data()
+        file_name, self.cs_current = self.__get_from_onedep("nmr_data")
         if not file_name:
-            file_name = self.__release_file_from_remote_pdb.get_nmr_data()
+            file_name = self.__get_from_remote("nmr_data")
         return file_name
 
     def get_emdb_xml(self):
-        file_name, self.em_xml_current = self.__release_file_from_onedep.get_emdb_xml()
+        file_name, self.em_xml_current = self.__get_from_onedep("emdb_xml")
         if not file_name:
-            file_name = self.__release_file_from_remote_emdb.get_emdb_xml()
+            file_name = self.__get_from_remote("emdb_xml")
         return file_name
 
     def get_emdb_volume(self):
-        file_name, _ = self.__release_file_from_onedep.get_emdb_volume()
+        file_name, _ = self.__get_from_onedep("emdb_volume")
         if not file_name:
-            file_name = self.__release_file_from_remote_emdb.get_emdb_volume()
+            file_name = self.__get_from_remote("emdb_volume")
 
         return file_name
 
+    def has_emdb_volume(self):
+        """Returns True if the EMDB volume is in OneDep or the archive - without retrieving it"""
+        file_name, _ = self.__release_file_from_onedep.get_emdb_volume()
+        if file_name:
+            return True
+        return self.__release_file_from_remote_emdb.has_emdb_volume()
+
     def get_emdb_fsc(self):
-        file_name, _ = self.__release_file_from_onedep.get_emdb_fsc()
+        file_name, _ = self.__get_from_onedep("emdb_fsc")
         if not file_name:
-            file_name = self.__release_file_from_remote_emdb.get_emdb_fsc()
+            file_name = self.__get_from_remote("emdb_fsc")
 
         return file_name
 
+    def __entry(self, kind):
+        return self.pdb_id if kind in PDB_PREFETCH_KINDS else self.emdb_id
+
+    def __get_from_onedep(self, kind):
+        """Returns (file name or None, current) of kind from OneDep, recording the fetch if found"""
+        start = time.time()
+        file_name, current = getattr(self.__release_file_from_onedep, "get_" + kind)()
+        if file_name:
+            self.__metrics.record_fetch(kind, self.__entry(kind), TIER_ONEDEP, file_name, time.time() - start)
+        return file_name, current
+
+    def __get_from_remote(self, kind, remote=None):
+        """Returns file name or None of kind from remote, default the main accessor of its type, recording the fetch"""
+        if remote is None:
+            remote = self.__release_file_from_remote_pdb if kind in PDB_PREFETCH_KINDS else self.__release_file_from_remote_emdb
+        with self.__metrics.fetch(kind, self.__entry(kind)) as fetch:
+            file_name = getattr(remote, "get_" + kind)()
+            fetch.set_file(file_name)
+        return file_name
+
+    def prefetch(self, kinds=None):
+        """
+        Retrieves several input files at once.  Files found in OneDep are used directly, the
+        remaining ones are downloaded concurrently - each on its own connection.
+        :param kinds: list of PDB_PREFETCH_KINDS/EMDB_PREFETCH_KINDS, default all for the ids set
+        :return: dictionary of kind to file name or None.  Current flags are set as by the get_ methods
+        :raises: the first error retrieving a file, once the other transfers have finished - as the get_ methods
+
+        The combined NMR data file holds the chemical shifts, so if both are asked for cs is only retrieved,
+        after the others, when there is no nmr_data - otherwise it is None.
+        """
+        if kinds is None:
+            kinds = []
+            if self.pdb_id:
+                kinds.extend(PDB_PREFETCH_KINDS)
+            if self.emdb_id:
+                kinds.extend(EMDB_PREFETCH_KINDS)
+
+        manifest = {}
+        current = {}
+        remote_kinds = []
+        cs_fallback = "cs" in kinds and "nmr_data" in kinds
+        for kind in kinds:
+            if kind not in PDB_PREFETCH_KINDS and kind not in EMDB_PREFETCH_KINDS:
+                raise ValueError("Unknown kind of file %s" % kind)
+            if kind == "cs" and cs_fallback:
+                continue
+            file_name, current[kind] = self.__get_from_onedep(kind)
+            manifest[kind] = file_name
+            if not file_name:
+                remote_kinds.append(kind)
+
+        if remote_kinds:
+            logger.debug("Prefetching %s", remote_kinds)
+            remotes = self.__get_prefetch_remotes(remote_kinds)
+            failure = None
+            with ThreadPoolExecutor(max_workers=max(1, min(self.__prefetch_workers, len(remote_kinds)))) as executor:
+                futures = [executor.submit(self.__get_from_remote, kind, remote) for kind, remote in zip(remote_kinds, remotes)]
+                for kind, future in zip(remote_kinds, futures):
+                    try:
+                        manifest[kind] = future.result()
+                    except Exception as e:
+                        # Not the same as missing from the archive - raised when all are done
+                        logger.error("Failed to retrieve %s: %s", kind, e)
+                        if failure is None:
+                            failure = e
+            if failure is not None:
+                raise failure
+
+        if cs_fallback:
+            manifest["cs"] = None
+            if not manifest["nmr_data"]:
+                manifest["cs"], current["cs"] = self.__get_from_onedep("cs")
+                if not manifest["cs"]:
+                    manifest["cs"] = self.__get_from_remote("cs")
+
+        if "model" in current:
+            self.model_current = current["model"]
+        if "sf" in current:
+            self.sf_current = current["sf"]
+        if "emdb_xml" in current:
+            self.em_xml_current = current["emdb_xml"]
+        # As in sequential retrieval - nmr-data takes precedence over cs
+        if "nmr_data" in current and (manifest["nmr_data"] or "cs" not in current):
+            self.cs_current = current["nmr_data"]
+        elif "cs" in current:
+            self.cs_current = current["cs"]
+
+        logger.debug("Prefetch manifest %s", manifest)
+        return manifest
+
+    def __get_prefetch_remotes(self, kinds):
+        """Returns a remote accessor per kind.  The accessors and their connections are not thread safe,
+        so only the first kind of each type uses the main accessor"""
+        remotes = []
+        main_used = set()
+        for kind in kinds:
+            is_pdb = kind in PDB_PREFETCH_KINDS
+            if is_pdb not in main_used:
+                main_used.add(is_pdb)
+                remote = self.__release_file_from_remote_pdb if is_pdb else self.__release_file_from_remote_emdb
+            else:
+                if is_pdb:
+                    remote = self.__files_pdb_func(site_id=self.__siteID, pdbid=self.pdb_id, cache=self.__cache)
+                else:
+                    remote = self.__files_emdb_func(site_id=self.__siteID, emdbid=self.emdb_id, cache=self.__cache)
+                self.__prefetch_remotes.append(remote)
+            remotes.append(remote)
+        return remotes
+
     def is_sf_current(self):
         return self.sf_current
 
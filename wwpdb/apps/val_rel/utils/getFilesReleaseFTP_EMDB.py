@@ -29,7 +29,7 @@ class getFilesReleaseFtpEMDB(object):
         self.grf = None
 
         if not self.__local_ftp.get_ftp_emdb():
-            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache)
+            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache, site_id=self.__site_id)
 
     def get_local_ftp_path(self):
         return self.__local_ftp.get_ftp_emdb()
@@ -94,8 +94,17 @@ class getFilesReleaseFtpEMDB(object):
                 return file_path
         return None
 
-    def get_remote_ftp_data(self):
-        ok = self.get_emdb_from_remote_ftp()
+    def emdb_volume_files(self):
+        """Returns patterns of the files below the entry directory used to validate the map - the primary
+        map with the half maps and masks beside it, compressed or not"""
+        map_name = self.__rf.get_emdb_map(self.emdb_id)
+        base_name = map_name.replace(".gz", "").replace(".map", "")
+        return [os.path.join("map", map_name),
+                os.path.join("other", base_name + "_half_map_[12].map*"),
+                os.path.join("masks", base_name + "_msk_*.map*")]
+
+    def get_remote_ftp_data(self, patterns=None):
+        ok = self.get_emdb_from_remote_ftp(patterns=patterns)
         if ok:
             self.set_temp_local_ftp_as_local_ftp_path()
             return True
@@ -131,12 +140,21 @@ class getFilesReleaseFtpEMDB(object):
                                                      emdb_path=self.emdb_map_folder())
         else:
             logger.debug('trying remote FTP')
-            self.get_remote_ftp_data()
+            self.get_remote_ftp_data(patterns=self.emdb_volume_files())
             file_name = self.get_emdb_local_ftp_file(filename=self.__rf.get_emdb_map(self.emdb_id),
                                                      emdb_path=self.emdb_map_folder())
         logger.debug('returning: {}'.format(file_name))
         return file_name
 
+    def has_emdb_volume(self):
+        """Returns True if the primary map of the entry exists - without retrieving it"""
+        map_name = self.__rf.get_emdb_map(self.emdb_id)
+        if self.__local_ftp.get_ftp_emdb():
+            return self.get_emdb_local_ftp_file(filename=map_name, emdb_path=self.emdb_map_folder()) is not None
+        if self.grf is None:
+            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache, site_id=self.__site_id)
+        return self.grf.is_file(os.path.join(self.url_prefix, self.emdb_map_folder(), map_name))
+
     def get_emdb_fsc(self):
         logger.debug('FSC')
         local_ftp = self.__local_ftp.get_ftp_emdb()
@@ -169,9 +187,10 @@ class getFilesReleaseFtpEMDB(object):
             return True
         return False
 
-    def get_emdb_from_remote_ftp(self):
+    def get_emdb_from_remote_ftp(self, patterns=None):
         """
-        Get the full EMDB FTP directory from the FTP site if it exists
+        Get the EMDB FTP directory from the FTP site if it exists
+        :param patterns: paths relative to the entry directory of the files to retrieve - all if None
         :return: True if ok, False if either does not exist or failed
         """
         logger.debug('getting EMDB from remote FTP')
@@ -182,7 +201,8 @@ class getFilesReleaseFtpEMDB(object):
 
             # no need to check self.grf again here as it will be checked in
             # get_file_from_remote_ftp()
-            ret = self.grf.get_directory(directory=url_directory, output_path=self.get_temp_local_ftp_emdb_path())
+            ret = self.grf.mirror_directory(directory=url_directory, output_path=self.get_temp_local_ftp_emdb_path(),
+                                            patterns=patterns)
             logger.debug(ret)
             if ret:
                 return True
@@ -197,7 +217,7 @@ class getFilesReleaseFtpEMDB(object):
 
         if self.grf is None:
             logger.warning("There was no existing ftp connection. Opening new connection now...")
-            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache)
+            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache, site_id=self.__site_id)
 
         ret = self.grf.get_url(output_path=self.get_temp_local_ftp_emdb_path(), directory=file_path, filename=filename)
         logger.debug(ret)
@@ -30,7 +30,7 @@ class getFilesReleaseFtpPDB(object):
         self.grf = None
 
         if not self.__local_ftp.get_ftp_pdb():
-            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache)
+            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache, site_id=self.__site_id)
 
     @staticmethod
     def check_filename(file_name):
@@ -88,7 +88,7 @@ class getFilesReleaseFtpPDB(object):
 
         if self.grf is None:
             logger.warning("There was no existing ftp connection. Opening new connection now...")
-            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache)
+            self.grf = GetRemoteFiles(server=self.server, cache=self.__cache, site_id=self.__site_id)
 
         ret = self.grf.get_url(output_path=self.get_temp_local_ftp_path(), directory=file_path, filename=filename)
         # logger.debug("ret is %s", ret)
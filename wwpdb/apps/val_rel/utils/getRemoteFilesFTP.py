@@ -1,15 +1,29 @@
 import datetime
+import fnmatch
 import ftplib
 import logging
 import os
+import queue
 import shutil
+import socket
 import tempfile
 import time
+from concurrent.futures import ThreadPoolExecutor
 
+from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+from wwpdb.apps.val_rel.utils.FtpConnectionPool import get_connection_pool
+from wwpdb.apps.val_rel.utils.PartialFile import PartialFile
 from wwpdb.apps.val_rel.utils.PersistFileCache import PersistFileCache
+from wwpdb.apps.val_rel.utils.TransferMetrics import get_transfer_metrics, TIER_CACHE, TIER_REMOTE
+from wwpdb.apps.val_rel.utils.TransferScheduler import TransferScheduler
 
 logger = logging.getLogger(__name__)
 
+# Transfer outcome when the server reports the file does not exist
+NOT_FOUND = "not found"
+# Bytes read from the data connection at a time
+BLOCK_SIZE = 64 * 1024
+
 
 def setup_local_temp_ftp(temp_dir, suffix, session_path):
     if not temp_dir:
@@ -34,12 +48,32 @@ def remove_local_temp_ftp(temp_dir, require_empty=False):
 
 
 class GetRemoteFiles(object):
-    def __init__(self, server, cache=None):
-
+    def __init__(self, server, cache=None, site_id=None):
+
+        vc = ValConfig(site_id=site_id)
+        self.__server = server
+        self.__site_id = site_id
+        # Number of files of a directory mirror downloaded at the same time
+        self.__mirror_workers = vc.prefetch_workers
+        # Number of times an interrupted transfer is continued on a new connection
+        self.__resume_retries = vc.resume_retries
+        self.__cache_max_bytes = vc.cache_max_bytes
+        self.__cache_ttl = vc.cache_ttl
+        self.__revalidate_interval = vc.cache_revalidate_interval
+        self.__negative_ttl = vc.negative_cache_ttl
+        # Seconds a connection may be idle before it is checked with a NOOP ahead of the next command
+        self.__idle_check = vc.ftp_idle_check
+        # Logged in connections are shared with other instances in the process
+        self.__pool = get_connection_pool(server, maxsize=vc.ftp_pool_maxsize)
+        # Limits transfers from the server across the consumers on this node
+        self.__scheduler = TransferScheduler(vc.transfer_lock_dir, max_per_server=vc.transfer_max_per_server,
+                                             small_slots=vc.transfer_small_slots,
+                                             max_bytes_per_second=vc.transfer_max_bytes_per_second)
+        self.__metrics = get_transfer_metrics(site_id)
         # Single underscore for __del__ to be able to find
-        self._ftp = self.__connect(server)
+        self._ftp = self.__pool.acquire()
+        self.__last_used = time.time()
         # logger.info("Connect!!! %s", self._ftp)
-        self._ftp.login()
         self.__cache = cache
         # The current remote directory as we go up and down tree
         self.__curdir = "."
@@ -51,91 +85,313 @@ class GetRemoteFiles(object):
             # possible exceptions in ftp.quit() will be ignored
             self.disconnect()
 
-    def __connect(self, server):
-        """Connects to remote server with retry"""
-
-        retry = 0
-        sleep = 2
-        ftp = None
-
-        while 1:
-            try:
-                ftp = ftplib.FTP(server)
-                return ftp
-            except ftplib.error_temp as e:
-                ecode = str(e)[:3]
-                if ecode == "421":
-                    if retry > 7:
-                        raise
-                    logger.error("Remote resource unavailable - sleep %s and retry %s", sleep, str(e))
-                    time.sleep(sleep)
-                    retry += 1
-                    sleep *= 2
-                    continue
-            # unhandled exception not caught - raises us
-        # Never reached
-
     def _check_connection(self):
+        """Checks a connection idle for longer than the idle check interval is still alive, replacing it
+        if not.  A recently used connection is assumed alive - a failure is handled when a command is sent"""
+        if self._ftp is not None and time.time() - self.__last_used < self.__idle_check:
+            return
+        if self._ftp is None:
+            # Dropped after a failed transfer
+            if self.__reconnect():
+                return
+            raise Exception("error connecting to server")
+
         retries = 3
 
         while retries > 0:
             try:
-                return self._ftp.voidcmd("noop")
-            except Exception as e:  # noqa: E722,BLE001
-                logger.error(e)
+                self._ftp.voidcmd("noop")
+                self.__last_used = time.time()
+                return
+            except Exception as e:
+                logger.info("Idle connection to %s lost: %s", self.__server, e)
                 retries -= 1
-                self._ftp.login()
+                self.__reconnect()
 
         raise Exception("error connecting to server")
 
+    @staticmethod
+    def __is_connection_error(e):
+        """Returns True if e shows the connection was lost rather than the command failing"""
+        if isinstance(e, ftplib.error_temp):
+            return str(e)[:3] == "421"
+        return isinstance(e, (EOFError, OSError))
+
+    def __command(self, name, *args):
+        """Calls ftplib method name on the connection.  If the connection was lost, for example closed
+        by the server while idle, reconnects and sends it again"""
+        self._check_connection()
+        try:
+            ret = getattr(self._ftp, name)(*args)
+        except Exception as e:
+            if not self.__is_connection_error(e) or not self.__reconnect():
+                raise
+            logger.info("Connection to %s lost (%s) - reconnected", self.__server, e)
+            ret = getattr(self._ftp, name)(*args)
+        self.__last_used = time.time()
+        return ret
+
+    def __listing(self, cmd):
+        """Returns lines of NLST or MLSD listing.  Transferred in binary mode as ftplib nlst and mlsd switch
+        the connection to ASCII, which would then apply to RETR too"""
+        self._check_connection()
+        for attempt in range(2):
+            chunks = []
+            try:
+                self.__retrbinary(cmd, chunks.append)
+                break
+            except Exception as e:
+                if attempt or not self.__is_connection_error(e) or not self.__reconnect():
+                    raise
+                logger.info("Connection to %s lost (%s) - reconnected", self.__server, e)
+        return b"".join(chunks).decode(self._ftp.encoding).splitlines()
+
+    def __nlst(self):
+        return [line for line in self.__listing("NLST") if line]
+
+    def __mlsd(self, directory):
+        """Returns list of (name, facts) in directory - facts as lower case keys"""
+        entries = []
+        for line in self.__listing("MLSD %s" % directory):
+            facts_found, _, name = line.partition(" ")
+            if not name:
+                continue
+            facts = {}
+            # Last ends in semicolon
+            for fact in facts_found[:-1].split(";"):
+                key, _dum, value = fact.partition("=")
+                facts[key.lower()] = value
+            entries.append((name, facts))
+        return entries
+
+    def __retrbinary(self, cmd, callback, rest=None):
+        """As ftplib retrbinary - without sending TYPE I, as pooled connections are already in binary mode.
+        A transfer failing other than with a reply from the server leaves the control connection part way
+        through it, so the connection is dropped rather than returned to the pool - the next command reconnects"""
+        try:
+            with self._ftp.transfercmd(cmd, rest) as conn:
+                while 1:
+                    data = conn.recv(BLOCK_SIZE)
+                    if not data:
+                        break
+                    callback(data)
+            ret = self._ftp.voidresp()
+        except (ftplib.error_perm, ftplib.error_temp) as e:
+            if self.__is_connection_error(e):
+                self.__drop_connection()
+            raise
+        except BaseException:
+            self.__drop_connection()
+            raise
+        self.__last_used = time.time()
+        return ret
+
+    def __drop_connection(self):
+        """Closes the connection without returning it to the pool"""
+        if self._ftp is not None:
+            self.__pool.discard(self._ftp)
+            self._ftp = None
+
     def _setup_output_path(self, output_path):
         if not os.path.exists(output_path):
-            os.makedirs(output_path)
+            # May be created by a concurrent transfer at the same time
+            os.makedirs(output_path, exist_ok=True)
 
     def get_file(self, remote_file, output_path):
-        self._check_connection()
+        """Retrieves remote_file from cache or server into output_path.  Returns True on success"""
         self._setup_output_path(output_path)
 
         file_name = os.path.join(output_path, remote_file)
+        return self.__get_file(remote_file, os.path.join(self.__curdir, remote_file), file_name)
+
+    def __get_file(self, remote_file, rp, file_name, facts=None):
+        """Retrieves remote_file, cached as rp, to file_name.  facts are the size and modify time
+        of remote_file from a directory listing - if given MDTM and SIZE are not needed"""
+        start = time.time()
+        info = {"tier": TIER_REMOTE}
+        ret = self.__transfer_file(remote_file, rp, file_name, facts, info)
+        self.__metrics.record_transfer("ftp://%s/%s" % (self.__server, os.path.normpath(rp)), info["tier"],
+                                       nbytes=info.get("bytes", 0), seconds=time.time() - start,
+                                       cache=info.get("cache"), retries=info.get("retries", 0))
+        return ret
+
+    def __transfer_file(self, remote_file, rp, file_name, facts, info):
+        """As __get_file.  info is filled with the tier the file came from, the outcome of the cache lookup,
+        bytes downloaded and retries made"""
         logger.debug("Transferring file %s to %s", remote_file, file_name)
+        mtime = self.__parse_timestamp(facts.get("modify")) if facts else None
         # logger.debug("Cache is %s", self.__cache)
         if self.__cache is not None:
             # See if in cache
-            pfc = PersistFileCache(self.__cache)
-            rp = os.path.join(self.__curdir, remote_file)
+            pfc = PersistFileCache(self.__cache, max_bytes=self.__cache_max_bytes, ttl=self.__cache_ttl,
+                                   negative_ttl=self.__negative_ttl)
             if pfc.exists(rp):
-                pfc.get_file(rp, file_name, symlink=True)
-                logger.debug("Found %s in cache", rp)
-                return
+                fresh, mtime = self.__is_cache_current(pfc, rp, remote_file, facts)
+                if fresh and pfc.get_file(rp, file_name, symlink=True):
+                    logger.debug("Found %s in cache", rp)
+                    info.update({"tier": TIER_CACHE, "cache": "hit"})
+                    return True
+            elif pfc.is_negative_cache(rp):
+                logger.debug("%s in negative cache", rp)
+                info.update({"tier": TIER_CACHE, "cache": "negative"})
+                return False
+            info["cache"] = "miss"
             # logger.debug("Did not find %s in cache", remote_file)
 
-        with open(file_name, 'wb') as out_file:
-            self._ftp.retrbinary("RETR " + remote_file, out_file.write)
+        # Modification time also identifies the remote file when resuming - and MDTM reports a missing file
+        if mtime is None:
+            mtime = self.__get_mtime(remote_file)
+        if mtime is NOT_FOUND:
+            ret = NOT_FOUND
+        else:
+            partial_path = pfc.get_partial_path(rp) if self.__cache is not None else None
+            size = int(facts["size"]) if facts and facts.get("size", "").isdigit() else None
+            ret = self.__retrieve(remote_file, file_name, mtime, partial_path, size, info)
+        if ret is NOT_FOUND:
+            logger.info("%s not on server", remote_file)
+            if self.__cache is not None:
+                pfc.add_negative_cache(rp)
+            return False
+        if not ret:
+            logger.error("Failed to retrieve %s", remote_file)
+            return False
+        info["bytes"] = os.path.getsize(file_name)
 
         # File always exist - but might be zero length.... Annoying interface
         # logger.debug("Output exists? %s", os.path.exists(file_name))
-        # See if can get details..
-        mtime = self.get_remote_file_mtime(remote_file)
         if mtime is not None:
             logger.debug("Setting mtime on %s to %s", file_name, mtime)
             os.utime(file_name, (mtime, mtime))
         if self.__cache is not None:
-            pfc.add_file(file_name, rp)
-            # logger.debug("Adding %s to cache", rp)
+            # move to cache and link back
+            source = "ftp://%s/%s" % (self.__server, os.path.normpath(rp))
+            if pfc.add_file(file_name, rp, source=source, move=True):
+                # logger.debug("Adding %s to cache", rp)
+                return pfc.get_file(rp, file_name, symlink=True)
+        return True
+
+    def __is_cache_current(self, pfc, rp, remote_file, facts=None):
+        """Checks cached rp against the MDTM and SIZE of remote_file if not done within the revalidate interval,
+           or against listing facts if given.
+           Returns (True if cached copy can be used, remote mtime if it was retrieved)"""
+        meta = pfc.get_metadata(rp)
+        if facts:
+            mtime = self.__parse_timestamp(facts.get("modify"))
+            size = int(facts["size"]) if facts.get("size", "").isdigit() else None
+        elif meta is None or time.time() - meta.get("validated", meta.get("added", 0)) < self.__revalidate_interval:
+            return True, None
+        else:
+            mtime = self.get_remote_file_mtime(remote_file)
+            size = self.get_size(remote_file)
+        if meta is None:
+            return True, mtime
+        if mtime is None and size is None:
+            logger.warning("Unable to revalidate %s - using cached copy", rp)
+            return True, None
+        if (mtime is not None and abs(mtime - meta.get("mtime", 0)) > 1) or (size is not None and size != meta.get("size")):
+            logger.info("%s changed on server - retrieving again", remote_file)
+            return False, mtime
+        pfc.mark_validated(rp)
+        return True, mtime
+
+    def __retrieve(self, remote_file, file_name, mtime, partial_path=None, size=None, info=None):
+        """RETR remote_file to file_name via a partial file.  If the connection drops, reconnects
+           and continues with REST from the last byte received.  size if known decides the transfer slot used.
+           The number of times the transfer was continued is added to info["retries"] if given.
+           Returns True on success, NOT_FOUND if the server reports no such file, else False"""
+        part = None
+        for path in [partial_path, file_name + ".part"]:
+            if path:
+                part = PartialFile(path)
+                if part.acquire():
+                    break
+                part = None
+        if part is None:
+            logger.error("Unable to create partial download for %s", remote_file)
+            return False
+
+        try:
+            with self.__scheduler.transfer(self.__server, remote_file, size) as slot:
+                return self.__retrieve_part(remote_file, file_name, mtime, part, slot, info)
+        finally:
+            if part.offset() == 0:
+                # Nothing worth resuming
+                part.discard()
+            else:
+                part.release()
+
+    def __retrieve_part(self, remote_file, file_name, mtime, part, slot, info=None):
+        """Makes the transfers of __retrieve"""
+
+        def write(data):
+            part.write(data)
+            slot.consume(len(data))
 
-    def get_remote_file_mtime(self, remote_file):
         self._check_connection()
+        validators = {"remote": os.path.normpath(os.path.join(self.__curdir, remote_file)),
+                      "mtime": mtime}
+        if mtime is None or part.get_validators() != validators:
+            # Cannot tell if remote file is the one partially received
+            part.start(validators)
+
+        for attempt in range(self.__resume_retries + 1):
+            offset = part.offset()
+            if attempt > 0 and info is not None:
+                info["retries"] = attempt
+            if offset > 0:
+                logger.info("Resuming %s from byte %d", remote_file, offset)
+            try:
+                self.__retrbinary("RETR " + remote_file, write, rest=offset if offset > 0 else None)
+                part.complete(file_name)
+                return True
+            except ftplib.error_perm as e:
+                if offset > 0 and str(e)[:3] in ("501", "502", "504", "550", "554"):
+                    # REST not supported or offset beyond file - start again
+                    logger.warning("Restart of %s at %d refused: %s", remote_file, offset, e)
+                    part.start(validators)
+                    continue
+                if offset == 0 and str(e)[:3] == "550":
+                    return NOT_FOUND
+                logger.error("Transfer of %s failed: %s", remote_file, e)
+                return False
+            except (socket.timeout, EOFError, ftplib.error_temp, ftplib.error_reply, OSError) as e:
+                logger.warning("Transfer of %s interrupted after %d bytes: %s", remote_file, part.offset(), e)
+                if attempt == self.__resume_retries or not self.__reconnect():
+                    return False
+        return False
+
+    def __reconnect(self):
+        """Replaces a broken connection and returns to the current directory"""
+        self.__drop_connection()
+        try:
+            self._ftp = self.__pool.acquire()
+            if self.__curdir != ".":
+                self._ftp.cwd(self.__curdir)
+            self.__last_used = time.time()
+            return True
+        except Exception as e:
+            logger.error("Unable to reconnect to %s: %s", self.__server, e)
+            return False
+
+    def get_remote_file_mtime(self, remote_file):
         # Try to retrieve remote file time from server.
         # Returns None if could not be determined
+        mtime = self.__get_mtime(remote_file)
+        if mtime is NOT_FOUND:
+            return None
+        return mtime
+
+    def __get_mtime(self, remote_file):
+        """Returns modification time of remote_file, NOT_FOUND if the server reports it does not exist
+        or None if unknown"""
 
         # See https://stackoverflow.com/questions/29026709/how-to-get-ftp-files-modify-time-using-python-ftplib
         # Python 3 has added mlsd which could be used - but we are not there yet
 
         # Several attempts to see if server supports one. Raises exception if command not know
-        ts = None
         try:
             # MDTM is supported by all wwpdb partner ftp sites
-            mdtmr = self._ftp.voidcmd("MDTM %s" % remote_file)
+            mdtmr = self.__command("voidcmd", "MDTM %s" % remote_file)
             # Make sure get 213 return
             if mdtmr[0:3] != "213":
                 return None
@@ -143,31 +399,41 @@ class GetRemoteFiles(object):
 
             # Fall through
 
-        except Exception:  # noqa: E722,BLE001
-            try:
-                # Fall back on MLST - which is more machine readable - but less universal
-
-                mlst = self._ftp.voidcmd("MLST %s" % remote_file)
-
-                if not mlst:
-                    return None
-                for line in mlst.split('\n'):
-                    if line[0:3] == '250':
-                        continue
-                    ls = line.strip()
-                    facts_found, _, fname = ls.partition(" ")
-                    factsd = {}
-                    # Last ends in semicolor
-                    for fact in facts_found[:-1].split(";"):
-                        key, _dum, value = fact.partition("=")
-                        factsd[key.lower()] = value
-                ts = factsd.get('modify', None)
-                # None caught below
-
-            except Exception:  # noqa: E722,BLE001
-                return None
+        except ftplib.error_perm as e:
+            if str(e)[:3] == "550":
+                return NOT_FOUND
+            ts = self.__get_mlst_modify(remote_file)
+        except Exception:
+            ts = self.__get_mlst_modify(remote_file)
 
         # print("TS: %s" % ts)
+        return self.__parse_timestamp(ts)
+
+    def __get_mlst_modify(self, remote_file):
+        """Returns the modify fact of remote_file from MLST, or None"""
+        # Fall back on MLST - which is more machine readable - but less universal
+        try:
+            mlst = self.__command("voidcmd", "MLST %s" % remote_file)
+        except Exception:
+            return None
+        if not mlst:
+            return None
+        factsd = {}
+        for line in mlst.split('\n'):
+            if line[0:3] == '250':
+                continue
+            ls = line.strip()
+            facts_found, _, fname = ls.partition(" ")
+            factsd = {}
+            # Last ends in semicolor
+            for fact in facts_found[:-1].split(";"):
+                key, _dum, value = fact.partition("=")
+                factsd[key.lower()] = value
+        return factsd.get('modify', None)
+
+    @staticmethod
+    def __parse_timestamp(ts):
+        """Returns timestamp from MDTM or MLSD modify fact, or None"""
         if not ts:
             return None
 
@@ -183,44 +449,57 @@ class GetRemoteFiles(object):
             return None
 
     def get_size(self, remote_file):
-        self._check_connection()
+        size = self.__get_size(remote_file)
+        if size is NOT_FOUND:
+            return None
+        return size
 
-        size = 0
+    def __get_size(self, remote_file):
+        """Returns size of remote_file, NOT_FOUND if the server reports it does not exist or None if unknown"""
         try:
-            size = self._ftp.size(remote_file)
+            return self.__command("size", remote_file)
+        except ftplib.error_perm as e:
+            if str(e)[:3] == "550":
+                return NOT_FOUND
+            return None
         except:  # noqa: E722,BLE001
-            size = None
-        return size
+            return None
 
     def is_file(self, remote_file):
-        self._check_connection()
-
         if self.get_size(remote_file):
             return True
         return False
 
     def change_ftp_directory(self, directory):
-        self._check_connection()
-
         logger.debug("Changing directory %s", directory)
         if directory:
             try:
-                self._ftp.cwd(directory)
+                self.__command("cwd", directory)
                 if directory[0] == '/':
                     self.__curdir = directory
                 else:
                     self.__curdir = os.path.join(self.__curdir, directory)
                 logger.debug("cur directory is %s", self.__curdir)
                 return True
-            except Exception as e:  # noqa: E722,BLE001
+            except Exception as e:
                 logger.error(e)
         return False
 
     def get_url(self, output_path, directory=None, filename=None):
-        """Retrieves files from directory.  Returns list of files retrieved"""
-        self._check_connection()
+        """Retrieves files from directory.  Returns list of files retrieved
 
+        A named file the server reports missing is added to the negative cache, and is not
+        asked for again until that expires.  A named file is not checked with SIZE first - a cached
+        copy is revalidated by get_file, and otherwise the RETR reports if it is missing.  Files of
+        a listing are checked with SIZE, as the listing also names directories.
+        """
         ret_files = []
+        if self.__cache is not None and filename:
+            pfc = PersistFileCache(self.__cache, negative_ttl=self.__negative_ttl)
+            rp = self.__remote_path(directory, filename)
+            if pfc.is_negative_cache(rp):
+                logger.debug("%s in negative cache", rp)
+                return ret_files
         # logger.debug("Directory %s, filename %s", directory, filename)
         if directory:
             ok = self.change_ftp_directory(directory)
@@ -228,24 +507,28 @@ class GetRemoteFiles(object):
                 logger.error("Failed to change directory to %s", directory)
                 return []
         if filename:
-            files = [filename]
-        else:
-            files = self._ftp.nlst()
-        for filename in files:
-            if self.is_file(filename):
-                self.get_file(filename, output_path)
+            if self.get_file(filename, output_path):
+                ret_files.append(filename)
+            return ret_files
+        for filename in self.__nlst():
+            if self.__get_size(filename) and self.get_file(filename, output_path):
                 ret_files.append(filename)
         return ret_files
 
+    def __remote_path(self, directory, filename):
+        """Returns path of filename in directory - relative to the current directory unless absolute"""
+        curdir = self.__curdir
+        if directory:
+            curdir = directory if directory[0] == "/" else os.path.join(self.__curdir, directory)
+        return os.path.join(curdir, filename)
+
     def get_directory(self, directory, output_path):
         """Recursivle retrieve contents of directory"""
-        self._check_connection()
-
         # Improvement - cache nlst?
         ok = self.change_ftp_directory(directory)
         if not ok:
             return False
-        objects = self._ftp.nlst()
+        objects = self.__nlst()
         if objects:
             for obj in objects:
                 # Skip nfs turds... or any files that start with "."
@@ -264,15 +547,113 @@ class GetRemoteFiles(object):
                     self._setup_output_path(output_path)
                     self.get_directory(obj, output_path)
 
-                    self._ftp.cwd('..')
+                    self.__command("cwd", "..")
                     output_path = os.path.join(output_path, '..')
                     self.__curdir = os.path.join(self.__curdir, "..")
                     logger.debug("curr directory %s", self.__curdir)
             return True
         return False
 
+    def mirror_directory(self, directory, output_path, workers=None, patterns=None):
+        """Retrieves the contents of directory and its subdirectories into output_path, as get_directory.
+        If patterns are given, only files whose path relative to directory matches one of them are
+        retrieved, and only the subdirectories leading to them are listed.
+
+        Each directory is listed with a single MLSD giving the type, size and modification time of every
+        file.  Files in the cache with the same size and time are used without asking the server again, and
+        the others are downloaded by up to workers threads, each on its own pooled connection.  Falls back
+        on get_directory if the server does not support MLSD.
+
+        Returns True if all files were retrieved
+        """
+        # Workers start in the login directory - paths are given from there
+        remote_dir = directory if directory[0] == "/" else os.path.join(self.__curdir, directory)
+        try:
+            files = self.__list_tree(directory, patterns=patterns)
+        except ftplib.error_perm as e:
+            if str(e)[:3] in ("500", "502"):
+                logger.info("MLSD not supported by %s - retrieving %s file by file", self.__server, directory)
+                return self.get_directory(directory, output_path)
+            logger.error("Unable to list %s: %s", directory, e)
+            return False
+        except Exception as e:
+            logger.error("Unable to list %s: %s", directory, e)
+            return False
+        if not files:
+            return False
+
+        pending = queue.Queue()
+        pfc = None
+        if self.__cache is not None:
+            pfc = PersistFileCache(self.__cache, max_bytes=self.__cache_max_bytes, ttl=self.__cache_ttl,
+                                   negative_ttl=self.__negative_ttl)
+        for rel_path, facts in files:
+            remote_file = os.path.join(remote_dir, rel_path)
+            file_name = os.path.join(output_path, rel_path)
+            self._setup_output_path(os.path.dirname(file_name))
+            if pfc is not None and pfc.exists(remote_file) and self.__is_cache_current(pfc, remote_file, remote_file, facts)[0] \
+                    and pfc.get_file(remote_file, file_name, symlink=True):
+                logger.debug("Found %s in cache", remote_file)
+                continue
+            pending.put((remote_file, file_name, facts))
+
+        workers = min(workers if workers else self.__mirror_workers, pending.qsize())
+        logger.debug("Mirroring %s - %d of %d files to retrieve", directory, pending.qsize(), len(files))
+        if workers == 0:
+            return True
+
+        def run():
+            grf = GetRemoteFiles(self.__server, cache=self.__cache, site_id=self.__site_id)
+            try:
+                return grf.__mirror_worker(pending)
+            finally:
+                grf.disconnect()
+
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            futures = [executor.submit(run) for _ in range(workers)]
+        return all(future.result() for future in futures)
+
+    def __mirror_worker(self, pending):
+        """Retrieves files from queue pending until empty.  Returns True if all retrieved"""
+        ok = True
+        while True:
+            try:
+                remote_file, file_name, facts = pending.get_nowait()
+            except queue.Empty:
+                return ok
+            if not self.__get_file(remote_file, remote_file, file_name, facts):
+                logger.error("Failed to mirror %s", remote_file)
+                ok = False
+
+    def __list_tree(self, remote_dir, rel_dir="", patterns=None):
+        """Returns list of (path relative to remote_dir, facts) of the files below remote_dir - relative to the
+        server's current directory - matching patterns if given"""
+        subdirs = None
+        if patterns is not None:
+            # Directories that can hold a match
+            subdirs = set()
+            for pattern in patterns:
+                pdir = os.path.dirname(pattern)
+                while pdir:
+                    subdirs.add(pdir)
+                    pdir = os.path.dirname(pdir)
+        files = []
+        for name, facts in self.__mlsd(os.path.join(remote_dir, rel_dir) if rel_dir else remote_dir):
+            ftype = facts.get("type", "").lower()
+            rel_path = os.path.join(rel_dir, name)
+            if ftype == "file":
+                # Skip nfs turds... or any files that start with "."
+                if name[0] == "." and len(name) > 2:
+                    continue
+                if patterns is None or any(fnmatch.fnmatch(rel_path, pattern) for pattern in patterns):
+                    files.append((rel_path, facts))
+            elif ftype == "dir" and (subdirs is None or rel_path in subdirs):
+                files.extend(self.__list_tree(remote_dir, rel_path, patterns))
+        return files
+
     def disconnect(self):
-        """Issues 'QUIT' command to server
+        """Returns the connection to the process wide pool for use by the next entry.  The pool
+        issues 'QUIT' to the server if it already holds enough idle connections.
 
         Note: `quit()` may also raise an exception (see [1])
         It will be ignored by __del__ even if not wrapped by try/except (see [2]), so try/except
@@ -284,7 +665,7 @@ class GetRemoteFiles(object):
         if self._ftp is not None:
             # logger.info("Disconnect %s", self._ftp)
             try:
-                self._ftp.quit()
+                self.__pool.release(self._ftp)
             except:  # noqa: E722,BLE001
                 logger.error("Error trying to close ftp connection")
 
@@ -0,0 +1,89 @@
+##
+# File:  HttpSessionPool.py
+#
+# Process wide pool of keep-alive http sessions
+##
+"""
+ Provides a requests session per process that is shared between all GetRemoteFilesHttp
+ objects, so that TLS handshakes and connections are reused across files and entries.
+
+ The underlying urllib3 connection pools are thread safe.  A new session is created
+ after a fork as sockets cannot be shared between processes.  The sessions are closed when the
+ process exits.
+"""
+import atexit
+import logging
+import os
+import threading
+
+import requests
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+logger = logging.getLogger(__name__)
+
+_pool_lock = threading.Lock()
+_pools = {}
+
+
+class HttpSessionPool(object):
+    def __init__(self, pool_connections=10, pool_maxsize=10, retries=3, backoff_factor=15, status_force_list=None):
+        self.__pool_connections = pool_connections
+        self.__pool_maxsize = pool_maxsize
+        self.__retries = retries
+        self.__backoff_factor = backoff_factor
+        self.__status_force_list = status_force_list
+        self.__session = None
+        self.__pid = None
+        self.__lock = threading.Lock()
+
+    def __new_session(self):
+        """Creates session with retry and keep-alive pooled adapters mounted"""
+        retries = Retry(total=self.__retries, backoff_factor=self.__backoff_factor, status_forcelist=self.__status_force_list, allowed_methods=["GET"])
+        session = requests.Session()
+        for prefix in ['https://', 'http://']:
+            session.mount(prefix, HTTPAdapter(pool_connections=self.__pool_connections,
+                                              pool_maxsize=self.__pool_maxsize,
+                                              max_retries=retries))
+        logger.debug("Created pooled http session for pid %s", os.getpid())
+        return session
+
+    def get_session(self):
+        """Returns the shared session, creating it if needed"""
+        with self.__lock:
+            if self.__session is None or self.__pid != os.getpid():
+                # After fork the inherited session must not be used - do not close its sockets either
+                self.__session = self.__new_session()
+                self.__pid = os.getpid()
+            return self.__session
+
+    def close(self):
+        """Closes the pooled connections"""
+        with self.__lock:
+            if self.__session is not None and self.__pid == os.getpid():
+                self.__session.close()
+            self.__session = None
+            self.__pid = None
+
+
+def get_session_pool(pool_connections=10, pool_maxsize=10, retries=3, backoff_factor=15, status_force_list=None):
+    """Returns the process wide session pool for the given settings"""
+    status_key = tuple(status_force_list) if status_force_list else None
+    key = (pool_connections, pool_maxsize, retries, backoff_factor, status_key)
+    with _pool_lock:
+        pool = _pools.get(key)
+        if pool is None:
+            pool = HttpSessionPool(pool_connections=pool_connections, pool_maxsize=pool_maxsize, retries=retries,
+                                   backoff_factor=backoff_factor, status_force_list=status_force_list)
+            _pools[key] = pool
+        return pool
+
+
+def close_session_pools():
+    """Closes all pooled sessions in this process"""
+    with _pool_lock:
+        for pool in _pools.values():
+            pool.close()
+
+
+atexit.register(close_session_pools)
@@ -0,0 +1,176 @@
+##
+# File:  MirrorSelector.py
+#
+# Choice between archive mirrors
+##
+"""
+ Orders the wwPDB archive mirrors a file can be retrieved from, fastest healthy one first.
+
+ A mirror is a base url ("https://files.wwpdb.org/pub") under which the archive has the same
+ layout as under the primary server.  Each is probed with a HEAD of its base url every
+ probe_interval seconds to measure latency, and the throughput of each completed download is
+ recorded.  Mirrors are ranked by the time expected for a REFERENCE_BYTES transfer.  A mirror
+ that fails is tried last for failure_cooldown seconds.
+
+ Mirrors may lag behind the primary server, so only the primary reporting a file missing is
+ taken as the file not existing, and cached copies are only revalidated against the primary.
+"""
+import logging
+import os
+import threading
+import time
+import urllib.parse
+
+import requests
+
+logger = logging.getLogger(__name__)
+
+# Transfer size used to weigh latency against throughput
+REFERENCE_BYTES = 10 * 1024 * 1024
+# Weight of the newest measurement in the moving averages
+SMOOTHING = 0.3
+
+_selector_lock = threading.Lock()
+_selectors = {}
+
+
+def _average(old, new):
+    return new if old is None else (1 - SMOOTHING) * old + SMOOTHING * new
+
+
+class MirrorSelector(object):
+    def __init__(self, primary, mirrors=None, probe_interval=600, failure_cooldown=300, probe_timeout=10):
+        """primary - base url of the primary server
+           mirrors - other servers as base urls, or host[/prefix] using the scheme and prefix of the primary
+        """
+        self.__primary = primary.rstrip("/")
+        parsed = urllib.parse.urlparse(self.__primary)
+        self.__sites = [self.__primary]
+        for mirror in mirrors or []:
+            mirror = mirror.strip().rstrip("/")
+            if not mirror:
+                continue
+            if "://" not in mirror:
+                host, _sep, prefix = mirror.partition("/")
+                mirror = "%s://%s%s" % (parsed.scheme, host, "/" + prefix if prefix else parsed.path)
+            if mirror not in self.__sites:
+                self.__sites.append(mirror)
+        self.__probe_interval = probe_interval
+        self.__failure_cooldown = failure_cooldown
+        self.__probe_timeout = probe_timeout
+        # Per site - latency in seconds, throughput in bytes/s and time until which it is tried last
+        self.__latency = {}
+        self.__throughput = {}
+        self.__down_until = {}
+        self.__next_probe = 0
+        self.__probing_pid = None
+        self.__lock = threading.Lock()
+
+    @property
+    def sites(self):
+        return list(self.__sites)
+
+    def is_primary(self, site):
+        return site is None or site == self.__primary
+
+    def __split(self, url):
+        """Returns (site, path below site) for url, or (None, url) if not from a known site"""
+        for site in self.__sites:
+            if url == site or url.startswith(site + "/"):
+                return site, url[len(site):]
+        return None, url
+
+    def candidates(self, url):
+        """Returns [(site, url)] to try url from in order.  site is None if url is not from a known site"""
+        site, rest = self.__split(url)
+        if site is None or len(self.__sites) == 1:
+            return [(site, url)]
+        self.__maybe_probe()
+        return [(s, s + rest) for s in self.__ranked()]
+
+    def __ranked(self):
+        now = time.time()
+        with self.__lock:
+            known = [t for t in self.__throughput.values() if t]
+            # Sites without a measurement are assumed as fast as the best, so that they get tried
+            default = max(known) if known else None
+            costs = {}
+            for site in self.__sites:
+                latency = self.__latency.get(site) or 0.0
+                throughput = self.__throughput.get(site) or default
+                cost = latency + (REFERENCE_BYTES / throughput if throughput else 0.0)
+                costs[site] = (self.__down_until.get(site, 0) > now, cost)
+        # Stable sort keeps the configured order between equals
+        return sorted(self.__sites, key=lambda s: costs[s])
+
+    def record_success(self, site, seconds, nbytes):
+        """Records a completed transfer of nbytes from site"""
+        if site is None:
+            return
+        with self.__lock:
+            self.__down_until.pop(site, None)
+            if nbytes > 0 and seconds > 0:
+                self.__throughput[site] = _average(self.__throughput.get(site), nbytes / seconds)
+
+    def record_failure(self, site):
+        """Records that site failed - it is tried last for failure_cooldown seconds"""
+        if site is None:
+            return
+        logger.info("Archive mirror %s failed - tried last for %d seconds", site, self.__failure_cooldown)
+        with self.__lock:
+            self.__down_until[site] = time.time() + self.__failure_cooldown
+
+    def __maybe_probe(self):
+        """Probes the sites if due - in the background, except for the first time"""
+        with self.__lock:
+            if time.time() < self.__next_probe or self.__probing_pid == os.getpid():
+                return
+            first = self.__next_probe == 0
+            self.__next_probe = time.time() + self.__probe_interval
+            self.__probing_pid = os.getpid()
+        if first:
+            self.probe()
+        else:
+            threading.Thread(target=self.probe, name="mirror-probe", daemon=True).start()
+
+    def probe(self):
+        """Measures the latency of each site"""
+        try:
+            threads = [threading.Thread(target=self.__probe_site, args=(site,)) for site in self.__sites]
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+        finally:
+            with self.__lock:
+                self.__probing_pid = None
+
+    def __probe_site(self, site):
+        start = time.time()
+        try:
+            # Not through the pooled session - its retries would hide a slow or failing site
+            r = requests.head(site + "/", timeout=self.__probe_timeout, allow_redirects=True)
+            r.close()
+            ok = r.status_code < 500
+        except Exception as e:
+            logger.debug("Probe of %s failed: %s", site, e)
+            ok = False
+        if not ok:
+            self.record_failure(site)
+            return
+        with self.__lock:
+            self.__latency[site] = _average(self.__latency.get(site), time.time() - start)
+            self.__down_until.pop(site, None)
+        logger.debug("Archive mirror %s latency %.3f", site, self.__latency[site])
+
+
+def get_mirror_selector(primary, mirrors=None, probe_interval=600, failure_cooldown=300):
+    """Returns the process wide selector for the primary server and mirrors"""
+    key = (primary, tuple(mirrors or []))
+    with _selector_lock:
+        selector = _selectors.get(key)
+        if selector is None:
+            selector = MirrorSelector(primary, mirrors=mirrors, probe_interval=probe_interval,
+                                      failure_cooldown=failure_cooldown)
+            _selectors[key] = selector
+        return selector
@@ -2,8 +2,10 @@
 # Note, if local ftp tree is configured, it will use this instead of http protocol
 
 import os
+import functools
 import logging
 from wwpdb.apps.val_rel.config.ValConfig import ValConfig
+from wwpdb.apps.val_rel.utils.AsyncRemoteFiles import AsyncRemoteFiles
 from wwpdb.apps.val_rel.utils.http_protocol.getRemoteFilesHTTP import GetRemoteFilesHttp, setup_local_temp_http, remove_local_temp_http
 from wwpdb.io.locator.ReleaseFileNames import ReleaseFileNames
 from wwpdb.io.locator.localFTPPathInfo import LocalFTPPathInfo
@@ -89,11 +91,19 @@ class getFilesReleaseHttpEMDB(object):
             logger.debug('trying remote HTTP')
             vol_file_name = self.__rf.get_emdb_map(self.__emdb_id)
             url = os.path.join(self.url_prefix, self.__emdb_map_folder(), vol_file_name)
-            temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=self.__emdb_map_folder())
 
-            # Retreve other files that are required for validation
-            self.get_emdb_half_maps()
-            self.get_emdb_masks()
+            # Retrieve other files that are required for validation at the same time
+            engine = self.__get_engine()
+            try:
+                results = engine.gather([engine.run(functools.partial(self.__get_file_from_remote_http, url=url, subfolder=self.__emdb_map_folder()))]
+                                        + [engine.run(self.__get_half_map, half_map) for half_map in self.__half_map_names()]
+                                        + [engine.run(self.get_emdb_masks)])
+            finally:
+                engine.close()
+            for result in results:
+                if isinstance(result, Exception):
+                    logger.error("Failed to retrieve EMDB map files for %s: %s", self.__emdb_id, result)
+            temp_file_path = None if isinstance(results[0], Exception) else results[0]
             if not temp_file_path:
                 remove_local_temp_http(self.__setup_local_temp_http(), require_empty=True)
         else:
@@ -103,29 +113,51 @@ class getFilesReleaseHttpEMDB(object):
         logger.debug('returning: {}'.format(temp_file_path))
         return temp_file_path
 
+    def has_emdb_volume(self):
+        """Returns True if the primary map of the entry exists - without retrieving it"""
+        vol_file_name = self.__rf.get_emdb_map(self.__emdb_id)
+        if self.__local_ftp.get_ftp_emdb():
+            return self.__get_emdb_local_ftp_file(filename=vol_file_name, emdb_path=self.__emdb_map_folder()) is not None
+        if self.__grf is None:
+            self.__grf = GetRemoteFilesHttp(server=self.__server, cache=self.__cache, site_id=self.__site_id)
+        return self.__grf.is_file(os.path.join(self.url_prefix, self.__emdb_map_folder(), vol_file_name))
+
     # Public for testing
     def get_emdb_half_maps(self):
         logger.debug('retrieving half maps')
+        engine = self.__get_engine()
+        try:
+            temp_file_paths = engine.gather([engine.run(self.__get_half_map, half_map) for half_map in self.__half_map_names()])
+        finally:
+            engine.close()
+        for x, temp_file_path in enumerate(temp_file_paths):
+            if isinstance(temp_file_path, Exception):
+                logger.error("Failed to retrieve half map for %s: %s", self.__emdb_id, temp_file_path)
+                temp_file_paths[x] = None
+        return temp_file_paths[0], temp_file_paths[1]
+
+    def __half_map_names(self):
         vol_file_name = self.__rf.get_emdb_map(self.__emdb_id)
         vol_file_name = vol_file_name.replace(".gz", "")
         half_map_name = vol_file_name.replace(".map", "_half_map.map")
         map_1_name = half_map_name.replace("_map", "_map_1")
         map_2_name = half_map_name.replace("_map", "_map_2")
-        half_maps = [map_1_name, map_2_name]
-        temp_file_paths = []
+        return [map_1_name, map_2_name]
+
+    def __get_half_map(self, half_map):
+        url = os.path.join(self.url_prefix, self.__emdb_half_map_folder(), half_map)
+        return self.__get_file_or_gz_from_remote_http(url=url, subfolder=self.__emdb_half_map_folder())
+
+    def __get_engine(self):
+        """Returns AsyncRemoteFiles sharing this object's connections.  Anything created lazily is set up
+        first, as the transfers run in parallel"""
+        self.__setup_local_temp_http()
         if self.__grf is None:
             self.__grf = GetRemoteFilesHttp(server=self.__server, cache=self.__cache, site_id=self.__site_id)
-        for half_map in half_maps:
-            url = os.path.join(self.url_prefix, self.__emdb_half_map_folder(), half_map)
-            temp_file_path = None
-            if self.__grf.is_file(url):
-                temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=self.__emdb_half_map_folder())
-            else:
-                url += ".gz"
-                if self.__grf.is_file(url):
-                    temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=self.__emdb_half_map_folder())
-            temp_file_paths.append(temp_file_path)
-        return temp_file_paths[0], temp_file_paths[1]
+        return AsyncRemoteFiles(cache=self.__cache, site_id=self.__site_id, remote=self.__grf)
+
+    def __get_output_path(self, subfolder):
+        return os.path.join(self.__get_temp_local_ftp_emdb_path(), subfolder)
 
     def get_emdb_masks(self):
         logger.debug('retrieving masks')
@@ -140,13 +172,7 @@ class getFilesReleaseHttpEMDB(object):
         for x in range(1, max_masks + 1):
             mask_file_name = mask_name.replace("_msk", "_msk_%d" % x)
             url = os.path.join(self.url_prefix, self.__emdb_mask_folder(), mask_file_name)
-            temp_file_path = None
-            if self.__grf.is_file(url):
-                temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=self.__emdb_mask_folder())
-            else:
-                url += ".gz"
-                if self.__grf.is_file(url):
-                    temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=self.__emdb_mask_folder())
+            temp_file_path = self.__get_file_or_gz_from_remote_http(url=url, subfolder=self.__emdb_mask_folder())
             if temp_file_path is None:
                 break
             temp_file_paths.append(temp_file_path)
@@ -194,7 +220,7 @@ class getFilesReleaseHttpEMDB(object):
 
         if self.__grf is None:
             self.__grf = GetRemoteFilesHttp(server=self.__server, cache=self.__cache, site_id=self.__site_id)
-        outpath = os.path.join(self.__get_temp_local_ftp_emdb_path(), subfolder)
+        outpath = self.__get_output_path(subfolder)
         ret = self.__grf.get_url(url=url, output_path=outpath)
         logger.debug(ret)
         if ret:
@@ -203,6 +229,13 @@ class getFilesReleaseHttpEMDB(object):
             return self.__get_emdb_local_http_single_file(filename=subfolder_path)
         return None
 
+    def __get_file_or_gz_from_remote_http(self, *, url, subfolder):
+        """Retrieves url, or url.gz if the uncompressed file is not present.  Returns file name or None"""
+        temp_file_path = self.__get_file_from_remote_http(url=url, subfolder=subfolder)
+        if temp_file_path is None:
+            temp_file_path = self.__get_file_from_remote_http(url=url + ".gz", subfolder=subfolder)
+        return temp_file_path
+
     def __get_temp_local_ftp_emdb_path(self):
         return os.path.join(self.__setup_local_temp_http(), self.__emdb_id)
 
@@ -1,17 +1,29 @@
 import requests
-from requests.adapters import HTTPAdapter
 import urllib.parse
-from urllib3.util.retry import Retry, MaxRetryError
+from urllib3.util.retry import MaxRetryError
 import logging
 import os
 import shutil
 import tempfile
+import time
+from wwpdb.apps.val_rel.utils.PartialFile import PartialFile
 from wwpdb.apps.val_rel.utils.PersistFileCache import PersistFileCache
+from wwpdb.apps.val_rel.utils.TransferMetrics import get_transfer_metrics, TIER_CACHE, TIER_REMOTE
+from wwpdb.apps.val_rel.utils.TransferScheduler import TransferScheduler
 from wwpdb.apps.val_rel.config.ValConfig import ValConfig
 from wwpdb.apps.val_rel.utils.emailHandler import EmailHandler
+from wwpdb.apps.val_rel.utils.http_protocol.HttpSessionPool import get_session_pool
+from wwpdb.apps.val_rel.utils.http_protocol.MirrorSelector import get_mirror_selector
 
 logger = logging.getLogger(__name__)
 
+# Download outcome when the server reports the file does not exist
+NOT_FOUND = "not found"
+# Status codes that definitively mean the remote file does not exist
+NOT_FOUND_STATUS = (404, 410)
+# Download outcome when a conditional request finds the cached copy is current
+NOT_MODIFIED = "not modified"
+
 
 def setup_local_temp_http(temp_dir, suffix, session_path):
     if not temp_dir:
@@ -45,6 +57,29 @@ class GetRemoteFilesHttp(object):
         self.__retries = vc.retries
         self.__backoff_factor = vc.backoff_factor
         self.__status_force_list = vc.status_force_list
+        self.__chunk_size = vc.http_chunk_size
+        self.__resume_retries = vc.resume_retries
+        self.__cache_max_bytes = vc.cache_max_bytes
+        self.__cache_ttl = vc.cache_ttl
+        self.__revalidate_interval = vc.cache_revalidate_interval
+        self.__negative_ttl = vc.negative_cache_ttl
+        # Shared keep-alive sessions - reused across files and entries in this process
+        self.__session_pool = get_session_pool(pool_connections=vc.http_pool_connections,
+                                               pool_maxsize=vc.http_pool_maxsize,
+                                               retries=self.__retries,
+                                               backoff_factor=self.__backoff_factor,
+                                               status_force_list=self.__status_force_list)
+        # Files are retrieved from the fastest of the primary server and its mirrors
+        protocol = vc.val_rel_protocol if vc.val_rel_protocol in ["http", "https"] else "https"
+        self.__mirrors = get_mirror_selector("%s://%s%s" % (protocol, vc.http_server, vc.http_prefix),
+                                             mirrors=vc.http_mirrors,
+                                             probe_interval=vc.mirror_probe_interval,
+                                             failure_cooldown=vc.mirror_failure_cooldown)
+        # Limits transfers from each server across the consumers on this node
+        self.__scheduler = TransferScheduler(vc.transfer_lock_dir, max_per_server=vc.transfer_max_per_server,
+                                             small_slots=vc.transfer_small_slots,
+                                             max_bytes_per_second=vc.transfer_max_bytes_per_second)
+        self.__metrics = get_transfer_metrics(site_id)
         self.emailHandler = EmailHandler(site_id)
 
     def get_url(self, *, url=None, output_path=None):
@@ -52,31 +87,46 @@ class GetRemoteFilesHttp(object):
         if not url:
             raise ValueError("url must be specified")
 
-        # Old code would check is_file() - and then get_file. get_file checks cache before download so no need here to check remote if file. If we have it
-        # cached, it is real.
-        self.get_file(url, output_path)
-        return os.path.basename(url)
+        # Old code would check is_file() - and then get_file. get_file checks cache before download, and the GET itself tells us if the
+        # remote file exists.  Returns None if not retrieved
+        if self.get_file(url, output_path):
+            return os.path.basename(url)
+        return None
 
     def is_file(self, remote_file):
-        with requests.Session() as s:
-            try:
-                self.__mount_session_retry(s)
-                r = s.head(remote_file, timeout=self.__timeout, allow_redirects=True)
-                if r.status_code < 400 and r.headers and 'content-length' in r.headers and int(r.headers['content-length']) > 0:
-                    return True
-                return False
-            except Exception as e:
-                logging.error("Failure to get head of file %s %s", remote_file, e)
-                # We re-raise the exception - as there is no other way to handle
-                raise e
+        _site, remote_file = self.__mirrors.candidates(remote_file)[0]
+        s = self.__session_pool.get_session()
+        try:
+            r = s.head(remote_file, timeout=self.__timeout, allow_redirects=True)
+            if r.status_code < 400 and r.headers and 'content-length' in r.headers and int(r.headers['content-length']) > 0:
+                return True
+            return False
+        except Exception as e:
+            logging.error("Failure to get head of file %s %s", remote_file, e)
+            # We re-raise the exception - as there is no other way to handle
+            raise e
 
     def get_file(self, remote_file, output_path):
         """
         get from cache if found
         otherwise, download to temp dir in sessions path
         copy from temp dir to cache
+
+        The GET is the existence check - no HEAD first.  Files reported missing are added to the negative cache.
+        Cached files not checked within the revalidate interval are checked with a conditional GET using
+        their ETag/Last-Modified - the cached copy is used unless the server has a different file.
+        Returns True if the file was retrieved
         """
+        start = time.time()
+        info = {"tier": TIER_REMOTE}
+        ret = self.__get_file(remote_file, output_path, info)
+        self.__metrics.record_transfer(remote_file, info["tier"], nbytes=info.get("bytes", 0), seconds=time.time() - start,
+                                       cache=info.get("cache"), retries=info.get("retries", 0))
+        return ret
 
+    def __get_file(self, remote_file, output_path, info):
+        """As get_file.  info is filled with the tier the file came from, the outcome of the cache lookup,
+        bytes downloaded, retries made and validators of the download"""
         self._setup_output_path(output_path)
 
         # output path = temp dir in sessions path
@@ -86,99 +136,306 @@ class GetRemoteFilesHttp(object):
         logger.debug("Cache is %s", self.__cache)
         if self.__cache is not None:
             # See if in cache
-            pfc = PersistFileCache(self.__cache)
+            pfc = PersistFileCache(self.__cache, max_bytes=self.__cache_max_bytes, ttl=self.__cache_ttl,
+                                   negative_ttl=self.__negative_ttl)
             cache_file_path = os.path.join(self.__cache, urllib.parse.urlparse(remote_file).path)
-            if pfc.exists(cache_file_path):
-                # delete any temp file and replace with sym link from session dir to cache file
-                pfc.get_file(cache_file_path, temp_file_name, symlink=True)
-                logger.debug("Found %s in cache", cache_file_path)
-                return
-            logger.debug("Did not find %s in cache", remote_file)
+            status = pfc.cache_file_status(cache_file_path)
+            conditional = None
+            if status:
+                conditional = self.__get_conditional(pfc, cache_file_path)
+                # replace any temp file with sym link from session dir to cache file
+                if conditional is None and pfc.get_file(cache_file_path, temp_file_name, symlink=True):
+                    logger.debug("Found %s in cache", cache_file_path)
+                    info.update({"tier": TIER_CACHE, "cache": "hit"})
+                    return True
+            if status is False:
+                logger.debug("%s in negative cache", remote_file)
+                info.update({"tier": TIER_CACHE, "cache": "negative"})
+                return False
+            logger.debug("Did not find current %s in cache", remote_file)
+            info["cache"] = "miss"
+        else:
+            conditional = None
+
+        # download to temp dir in sessions path
+        partial_path = pfc.get_partial_path(cache_file_path) if self.__cache is not None else None
+        ret = self.__download(remote_file, temp_file_name, partial_path, info=info, conditional=conditional)
+        if ret is NOT_MODIFIED or (ret is False and conditional is not None):
+            # Unchanged - or server unavailable, so cached copy is the best available
+            info.update({"tier": TIER_CACHE, "cache": "revalidated" if ret is NOT_MODIFIED else "stale"})
+            if ret is NOT_MODIFIED:
+                pfc.mark_validated(cache_file_path)
+            else:
+                logger.warning("Unable to revalidate %s - using cached copy", remote_file)
+            return pfc.get_file(cache_file_path, temp_file_name, symlink=True)
+        if ret is NOT_FOUND:
+            if self.__cache is not None:
+                if conditional is not None:
+                    # Removed from the archive - including any copy linked from the session
+                    pfc.remove_file(cache_file_path)
+                    if os.path.lexists(temp_file_name):
+                        os.unlink(temp_file_name)
+                pfc.add_negative_cache(cache_file_path)
+            return False
+        if ret is True:
+            info["bytes"] = os.path.getsize(temp_file_name)
+        if ret and self.__cache is not None:
+            # move from temp dir to cache and link back.  If not cached the download is kept
+            if pfc.add_file(temp_file_name, cache_file_path, source=remote_file, etag=info.get("etag"),
+                            last_modified=info.get("last_modified"), move=True):
+                ret = pfc.get_file(cache_file_path, temp_file_name, symlink=True)
+                logger.debug("Adding %s to cache", cache_file_path)
+        return ret is True
 
-        if self.is_file(remote_file):
-            # download to temp dir in sessions path
-            if self.httpRequest(remote_file, os.path.join(output_path, temp_file_name)):
-                # copy from temp dir to cache
-                if self.__cache is not None:
-                    pfc.add_file(temp_file_name, cache_file_path)
-                    logger.debug("Adding %s to cache", cache_file_path)
+    def __get_conditional(self, pfc, cache_file_path):
+        """Returns headers to revalidate the cached file with, or None if it is recent enough or cannot be validated"""
+        meta = pfc.get_metadata(cache_file_path)
+        if meta is None:
+            return None
+        if time.time() - meta.get("validated", meta.get("added", 0)) < self.__revalidate_interval:
+            return None
+        headers = {}
+        if meta.get("etag"):
+            headers["If-None-Match"] = meta["etag"]
+        if meta.get("last_modified"):
+            headers["If-Modified-Since"] = meta["last_modified"]
+        return headers if headers else None
 
     def _setup_output_path(self, output_path):
         if not os.path.exists(output_path):
-            os.makedirs(output_path)
+            # May be created by a concurrent transfer at the same time
+            os.makedirs(output_path, exist_ok=True)
 
-    def __mount_session_retry(self, session):
-        """Sets up retry for session"""
-        retries = Retry(total=self.__retries, backoff_factor=self.__backoff_factor, status_forcelist=self.__status_force_list, allowed_methods=["GET"])
-        session.mount('https://', HTTPAdapter(max_retries=retries))
-        session.mount('http://', HTTPAdapter(max_retries=retries))
+    def httpRequest(self, url, outfilepath, partial_path=None):
+        """ download to session directory.
 
-    def httpRequest(self, url, outfilepath):
-        """ download to session directory """
+        Data is received into partial_path (default outfilepath + ".part").  If the transfer is
+        interrupted it is continued with a Range request - here, or by a later call with the same
+        partial_path.
+        """
+        return self.__download(url, outfilepath, partial_path) is True
+
+    def __download(self, url, outfilepath, partial_path=None, info=None, conditional=None):
+        """Returns True on success, NOT_FOUND if the server reports no such file, else False.
+        info if given is filled with the etag and last_modified of the file.
+        conditional are If-None-Match/If-Modified-Since headers of a cached copy - NOT_MODIFIED is returned if the
+        primary server finds it current, and failures are not reported to the admins as the cached copy can be used"""
         logging.info("http request for %s", url)
+        part = self.__acquire_partial(partial_path, outfilepath)
+        if part is None:
+            msg = "Unable to create partial download for %s" % os.path.basename(url)
+            self.handle_exception(msg)
+            return False
+        try:
+            candidates = self.__mirrors.candidates(url)
+            if conditional:
+                # A mirror that has not caught up would confirm an out of date cached copy - only the primary revalidates
+                candidates = [c for c in candidates if self.__mirrors.is_primary(c[0])]
+            for n, (site, site_url) in enumerate(candidates):
+                last = n == len(candidates) - 1
+                start = time.time()
+                offset = part.offset()
+                ret = self.__download_from(site_url, outfilepath, part, info, conditional, quiet=not last)
+                if ret is True:
+                    self.__mirrors.record_success(site, time.time() - start, os.path.getsize(outfilepath) - offset)
+                    if info is not None and not self.__mirrors.is_primary(site):
+                        # A mirror's ETag means nothing to the primary.  Its Last-Modified is kept - a copy older than the
+                        # primary's file is then replaced when revalidated
+                        info["etag"] = None
+                    return ret
+                if ret is NOT_MODIFIED or (ret is NOT_FOUND and self.__mirrors.is_primary(site)):
+                    return ret
+                if ret is not NOT_FOUND:
+                    self.__mirrors.record_failure(site)
+                if not last:
+                    self.__add_retry(info)
+                    logger.warning("Unable to retrieve %s from %s - trying %s", os.path.basename(url), site, candidates[n + 1][0])
+            # Only the primary reporting the file missing is returned above - a mirror without it may not be up to date
+            return False
+        finally:
+            if part.offset() == 0:
+                # Nothing worth resuming
+                part.discard()
+            else:
+                part.release()
+
+    def __download_from(self, url, outfilepath, part, info=None, conditional=None, quiet=False):
+        """Makes the attempts to download url.  Returns as __download.  quiet - failures are not reported to the admins"""
+        with self.__scheduler.transfer(urllib.parse.urlparse(url).netloc, url) as slot:
+            for _attempt in range(self.__resume_retries + 1):
+                ret = self.__request_once(url, outfilepath, part, slot, info, conditional, quiet)
+                if ret is not None:
+                    return ret
+                self.__add_retry(info)
+                logger.warning("Transfer of %s interrupted after %d bytes", os.path.basename(url), part.offset())
+        msg = "Data reading timed out for %s" % os.path.basename(url)
+        self.__failed(msg, quiet or conditional)
+        return False
+
+    @staticmethod
+    def __add_retry(info):
+        if info is not None:
+            info["retries"] = info.get("retries", 0) + 1
+
+    @staticmethod
+    def __acquire_partial(partial_path, outfilepath):
+        """Returns locked PartialFile.  A shared partial_path in use by another process falls back to the session directory"""
+        for path in [partial_path, outfilepath + ".part"]:
+            if path:
+                part = PartialFile(path)
+                if part.acquire():
+                    return part
+        return None
+
+    def __request_once(self, url, outfilepath, part, slot, info=None, conditional=None, quiet=False):
+        """Single GET, resuming from what is in part, made in transfer slot.  Returns True when done, False on failure,
+        NOT_FOUND if the file does not exist, NOT_MODIFIED if conditional headers match
+        and None if interrupted and worth resuming"""
+        quiet = quiet or conditional
         status_code = -1
-        with requests.Session() as s:
-            self.__mount_session_retry(s)
-            try:
-                r = s.get(url, timeout=(self.connection_timeout, self.read_timeout), stream=True, allow_redirects=True)
-            except MaxRetryError as _e:  # noqa: F841
-                msg = "Max retries exceeded for %s" % os.path.basename(url)
-                self.handle_exception(msg)
-                return False
-            except requests.exceptions.ConnectTimeout as _e:  # noqa: F841
-                msg = "Connection timed out for %s" % os.path.basename(url)
-                self.handle_exception(msg)
-                return False
-            except requests.exceptions.ConnectionError as _e:  # noqa: F841
-                msg = "Connection error for %s" % os.path.basename(url)
-                self.handle_exception(msg)
-                return False
-            except requests.exceptions.ReadTimeout as _e:  # noqa: F841
-                msg = "Data reading timed out for %s" % os.path.basename(url)
-                self.handle_exception(msg)
-                return False
-            except requests.exceptions.RequestException as _e:  # noqa: F841
-                msg = "Request for %s failed with status code %d" % (os.path.basename(url), status_code)
-                self.handle_exception(msg)
-                return False
-            except Exception as _e:  # noqa: F841
-                msg = "Request for %s failed with status code %d" % (os.path.basename(url), status_code)
-                self.handle_exception(msg)
-                return False
+        offset = part.offset()
+        validators = part.get_validators()
+        headers = {}
+        if offset > 0 and validators.get("url") == url and validators.get("resumable"):
+            headers["Range"] = "bytes=%d-" % offset
+            # Make sure byte offsets refer to the file and not to a compressed transfer
+            headers["Accept-Encoding"] = "identity"
+            if_range = validators.get("etag") or validators.get("last_modified")
+            if if_range and not if_range.startswith("W/"):
+                headers["If-Range"] = if_range
+            logger.info("Resuming %s from byte %d", os.path.basename(url), offset)
+        else:
+            offset = 0
+            if conditional:
+                headers.update(conditional)
 
-            content_length = None
-            if r is not None:
-                status_code = r.status_code
-                # does not return correct length for text files
-                if r.headers and 'content-length' in r.headers:
-                    content_length = int(r.headers['content-length'])
-                logger.info("%s status code %d", os.path.basename(url), status_code)
-
-            if 0 < status_code < 400:
-                try:
-                    with open(outfilepath, "wb") as w:
-                        w.write(r.content)
-                except requests.exceptions.ReadTimeout as _e:  # noqa: F841
-                    msg = "Data reading timed out for %s" % os.path.basename(url)
-                    self.handle_exception(msg)
-                    if os.path.exists(outfilepath):
-                        os.unlink(outfilepath)
-                    return False
-                filesize = os.path.getsize(outfilepath)
-                if content_length is not None and filesize != content_length:
-                    logger.warning("File size mismatch: %s != %s", filesize, content_length)
-                logger.info("downloaded %s size %d", os.path.basename(url), filesize)
-                return True
-            else:
+        s = self.__session_pool.get_session()
+        try:
+            r = s.get(url, headers=headers, timeout=(self.connection_timeout, self.read_timeout), stream=True, allow_redirects=True)
+        except MaxRetryError as _e:  # noqa: F841
+            msg = "Max retries exceeded for %s" % os.path.basename(url)
+            self.__failed(msg, quiet)
+            return False
+        except requests.exceptions.ConnectTimeout as _e:  # noqa: F841
+            msg = "Connection timed out for %s" % os.path.basename(url)
+            self.__failed(msg, quiet)
+            return False
+        except requests.exceptions.ConnectionError as _e:  # noqa: F841
+            msg = "Connection error for %s" % os.path.basename(url)
+            self.__failed(msg, quiet)
+            return False
+        except requests.exceptions.ReadTimeout as _e:  # noqa: F841
+            return None
+        except requests.exceptions.RequestException as _e:  # noqa: F841
+            msg = "Request for %s failed with status code %d" % (os.path.basename(url), status_code)
+            self.__failed(msg, quiet)
+            return False
+        except Exception as _e:  # noqa: F841
+            msg = "Request for %s failed with status code %d" % (os.path.basename(url), status_code)
+            self.__failed(msg, quiet)
+            return False
+
+        # Closing the response returns the connection to the keep-alive pool
+        with r:
+            status_code = r.status_code
+            logger.info("%s status code %d", os.path.basename(url), status_code)
+
+            if status_code == 416:
+                # Range not satisfiable - partial file does not match remote.  Start again
+                part.start({})
+                return None
+            if status_code == 304 and conditional:
+                return NOT_MODIFIED
+            if status_code in NOT_FOUND_STATUS:
+                # Expected when probing for optional files - not worth an email
+                logger.info("%s not found", url)
+                return NOT_FOUND
+            if not 0 < status_code < 400:
                 msg = "Request for %s failed with status code %d" % (os.path.basename(url), status_code)
-                self.handle_exception(msg)
+                self.__failed(msg, quiet)
                 return False
-        return False
+            if status_code == 206 and self.__content_range_start(r) != offset:
+                part.start({})
+                return None
+            if info is not None:
+                info["etag"] = r.headers.get("etag")
+                info["last_modified"] = r.headers.get("last-modified")
+            if status_code != 206:
+                # Full content - either new transfer, or server ignored Range/If-Range said file changed
+                offset = 0
+                part.start(self.__get_validators(url, r))
+            return self.__stream_to_file(r, url, outfilepath, part, offset, slot)
+
+    @staticmethod
+    def __content_range_start(r):
+        """Returns first byte of a "bytes first-last/total" Content-Range header or None"""
+        crange = r.headers.get("content-range", "")
+        try:
+            return int(crange.split()[1].split("-")[0])
+        except (IndexError, ValueError):
+            return None
+
+    @staticmethod
+    def __get_validators(url, r):
+        """Information needed to safely resume this transfer later"""
+        encoded = r.headers.get('content-encoding', 'identity') != 'identity'
+        return {"url": url,
+                "etag": r.headers.get("etag"),
+                "last_modified": r.headers.get("last-modified"),
+                "resumable": not encoded and r.headers.get("accept-ranges", "bytes") != "none"}
+
+    def __stream_to_file(self, r, url, outfilepath, part, offset, slot):
+        """Appends the body of response r in bounded chunks to part, which is renamed to outfilepath
+        once complete.  Returns True on success, False on failure, None if interrupted"""
+        content_length = None
+        # does not return correct length for text files - which are compressed in transfer
+        if r.headers and 'content-length' in r.headers:
+            content_length = int(r.headers['content-length'])
+        encoded = r.headers.get('content-encoding', 'identity') != 'identity' if r.headers else False
+
+        received = 0
+        try:
+            for chunk in r.iter_content(chunk_size=self.__chunk_size):
+                if not chunk:
+                    continue
+                part.write(chunk)
+                received += len(chunk)
+                slot.consume(len(chunk))
+                if content_length is not None and not encoded and received > content_length:
+                    raise IOError("received more than content-length %d bytes" % content_length)
+        except (requests.exceptions.ReadTimeout, requests.exceptions.ConnectionError, requests.exceptions.ChunkedEncodingError) as _e:  # noqa: F841
+            if encoded:
+                # Received data decoded from a compressed transfer - cannot continue from an offset
+                part.start({})
+            return None
+        except Exception as e:
+            msg = "Failed writing %s: %s" % (os.path.basename(url), e)
+            self.handle_exception(msg)
+            part.start({})
+            return False
+
+        if content_length is not None and received != content_length:
+            if not encoded:
+                # Connection closed early
+                return None
+            logger.warning("File size mismatch: %s != %s", received, content_length)
+
+        part.complete(outfilepath)
+        logger.info("downloaded %s size %d", os.path.basename(url), offset + received)
+        return True
+
+    def __failed(self, msg, quiet=False):
+        """Reports failure - only logged if quiet, such as when a cached copy or another mirror is available"""
+        if quiet:
+            logger.warning(msg)
+        else:
+            self.handle_exception(msg)
 
     def handle_exception(self, msg):
         self.emailHandler.send_email_admins(msg)
         logger.exception(msg)
 
     def disconnect(self):
-        # maintained for backward compatibility with ftp version
+        # maintained for backward compatibility with ftp version.  Pooled sessions are kept
+        # open for reuse by the next entry, and closed when the process exits
         pass
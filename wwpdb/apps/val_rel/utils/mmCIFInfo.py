@@ -1,81 +1,190 @@
+import collections
 import logging
+import os
+import threading
 
 from mmcif.io.IoAdapterCore import IoAdapterCore as IoAdapterCore
 from mmcif.api.PdbxContainers import CifName
 
+from wwpdb.apps.val_rel.utils.CategoryScanner import read_categories
+from wwpdb.apps.val_rel.utils.MetadataCache import get_metadata_cache
 
-logger = logging.getLogger(__name__)
 
+logger = logging.getLogger(__name__)
 
-def is_simple_modification(model_path):
+# Categories the release logic reads from a model file
+METADATA_CATEGORIES = ['exptl', 'pdbx_database_related', 'pdbx_audit_revision_history', 'pdbx_audit_revision_category',
+                       'pdbx_audit_revision_item', 'em_map']
+# Number of model files whose metadata is kept in memory
+METADATA_MEMO_SIZE = 256
+
+_metadata_lock = threading.Lock()
+_metadata_memo = collections.OrderedDict()
+
+
+# Categories whose change alone does not need a new validation report.  database_2 is handled specially
+SKIP_CATEGORIES = frozenset([
+    'citation', 'citation_author', 'pdbx_audit_support', 'pdbx_contact_author',
+    'database_PDB_caveat', 'diffrn', 'diffrn_detector', 'diffrn_radiation', 'diffrn_radiation_wavelength',
+    'diffrn_source', 'entity_name_com', 'entity_src_gen', 'entity_src_nat', 'exptl_crystal', 'exptl_crystal_grow',
+    'pdbx_entity_src_syn', 'pdbx_entry_details', 'pdbx_nmr_chem_shift_experiment',
+    'pdbx_nmr_chem_shift_ref', 'pdbx_nmr_chem_shift_reference', 'pdbx_nmr_chem_shift_software', 'pdbx_nmr_computing',
+    'pdbx_nmr_detail', 'pdbx_nmr_exptl', 'pdbx_nmr_exptl_sample', 'pdbx_nmr_exptl_sample_conditions',
+    'pdbx_nmr_force_constants', 'pdbx_nmr_refine', 'pdbx_nmr_sample_details', 'pdbx_nmr_software_task', 'pdbx_nmr_spectral_dim',
+    'pdbx_nmr_spectral_peak_list', 'pdbx_nmr_spectral_peak_software', 'pdbx_nmr_spectrometer', 'pdbx_nmr_systematic_chem_shift_offset',
+    'pdbx_refine_tls', 'pdbx_refine_tls_group', 'pdbx_struct_assembly', 'pdbx_struct_assembly_auth_evidence',
+    'pdbx_struct_assembly_gen', 'pdbx_struct_assembly_prop', 'pdbx_struct_oper_list', 'pdbx_struct_sheet_hbond',
+    'refine_ls_restr', 'refine_ls_restr_ncs', 'refine_ls_shell', 'reflns_shell', 'struct_conf',
+    'struct_conf_type', 'struct_keywords', 'struct_ncs_dom', 'struct_ncs_dom_lim', 'struct_ncs_ens',
+    'struct_sheet', 'struct_sheet_order', 'struct_sheet_range', 'struct_site', 'pdbx_initial_refinement_model', 'database_2',
+    'chem_comp_atom', 'chem_comp_bond', 'chem_comp_angle', 'pdbx_modification_feature',
+    'pdbx_nonpoly_feature', 'pdbx_nonpoly_atom_feature', 'pdbx_nonpoly_atom_feature_evidence', 'pdbx_nonpoly_feature_evidence',
+    'pdbx_nonpoly_atom_coordination', 'pdbx_nonpoly_atom_coordination_sphere', 'pdbx_nonpoly_atom_coordination_sphere_order'])
+
+# For these categories only changes of the items listed are simple
+SKIP_ATTR = {'database_2': frozenset(['pdbx_DOI', 'pdbx_database_accession'])}
+
+# Values mmCIF uses for a missing or inapplicable item
+NULL_VALUES = frozenset(['.', '?'])
+
+
+def ordinal_key(ordinal):
+    """Returns sort key of a revision ordinal - numeric ordinals compare as numbers, after any others"""
+    try:
+        return 1, int(ordinal)
+    except (TypeError, ValueError):
+        return 0, ordinal
+
+
+def is_simple_change(modified_cats, attrs):
+    """Returns True if a revision changing modified_cats, with attrs the items changed by category, is simple.
+    Returns None if the items of a category checked by item are missing"""
+    cats = frozenset(modified_cats)
+    if not cats or not cats <= SKIP_CATEGORIES:
+        return False
+    # For certain categories - all modified items must be in the allowed list
+    for cat in cats.intersection(SKIP_ATTR):
+        if cat not in attrs:
+            return None
+        if not SKIP_ATTR[cat].issuperset(attrs[cat]):
+            return False
+    return True
+
+
+def is_simple_modification(model_path, site_id=None):
     """if there are only simple changes based the audit - skip calculation of validation report
     (currently, citation, citation_author, pdbx_audit_support, pdbx_initial_refinement_model)
 
     returns True is only simple changes present
     """
-
-    # database_2 is handled specially
-    SKIP_LIST = ['citation', 'citation_author', 'pdbx_audit_support', 'pdbx_contact_author',
-                 'database_PDB_caveat', 'diffrn', 'diffrn_detector', 'diffrn_radiation', 'diffrn_radiation_wavelength',
-                 'diffrn_source', 'entity_name_com', 'entity_src_gen', 'entity_src_nat', 'exptl_crystal', 'exptl_crystal_grow',
-                 'pdbx_audit_support', 'pdbx_contact_author', 'pdbx_entity_src_syn', 'pdbx_entry_details', 'pdbx_nmr_chem_shift_experiment',
-                 'pdbx_nmr_chem_shift_ref', 'pdbx_nmr_chem_shift_reference', 'pdbx_nmr_chem_shift_software', 'pdbx_nmr_computing',
-                 'pdbx_nmr_detail', 'pdbx_nmr_exptl', 'pdbx_nmr_exptl_sample', 'pdbx_nmr_exptl_sample_conditions',
-                 'pdbx_nmr_force_constants', 'pdbx_nmr_refine', 'pdbx_nmr_sample_details', 'pdbx_nmr_software_task', 'pdbx_nmr_spectral_dim',
-                 'pdbx_nmr_spectral_peak_list', 'pdbx_nmr_spectral_peak_software', 'pdbx_nmr_spectrometer', 'pdbx_nmr_systematic_chem_shift_offset',
-                 'pdbx_refine_tls', 'pdbx_refine_tls_group', 'pdbx_struct_assembly', 'pdbx_struct_assembly_auth_evidence',
-                 'pdbx_struct_assembly_gen', 'pdbx_struct_assembly_prop', 'pdbx_struct_oper_list', 'pdbx_struct_sheet_hbond',
-                 'refine_ls_restr', 'refine_ls_restr_ncs', 'refine_ls_shell', 'reflns_shell', 'struct_conf',
-                 'struct_conf_type', 'struct_keywords', 'struct_ncs_dom', 'struct_ncs_dom_lim', 'struct_ncs_ens',
-                 'struct_sheet', 'struct_sheet', 'struct_sheet_order', 'struct_sheet_order', 'struct_sheet_range',
-                 'struct_sheet_range', 'struct_site', 'pdbx_initial_refinement_model', 'database_2',
-                 'chem_comp_atom', 'chem_comp_bond', 'chem_comp_angle', 'pdbx_modification_feature',
-                 'pdbx_nonpoly_feature', 'pdbx_nonpoly_atom_feature', 'pdbx_nonpoly_atom_feature_evidence', 'pdbx_nonpoly_feature_evidence',
-                 'pdbx_nonpoly_atom_coordination', 'pdbx_nonpoly_atom_coordination_sphere', 'pdbx_nonpoly_atom_coordination_sphere_order']
-
-    SKIP_ATTR = {'database_2': ['pdbx_DOI', 'pdbx_database_accession']}
-
-    cf = mmCIFInfo(model_path)
-    modified_cats, latest_ordinal = cf.get_latest_modified_categories()
-    attrs = cf.get_modified_items(latest_ordinal)
-
-    if modified_cats:
-        for item in modified_cats:
-            if item not in SKIP_LIST:
-                return False
-
-            # For certain categories - check specific changes
-            if item in SKIP_ATTR:
-                # Get list of modifications for category item:
-                if item not in attrs:
-                    logger.error("%s audit history messed up", model_path)
-                    return False
-
-                # All modified items in this category must be in allowed list
-                for attr in attrs[item]:
-                    if attr not in SKIP_ATTR[item]:
-                        return False
-
+    metadata = get_model_metadata(model_path, site_id=site_id)
+    modified_cats = metadata.latest_categories
+    ret = is_simple_change(modified_cats, metadata.modified_items)
+    if ret is None:
+        logger.error("%s audit history messed up", model_path)
+        return False
+    if ret:
         logger.debug('%s only a simple modification: %s', model_path, ','.join(modified_cats))
-        return True
-    return False
+    return ret
+
+
+class ModelMetadata(object):
+    """Metadata of a model file used by the release logic - see get_model_metadata()"""
+
+    def __init__(self, exp_methods=None, emdb_id=None, latest_ordinal=None, latest_categories=None, modified_items=None,
+                 contour_level=None):
+        self.exp_methods = exp_methods if exp_methods else []
+        self.emdb_id = emdb_id
+        # Ordinal of the latest revision, the categories it changed and its items by category
+        self.latest_ordinal = latest_ordinal
+        self.latest_categories = latest_categories if latest_categories else []
+        self.modified_items = modified_items if modified_items else {}
+        self.contour_level = contour_level
+
+    def to_dict(self):
+        return {"exp_methods": self.exp_methods,
+                "emdb_id": self.emdb_id,
+                "latest_ordinal": self.latest_ordinal,
+                "latest_categories": self.latest_categories,
+                "modified_items": self.modified_items,
+                "contour_level": self.contour_level}
+
+    @staticmethod
+    def from_dict(d):
+        return ModelMetadata(**d)
+
+
+def extract_model_metadata(model_path):
+    """Returns ModelMetadata of model_path from a single parse of METADATA_CATEGORIES, or None if unreadable.
+    Archive model files have the pdbx_audit_revision categories after the coordinates, so the file is read
+    until all are found rather than stopping at atom_site"""
+    cf = mmCIFInfo(model_path, select_categories=METADATA_CATEGORIES)
+    if cf.parse_mmcif() is None:
+        return None
+    latest_categories, latest_ordinal = cf.get_latest_modified_categories()
+    return ModelMetadata(exp_methods=cf.get_exp_methods(),
+                         emdb_id=cf.get_associated_emdb(),
+                         latest_ordinal=latest_ordinal,
+                         latest_categories=latest_categories,
+                         modified_items=cf.get_modified_items(latest_ordinal),
+                         contour_level=cf.get_em_map_contour_level())
+
+
+def get_model_metadata(model_path, site_id=None):
+    """Returns ModelMetadata of model_path.  Each file is parsed once - the result is reused by all callers
+    in the process, and by other processes through the MetadataCache, until the file changes.
+    An unreadable file gives empty metadata"""
+    try:
+        st = os.stat(model_path)
+    except (OSError, TypeError):
+        logger.error("Unable to read metadata of %s", model_path)
+        return ModelMetadata()
+    key = (os.path.realpath(model_path), st.st_size, st.st_mtime_ns)
+    with _metadata_lock:
+        metadata = _metadata_memo.get(key)
+        if metadata is not None:
+            _metadata_memo.move_to_end(key)
+            return metadata
+
+    cache = get_metadata_cache(site_id)
+    stored = cache.get(model_path) if cache is not None else None
+    if stored is not None:
+        metadata = ModelMetadata.from_dict(stored)
+    else:
+        metadata = extract_model_metadata(model_path)
+        if metadata is None:
+            return ModelMetadata()
+        if cache is not None:
+            cache.put(model_path, metadata.to_dict())
+    with _metadata_lock:
+        _metadata_memo[key] = metadata
+        while len(_metadata_memo) > METADATA_MEMO_SIZE:
+            _metadata_memo.popitem(last=False)
+    return metadata
 
 
 class mmCIFInfo:
     """Class for parsing model file mmCIF file"""
-    def __init__(self, mmCIF_file, IoAdapter=IoAdapterCore()):
+    def __init__(self, mmCIF_file, IoAdapter=IoAdapterCore(), select_categories=None, stop_at=None):
+        """select_categories - only read these categories, streaming the file, otherwise all but the coordinates
+           stop_at - with select_categories, categories the file is not read beyond"""
         self.__mmcif = mmCIF_file
         self.__io = IoAdapter
         self.__mmcif_data = None
 
         self.exclude_category_list = ['atom_site', 'atom_site_anisotrop']
+        self.__select_categories = select_categories
+        self.__stop_at = stop_at
 
     def parse_mmcif(self):
         if self.__mmcif:
             try:
                 logger.debug("parsing %s", self.__mmcif)
-                cList = self.__io.readFile(self.__mmcif, selectList=self.exclude_category_list, excludeFlag=True)
-                self.__mmcif_data = cList[0]
+                if self.__select_categories:
+                    self.__mmcif_data = read_categories(self.__mmcif, self.__select_categories, stop_at=self.__stop_at)
+                else:
+                    cList = self.__io.readFile(self.__mmcif, selectList=self.exclude_category_list, excludeFlag=True)
+                    self.__mmcif_data = cList[0]
                 return self.__mmcif_data
             except Exception as e:
                 logger.error("failed to parse: %s error %s", self.__mmcif, str(e))
@@ -83,7 +192,7 @@ class mmCIFInfo:
         return None
 
     def get_category(self, category):
-        if not self.__mmcif_data:
+        if self.__mmcif_data is None:
             self.parse_mmcif()
         if self.__mmcif_data:
             dcObj = self.__mmcif_data.getObj(category)
@@ -100,45 +209,44 @@ class mmCIFInfo:
         return cat_dict
 
     def get_category_list_of_dictionaries(self, category):
-        return_list = []
-        cat_items = self.get_category_keys(category=category)
-        cat_data = self.get_category(category=category)
-        if cat_data is not None:
-            for row in range(len(cat_data.data)):
-                row_dict = {}
-                for item in cat_items:
-                    value = cat_data.getValueOrDefault(
-                        attributeName=item, defaultValue="", rowIndex=row
-                    )
-                    row_dict[item] = value
-                return_list.append(row_dict)
-        return return_list
+        cat_items = list(self.get_category_keys(category=category))
+        return [dict(zip(cat_items, row)) for row in self.get_category_rows(category, cat_items)]
 
-    def get_cat_item_values(self, category, item):
-        value_list = []
+    def get_category_columns(self, category, items=None, default=""):
+        """Returns dictionary of item name to its values in row order, for items (default all) in category.
+        Items not in the category are left out.  Missing values ('.', '?') are returned as default"""
+        columns = {}
+        cat = self.get_category(category=category)
+        if cat is None:
+            return columns
+        names = cat.getAttributeList()
+        rows = cat.data
+        for index, name in enumerate(names):
+            if items is not None and name not in items:
+                continue
+            columns[name] = [row[index] if index < len(row) and row[index] is not None and row[index] not in NULL_VALUES
+                             else default for row in rows]
+        return columns
+
+    def get_category_rows(self, category, items, default=""):
+        """Returns list of a tuple of the values of items per row of category.  Missing values ('.', '?') and
+        items not in the category are returned as default"""
         cat = self.get_category(category=category)
-        if cat is not None:
-            for row in range(len(cat.data)):
-                value = cat.getValueOrDefault(
-                    attributeName=item, defaultValue="", rowIndex=row
-                )
-                value_list.append(value)
+        if cat is None:
+            return []
+        columns = self.get_category_columns(category, items=items, default=default)
+        nrows = len(cat.data)
+        return list(zip(*[columns.get(item, [default] * nrows) for item in items]))
 
-        return value_list
+    def get_cat_item_values(self, category, item):
+        return [row[0] for row in self.get_category_rows(category, (item,))]
 
     def get_exp_methods(self):
         return self.get_cat_item_values(category="exptl", item="method")
 
     def get_associated_emdb(self):
-        emdb_ids = []
-        ret = self.get_category_list_of_dictionaries(category="pdbx_database_related")
-        if ret:
-            for row in ret:
-                # db_name = row.get("db_name")
-                content_type = row.get("content_type")
-                db_id = row.get("db_id")
-                if content_type == "associated EM volume":
-                    emdb_ids.append(db_id)
+        rows = self.get_category_rows("pdbx_database_related", ("content_type", "db_id"))
+        emdb_ids = [db_id for content_type, db_id in rows if content_type == "associated EM volume"]
         if emdb_ids:
             emdb_id = emdb_ids[0]
             logger.debug('found EMDB ID: {}'.format(emdb_id))
@@ -146,55 +254,38 @@ class mmCIFInfo:
         return None
 
     def get_em_map_contour_level(self):
-        ret = self.get_category_list_of_dictionaries(category="em_map")
-        if ret:
-            for row in ret:
-                contour_level = row.get("contour_level")
-                map_type = row.get("type")
-                if map_type == "primary":
-                    return contour_level
+        for map_type, contour_level in self.get_category_rows("em_map", ("type", "contour_level")):
+            if map_type == "primary":
+                return contour_level
         return None
 
     def get_latest_modified_categories(self):
-        '''Returns the latet modified categories and ordinal associated with it'''
+        '''Returns the latet modified categories and ordinal associated with it.  Ordinals compare as numbers'''
         latest_audit_ordinal = None
         latest_audit_categories = []
-        ret = self.get_category_list_of_dictionaries(category="pdbx_audit_revision_history")
-        if ret:
-            for row in ret:
-                ordinal = row.get('ordinal')
-                if latest_audit_ordinal:
-                    if ordinal > latest_audit_ordinal:
-                        latest_audit_ordinal = ordinal
-                else:
-                    latest_audit_ordinal = ordinal
-        if latest_audit_ordinal:
+        ordinals = [o for o in self.get_cat_item_values(category="pdbx_audit_revision_history", item="ordinal") if o]
+        if ordinals:
+            latest_audit_ordinal = max(ordinals, key=ordinal_key)
             logger.debug('latest audit ordinal: %s', latest_audit_ordinal)
-            ret = self.get_category_list_of_dictionaries(category="pdbx_audit_revision_category")
-            if ret:
-                for row in ret:
-                    revision_ordinal = row.get('revision_ordinal')
-                    category = row.get('category')
-                    if revision_ordinal == latest_audit_ordinal:
-                        latest_audit_categories.append(category)
+            latest_key = ordinal_key(latest_audit_ordinal)
+            cols = self.get_category_columns(category="pdbx_audit_revision_category", items=("revision_ordinal", "category"))
+            if len(cols) == 2:
+                latest_audit_categories = [category for revision_ordinal, category in zip(cols["revision_ordinal"], cols["category"])
+                                           if ordinal_key(revision_ordinal) == latest_key]
 
         return latest_audit_categories, latest_audit_ordinal
 
     def get_modified_items(self, ordinal):
         '''Returns the dictionary of latet modified attributes for ordinal keyed on category name'''
         ret = {}
-        cdata = self.get_category_list_of_dictionaries(category="pdbx_audit_revision_item")
+        cols = self.get_category_columns(category="pdbx_audit_revision_item", items=("revision_ordinal", "item"))
+        if len(cols) < 2 or ordinal is None:
+            return ret
 
+        key = ordinal_key(ordinal)
         cn = CifName()
-        for c in cdata:
-            if "revision_ordinal" in c and "item" in c:
-                if c["revision_ordinal"] == ordinal:
-                    item = c["item"]
-                    cat = cn.categoryPart(item)
-                    iname = cn.attributePart(item)
-
-                    if cat not in ret:
-                        ret[cat] = []
-                    ret[cat].append(iname)
+        for revision_ordinal, item in zip(cols["revision_ordinal"], cols["item"]):
+            if ordinal_key(revision_ordinal) == key:
+                ret.setdefault(cn.categoryPart(item), []).append(cn.attributePart(item))
 
         return ret